@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of the SciPy bundle adjusters on synthetic problems
+
+Builds a synthetic scene with the requested number of 3D points, perturbs
+points and camera translations, and times the Levenberg-Marquardt solve of
+the Schur-complement adjuster (and, for small problems, of the direct
+sparse solver for comparison).
+
+Usage:
+    python benchmarks/benchmark_bundle_adjustment.py --points 100000 1000000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dagsfm.bundle_adjustment import BundleAdjuster, SchurBundleAdjuster
+from dagsfm.sub_model import SubModel
+
+
+def synthetic_problem(num_points, num_images, observations_per_point, noise, seed=0):
+    """
+    Cameras on a ring looking at a cloud of points, every point seen by a random subset of cameras
+
+    Args:
+        num_points (int): Number of 3D points
+        num_images (int): Number of cameras
+        observations_per_point (int): Track length of every point
+        noise (float): Standard deviation of the perturbation of points and camera translations
+        seed (int): Random seed
+
+    Returns:
+        SubModel: Perturbed model whose observations are exact projections of the unperturbed one
+    """
+    rng = np.random.default_rng(seed)
+    angles = 2 * np.pi * np.arange(num_images) / num_images
+    centers = np.stack([20 * np.cos(angles), 20 * np.sin(angles), np.ones(num_images)], axis=1)
+    forward = -centers / np.linalg.norm(centers, axis=1, keepdims=True)
+    right = np.cross(forward, [0, 0, 1.0])
+    right /= np.linalg.norm(right, axis=1, keepdims=True)
+    rotations = np.stack([right, np.cross(forward, right), forward], axis=1)
+    translations = -np.einsum('nij,nj->ni', rotations, centers)
+    camera_params = np.tile([1000.0, 960.0, 540.0], (num_images, 1))
+    points = rng.uniform(-5, 5, size=(num_points, 3))
+
+    # Each point is observed by consecutive cameras around a random start, like a local track
+    starts = rng.integers(0, num_images, size=num_points)
+    track_image = ((starts[:, None] + np.arange(observations_per_point)) % num_images).ravel()
+    track_point = np.repeat(np.arange(num_points), observations_per_point)
+    order = np.lexsort((track_point, track_image))
+    track_point2D = np.empty(len(order), dtype=np.int64)
+    track_point2D[order] = np.arange(len(order)) - np.searchsorted(track_image[order], track_image[order])
+
+    model = SubModel([f"image_{index}.jpg" for index in range(num_images)], rotations, translations,
+                     camera_params, points, track_point=track_point, track_image=track_image,
+                     track_point2D=track_point2D, track_xy=np.zeros((len(track_point), 2)))
+    cam = np.einsum('tij,tj->ti', rotations[track_image], points[track_point]) + translations[track_image]
+    model.track_xy = camera_params[track_image, :1] * cam[:, :2] / cam[:, 2:] + camera_params[track_image, 1:]
+
+    model.points_xyz = points + rng.normal(scale=noise, size=points.shape)
+    model.translations = translations + np.vstack([np.zeros((1, 3)),
+                                                   rng.normal(scale=noise, size=(num_images - 1, 3))])
+    return model
+
+
+def run(adjuster, model):
+    start = time.perf_counter()
+    statistics = adjuster.adjust(model, fixed_images=[0])
+    return time.perf_counter() - start, statistics
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the SciPy bundle adjusters")
+    parser.add_argument("--points", type=int, nargs="+", default=[100000, 1000000], help="Point counts to benchmark")
+    parser.add_argument("--images", type=int, default=200, help="Number of cameras")
+    parser.add_argument("--track_length", type=int, default=4, help="Observations per point")
+    parser.add_argument("--iterations", type=int, default=5, help="Levenberg-Marquardt iterations")
+    parser.add_argument("--noise", type=float, default=0.01, help="Perturbation of points and translations")
+    parser.add_argument("--direct_limit", type=int, default=20000,
+                        help="Largest point count also solved with the direct sparse solver")
+    args = parser.parse_args(argv)
+
+    print(f"{'points':>10} {'observations':>13} {'solver':>8} {'seconds':>9} {'initial cost':>14} "
+          f"{'final cost':>12} {'CG iters':>9}")
+    for num_points in args.points:
+        solvers = [('schur', SchurBundleAdjuster(max_iterations=args.iterations))]
+        if num_points <= args.direct_limit:
+            solvers.append(('direct', BundleAdjuster(max_iterations=args.iterations)))
+        for name, adjuster in solvers:
+            model = synthetic_problem(num_points, args.images, args.track_length, args.noise)
+            seconds, statistics = run(adjuster, model)
+            cg_iterations = sum(getattr(adjuster, 'cg_iterations', [])) or '-'
+            print(f"{num_points:>10} {model.num_observations:>13} {name:>8} {seconds:>9.2f} "
+                  f"{statistics['initial_cost']:>14.4g} {statistics['final_cost']:>12.4g} {cg_iterations:>9}")
+
+
+if __name__ == '__main__':
+    main()
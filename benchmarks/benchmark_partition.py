@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of the N-cut partitioner on synthetic databases
+
+For every requested layout and image count a synthetic COLMAP-schema
+database is generated, then the partitioner stages are timed one by one
+with the peak Python heap allocation of each stage (tracemalloc, which also
+sees NumPy buffers). The results are written as JSON so that successive
+runs can be compared.
+
+Usage:
+    python benchmarks/benchmark_partition.py --images 1000 10000 --layouts grid buildings \
+        --engine sparse --method multilevel --report partition_report.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # resource is only available on POSIX systems
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dagsfm.partition import NcutPartitioner
+from synthetic_database import LAYOUTS, generate_database
+
+
+def measure(func):
+    """
+    Run func, returning its result, the elapsed seconds and the peak traced allocation in MB
+    """
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    return result, seconds, max(0, peak - baseline) / 2**20
+
+
+def benchmark_database(database_path, output_directory, k, engine, dense_limit, verbose=False, method='spectral'):
+    """
+    Time the partitioner stages on one database
+
+    The dense similarity matrix is only built up to dense_limit images; above
+    it the stage is timed with the sparse matrix.
+
+    Returns:
+        dict: stage name -> {'seconds', 'peak_mb'} plus the resulting cluster sizes
+    """
+    partitioner = NcutPartitioner(database_path)
+    partitioner.config['ncut_engine'] = engine
+    partitioner.config['partition_method'] = method
+    stages = {}
+
+    def record(name, func):
+        # The partitioner reports its progress on stdout, which is only shown with --verbose
+        with contextlib.redirect_stdout(sys.stdout if verbose else io.StringIO()):
+            result, seconds, peak_mb = measure(func)
+        stages[name] = {'seconds': round(seconds, 4), 'peak_mb': round(peak_mb, 2)}
+        return result
+
+    record('load_database', partitioner.load_database)
+    # The multilevel method only ever uses the sparse matrix
+    if partitioner.graph.num_nodes <= dense_limit and method == 'spectral':
+        record('compute_similarity_matrix', partitioner.compute_similarity_matrix)
+    else:
+        record('compute_sparse_similarity_matrix', partitioner.compute_sparse_similarity_matrix)
+    clusters = record('normalized_cut', lambda: partitioner.normalized_cut(k))
+    expanded = record('expand_partitions', lambda: partitioner.expand_partitions(clusters))
+    partitioner.expanded_clusters = expanded
+    record('save_submodel_image_lists', lambda: partitioner.save_submodel_image_lists(output_directory))
+
+    sizes = sorted((len(images) for images in expanded.values()), reverse=True)
+    return {'stages': stages, 'num_clusters': len(expanded), 'cluster_sizes': sizes,
+            'num_edges': int(partitioner.graph.num_edges)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the N-cut partitioner on synthetic databases")
+    parser.add_argument("--images", type=int, nargs="+", default=[1000, 10000], help="Image counts to benchmark")
+    parser.add_argument("--layouts", choices=LAYOUTS, nargs="+", default=list(LAYOUTS), help="Camera layouts")
+    parser.add_argument("--mean_degree", type=float, default=12, help="Target mean number of matched neighbours")
+    parser.add_argument("--k", type=int, default=8, help="Number of N-cut clusters")
+    parser.add_argument("--engine", choices=("dense", "sparse"), default="sparse", help="N-cut engine")
+    parser.add_argument("--method", choices=("spectral", "multilevel"), default="spectral",
+                        help="Partitioning method")
+    parser.add_argument("--dense_limit", type=int, default=20000,
+                        help="Largest image count for which the dense similarity matrix is built")
+    parser.add_argument("--work_directory", default=None, help="Where databases are generated, a temporary "
+                                                                 "directory by default")
+    parser.add_argument("--report", default="partition_benchmark.json", help="JSON report path")
+    parser.add_argument("--verbose", action="store_true", help="Show the partitioner output")
+    args = parser.parse_args(argv)
+
+    report = {'environment': {'python': platform.python_version(), 'numpy': np.__version__,
+                              'platform': platform.platform(), 'cpu_count': os.cpu_count()},
+              'parameters': {'k': args.k, 'engine': args.engine, 'method': args.method,
+                             'mean_degree': args.mean_degree},
+              'runs': []}
+    with tempfile.TemporaryDirectory(dir=args.work_directory) as work_directory:
+        tracemalloc.start()
+        for layout in args.layouts:
+            for num_images in args.images:
+                database_path = os.path.join(work_directory, f"{layout}_{num_images}.db")
+                generation, seconds, _ = measure(
+                    lambda: generate_database(database_path, num_images, layout, args.mean_degree))
+                run = {'layout': layout, 'generation_seconds': round(seconds, 4), **generation}
+                run.update(benchmark_database(database_path, os.path.join(work_directory, "lists"),
+                                              args.k, args.engine, args.dense_limit, args.verbose, args.method))
+                if resource is not None:
+                    run['max_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+                report['runs'].append(run)
+                os.remove(database_path)
+
+                timings = " ".join(f"{name}={stage['seconds']:.2f}s/{stage['peak_mb']:.0f}MB"
+                                   for name, stage in run['stages'].items())
+                print(f"{layout:>10} {num_images:>8} images {run['num_pairs']:>9} pairs  {timings}")
+        tracemalloc.stop()
+
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.report}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+End-to-end benchmark of DAGSfMPipeline with a synthetic backend
+
+The COLMAP-backed components are replaced by stand-ins with controllable
+runtimes, so scheduling and merging changes can be compared without running
+COLMAP for hours:
+
+    extractor      writes a synthetic database (benchmarks/synthetic_database.py)
+    matcher        keeps the verified pairs of that database
+    reconstructor  writes the cluster's part of a synthetic world as a SubModel .npz,
+                   in a random similarity frame and with noise, so that the real
+                   merging and bundle adjustment have work to do
+
+Partitioning, merging and bundle adjustment are the real implementations.
+The report lists the wall time of every pipeline node, the utilisation of
+the reconstruction worker processes, the critical path through the task
+graph and the peak RSS of the driver and of the worker processes.
+
+Usage:
+    python benchmarks/benchmark_pipeline.py --images 2000 --layout corridor --ncut_k 8 \
+        --reconstruction_workers 4 --mapper_seconds_per_image 0.01 --report pipeline_report.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import re
+import sys
+import tempfile
+import time
+
+import numpy as np
+import yaml
+from scipy.spatial import cKDTree
+
+try:
+    import resource
+except ImportError:  # resource is only available on POSIX systems
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dagsfm.features import FeatureMatcher
+from dagsfm.pipeline import DAGSfMPipeline
+from dagsfm.reconstruction import SubReconstructor
+from dagsfm.sub_model import SubModel
+from synthetic_database import LAYOUTS, camera_positions, generate_database
+
+# Name pattern of the images written by generate_database
+IMAGE_NAME = re.compile(r"image_(\d+)\.jpg$")
+
+
+def simulate_work(seconds, busy=False):
+    """
+    Take the given time, either sleeping or spinning on the CPU
+
+    Spinning models CPU-bound COLMAP work competing for cores, sleeping models
+    work that leaves the cores free (e.g. GPU feature extraction).
+    """
+    if seconds <= 0:
+        return
+    if not busy:
+        time.sleep(seconds)
+        return
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def synthetic_world(num_images, layout, seed=0, points_per_image=20, height=5.0, visibility_radius=2.0):
+    """
+    Ground points seen by downward-looking cameras at the positions of a synthetic database
+
+    The camera positions are those of generate_database with the same seed, so
+    image id i of the database is camera i - 1 of the world. Keypoint indices
+    are numbered per image over the whole world, which keeps them consistent
+    between overlapping sub-models.
+
+    Returns:
+        dict: centers (N, 3), points (M, 3) and the observations (image, point, point2D)
+    """
+    rng = np.random.default_rng(seed)
+    positions = camera_positions(num_images, layout, rng)
+    centers = np.column_stack([positions, np.full(num_images, height)])
+    points_rng = np.random.default_rng(seed + 1)
+    anchors = np.repeat(positions, points_per_image, axis=0)
+    ground = anchors + points_rng.normal(scale=visibility_radius / 2, size=anchors.shape)
+    points = np.column_stack([ground, points_rng.normal(scale=0.2, size=len(ground))])
+
+    visible = cKDTree(positions).query_ball_point(ground, r=visibility_radius)
+    counts = np.fromiter((len(images) for images in visible), dtype=np.int64, count=len(visible))
+    obs_point = np.repeat(np.arange(len(points)), counts)
+    obs_image = np.fromiter((image for images in visible for image in images), dtype=np.int64,
+                            count=int(counts.sum()))
+    order = np.lexsort((obs_point, obs_image))
+    obs_image, obs_point = obs_image[order], obs_point[order]
+    starts = np.searchsorted(obs_image, np.arange(num_images))
+    obs_point2D = np.arange(len(obs_image)) - starts[obs_image]
+    return {'centers': centers, 'points': points, 'image': obs_image, 'point': obs_point,
+            'point2D': obs_point2D}
+
+
+class SyntheticExtractor:
+    """Extractor writing a synthetic database instead of running COLMAP"""
+
+    def __init__(self, num_images, layout='grid', mean_degree=12, seed=0, seconds_per_image=0.0, busy=False):
+        self.feature_cfg = {'num_images': num_images, 'layout': layout, 'mean_degree': mean_degree, 'seed': seed}
+        self.seconds_per_image = seconds_per_image
+        self.busy = busy
+
+    def extract_features(self, image_path, database_path):
+        cfg = self.feature_cfg
+        generate_database(database_path, cfg['num_images'], cfg['layout'], cfg['mean_degree'], cfg['seed'])
+        simulate_work(cfg['num_images'] * self.seconds_per_image, self.busy)
+        return database_path
+
+
+class SyntheticMatcher(FeatureMatcher):
+    """Matcher keeping the verified pairs of the synthetic database"""
+
+    def __init__(self, num_images, seconds_per_pair=0.0, busy=False):
+        super().__init__()
+        self.num_images = num_images
+        self.seconds_per_pair = seconds_per_pair
+        self.busy = busy
+
+    def exhaustive_matcher(self, database_path):
+        simulate_work(self.num_images * (self.num_images - 1) / 2 * self.seconds_per_pair, self.busy)
+        return database_path
+
+
+class SyntheticReconstructor(SubReconstructor):
+    """
+    Reconstructor writing the cluster's part of the synthetic world as a SubModel
+
+    Runs in the pipeline's worker processes; the world is built once per process.
+    """
+
+    def __init__(self, num_images, layout='grid', seed=0, seconds_per_image=0.0, busy=False,
+                 points_per_image=20, noise=0.01):
+        super().__init__(use_pycolmap=False)
+        self.num_images = num_images
+        self.layout = layout
+        self.seed = seed
+        self.seconds_per_image = seconds_per_image
+        self.busy = busy
+        self.points_per_image = points_per_image
+        self.noise = noise
+        self._world = None
+
+    def __getstate__(self):
+        # The world is rebuilt in the worker instead of being pickled with every job
+        state = self.__dict__.copy()
+        state['_world'] = None
+        return state
+
+    def world(self):
+        if self._world is None:
+            self._world = synthetic_world(self.num_images, self.layout, self.seed, self.points_per_image)
+        return self._world
+
+    def reconstruct_partition(self, partition, image_directory, database_path, output_directory):
+        started = time.time()
+        world = self.world()
+        names = sorted(partition)
+        indices = np.array([int(IMAGE_NAME.search(name).group(1)) - 1 for name in names], dtype=np.int64)
+        simulate_work(len(names) * self.seconds_per_image, self.busy)
+
+        local_image = np.full(len(world['centers']), -1)
+        local_image[indices] = np.arange(len(indices))
+        mask = local_image[world['image']] >= 0
+        # Points seen by a single image of the cluster would not be triangulated
+        point_ids, track_point, counts = np.unique(world['point'][mask], return_inverse=True, return_counts=True)
+        keep = (counts >= 2)[track_point]
+        point_ids, track_point = np.unique(world['point'][mask][keep], return_inverse=True)
+        track_image = local_image[world['image'][mask][keep]]
+        track_point2D = world['point2D'][mask][keep]
+
+        # Downward-looking cameras: x right, y back, z down
+        rotations = np.tile(np.diag([1.0, -1.0, -1.0]), (len(indices), 1, 1))
+        translations = -np.einsum('nij,nj->ni', rotations, world['centers'][indices])
+        camera_params = np.tile([500.0, 320.0, 240.0], (len(indices), 1))
+        points = world['points'][point_ids]
+        cam = np.einsum('nij,nj->ni', rotations[track_image], points[track_point]) + translations[track_image]
+        track_xy = camera_params[track_image, :1] * cam[:, :2] / cam[:, 2:] + camera_params[track_image, 1:]
+
+        rng = np.random.default_rng([self.seed, len(names), int(indices[0]) if len(indices) else 0])
+        model = SubModel(names, rotations, translations, camera_params,
+                         points + rng.normal(scale=self.noise, size=points.shape),
+                         track_point=track_point, track_image=track_image, track_point2D=track_point2D,
+                         track_xy=track_xy)
+        # Every cluster comes out in its own gauge, as from an independent mapper run
+        angle = rng.uniform(0, 2 * np.pi)
+        rotation = np.array([[np.cos(angle), -np.sin(angle), 0.0], [np.sin(angle), np.cos(angle), 0.0],
+                             [0.0, 0.0, 1.0]])
+        model.transform(rng.uniform(0.5, 2.0), rotation, rng.normal(scale=10.0, size=3))
+
+        os.makedirs(output_directory, exist_ok=True)
+        model_path = os.path.join(output_directory, "model.npz")
+        model.save(model_path)
+        with open(os.path.join(output_directory, "timing.json"), 'w') as f:
+            json.dump({'started': started, 'finished': time.time(), 'pid': os.getpid()}, f)
+        return model_path
+
+
+def critical_path(nodes):
+    """
+    Longest chain of dependent nodes, weighted by their wall time
+
+    Args:
+        nodes (dict): name -> PipelineNode of an executed task graph
+
+    Returns:
+        tuple: (list of node names, total seconds)
+    """
+    finish, previous = {}, {}
+
+    def longest(name):
+        if name not in finish:
+            node = nodes[name]
+            best = max(node.dependencies, key=longest, default=None)
+            previous[name] = best
+            finish[name] = (finish[best] if best is not None else 0.0) + node.finished_at - node.started_at
+        return finish[name]
+
+    if not nodes:
+        return [], 0.0
+    end = max(nodes, key=longest)
+    path = []
+    name = end
+    while name is not None:
+        path.append(name)
+        name = previous[name]
+    return path[::-1], finish[end]
+
+
+def worker_utilisation(intervals, num_workers):
+    """
+    Busy fraction of a worker pool over the span of its jobs
+
+    Args:
+        intervals (list): (start, end) times of the jobs
+        num_workers (int): Number of workers in the pool
+
+    Returns:
+        dict: span_seconds, busy_seconds, utilisation and max_concurrency
+    """
+    if not intervals:
+        return {'span_seconds': 0.0, 'busy_seconds': 0.0, 'utilisation': 0.0, 'max_concurrency': 0}
+    span = max(end for _, end in intervals) - min(start for start, _ in intervals)
+    busy = sum(end - start for start, end in intervals)
+    events = sorted([(start, 1) for start, _ in intervals] + [(end, -1) for _, end in intervals])
+    concurrency = max_concurrency = 0
+    for _, change in events:
+        concurrency += change
+        max_concurrency = max(max_concurrency, concurrency)
+    return {'span_seconds': round(span, 4), 'busy_seconds': round(busy, 4),
+            'utilisation': round(busy / (num_workers * span), 4) if span > 0 else 0.0,
+            'max_concurrency': max_concurrency}
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process and of its finished children in MB, None without resource
+    """
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 2**20 if sys.platform == 'darwin' else 2**10
+    return {'driver': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+            'workers': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1)}
+
+
+def benchmark_pipeline(args, work_directory):
+    """
+    Run the pipeline once with the synthetic backend
+
+    Returns:
+        dict: Per-node timings, reconstruction utilisation, critical path and peak RSS
+    """
+    config = {'ncut_k': args.ncut_k, 'ncut_engine': 'sparse', 'expansion_ratio': args.expansion_ratio,
+              'num_workers': args.num_workers, 'reconstruction_workers': args.reconstruction_workers,
+              'merge_workers': args.merge_workers, 'ba_mode': args.ba_mode, 'ba_backend': args.ba_backend,
+              'ba_iterations': args.ba_iterations,
+              'max_retries': 0}
+    config_path = os.path.join(work_directory, "config.yaml")
+    with open(config_path, 'w') as f:
+        yaml.safe_dump(config, f)
+
+    pipeline = DAGSfMPipeline(config_path)
+    pipeline.extractor = SyntheticExtractor(args.images, args.layout, args.mean_degree, args.seed,
+                                            args.extract_seconds_per_image, args.busy)
+    pipeline.matcher = SyntheticMatcher(args.images, args.match_seconds_per_pair, args.busy)
+    pipeline.reconstructor = SyntheticReconstructor(args.images, args.layout, args.seed,
+                                                    args.mapper_seconds_per_image, args.busy,
+                                                    args.points_per_image, args.noise)
+    pipeline.scheduler.reconstructor = pipeline.reconstructor
+
+    # The pipeline reports its progress on stdout, which is only shown with --verbose
+    start = time.perf_counter()
+    clock_offset = time.time() - start
+    with contextlib.redirect_stdout(sys.stdout if args.verbose else io.StringIO()):
+        pipeline.run(os.path.join(work_directory, "images"), os.path.join(work_directory, "output"), resume=False)
+    wall_seconds = time.perf_counter() - start
+
+    nodes = pipeline.graph.nodes
+    model = SubModel.read(nodes['merge'].result) if nodes['merge'].result is not None else None
+    stages = {name: {'start': round(node.started_at - start, 4),
+                     'seconds': round(node.finished_at - node.started_at, 4), 'worker': node.worker}
+              for name, node in sorted(nodes.items(), key=lambda item: item[1].started_at)}
+    path, path_seconds = critical_path(nodes)
+
+    # Mapper intervals as measured inside the worker processes, on the driver's clock
+    intervals = []
+    for name in pipeline._cluster_nodes:
+        with open(os.path.join(os.path.dirname(nodes[name].result), "timing.json")) as f:
+            timing = json.load(f)
+        intervals.append((timing['started'] - clock_offset, timing['finished'] - clock_offset))
+
+    return {'wall_seconds': round(wall_seconds, 4), 'stages': stages,
+            'num_clusters': len(pipeline._cluster_nodes),
+            'cluster_sizes': sorted((len(images) for images in nodes['partition'].result['image_names'].values()),
+                                    reverse=True),
+            'merged_images': model.num_images if model is not None else 0,
+            'reconstruction_workers': pipeline.scheduler.num_workers,
+            'reconstruction': worker_utilisation(intervals, pipeline.scheduler.num_workers),
+            'critical_path': path, 'critical_path_seconds': round(path_seconds, 4),
+            'parallel_efficiency': round(path_seconds / wall_seconds, 4) if wall_seconds > 0 else 0.0,
+            'peak_rss_mb': peak_rss_mb()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark DAGSfMPipeline with a synthetic COLMAP backend")
+    parser.add_argument("--images", type=int, default=1000, help="Number of images")
+    parser.add_argument("--layout", choices=LAYOUTS, default='grid',
+                        help="Camera layout; the buildings of 'buildings' are separate scenes that cannot be merged")
+    parser.add_argument("--mean_degree", type=float, default=12, help="Target mean number of matched neighbours")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--extract_seconds_per_image", type=float, default=0.0, help="Simulated extraction time")
+    parser.add_argument("--match_seconds_per_pair", type=float, default=0.0, help="Simulated matching time")
+    parser.add_argument("--mapper_seconds_per_image", type=float, default=0.01, help="Simulated mapper time")
+    parser.add_argument("--busy", action="store_true", help="Spin the CPU instead of sleeping for simulated work")
+    parser.add_argument("--points_per_image", type=int, default=20, help="Synthetic 3D points per image")
+    parser.add_argument("--noise", type=float, default=0.01, help="Noise added to the sub-model points")
+    parser.add_argument("--ncut_k", type=int, default=8, help="Number of N-cut clusters")
+    parser.add_argument("--expansion_ratio", type=float, default=0.2, help="Cluster expansion ratio")
+    parser.add_argument("--num_workers", type=int, default=None, help="Pipeline nodes running at once")
+    parser.add_argument("--reconstruction_workers", type=int, default=None, help="Mapper worker processes")
+    parser.add_argument("--merge_workers", type=int, default=None, help="Merging workers")
+    parser.add_argument("--ba_mode", default='global', help="Bundle adjustment mode of the merger")
+    parser.add_argument("--ba_backend", default='auto', help="Bundle adjustment backend of the merger")
+    parser.add_argument("--ba_iterations", type=int, default=5, help="Bundle adjustment iterations")
+    parser.add_argument("--work_directory", default=None, help="Where the run directory is created, a temporary "
+                                                                 "directory by default")
+    parser.add_argument("--report", default="pipeline_benchmark.json", help="JSON report path")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline output")
+    args = parser.parse_args(argv)
+
+    report = {'environment': {'python': platform.python_version(), 'numpy': np.__version__,
+                              'platform': platform.platform(), 'cpu_count': os.cpu_count()},
+              'parameters': vars(args)}
+    with tempfile.TemporaryDirectory(dir=args.work_directory) as work_directory:
+        report.update(benchmark_pipeline(args, work_directory))
+
+    for name, stage in report['stages'].items():
+        print(f"{name:>20} {stage['start']:>9.3f}s +{stage['seconds']:.3f}s  {stage['worker']}")
+    reconstruction = report['reconstruction']
+    print(f"wall {report['wall_seconds']:.2f}s, critical path {report['critical_path_seconds']:.2f}s "
+          f"({' -> '.join(report['critical_path'])})")
+    print(f"{report['num_clusters']} clusters, mapper utilisation {reconstruction['utilisation']:.0%} of "
+          f"{report['reconstruction_workers']} workers (max {reconstruction['max_concurrency']} at once), "
+          f"peak RSS {report['peak_rss_mb']}")
+
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.report}")
+
+
+if __name__ == '__main__':
+    main()
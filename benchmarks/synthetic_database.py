@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Synthetic COLMAP-schema databases for benchmarks
+
+Cameras are laid out on the ground plane following one of several scene
+layouts and every image is connected to a heavy-tailed (log-normal) number
+of its nearest neighbours, with inlier counts decaying with distance. Only
+the tables and columns read by the view graph and the partitioner are
+filled: images, cameras, keypoint counts and verified pairs (blobs are NULL).
+
+Usage:
+    python benchmarks/synthetic_database.py database.db --images 100000 --layout buildings
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dagsfm.database import image_ids_to_pair_ids
+
+LAYOUTS = ('grid', 'corridor', 'buildings')
+
+SCHEMA = """
+    CREATE TABLE cameras (camera_id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, model INTEGER NOT NULL,
+                          width INTEGER NOT NULL, height INTEGER NOT NULL, params BLOB,
+                          prior_focal_length INTEGER NOT NULL);
+    CREATE TABLE images (image_id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+                         name TEXT NOT NULL UNIQUE, camera_id INTEGER NOT NULL);
+    CREATE TABLE keypoints (image_id INTEGER PRIMARY KEY NOT NULL, rows INTEGER NOT NULL,
+                            cols INTEGER NOT NULL, data BLOB);
+    CREATE TABLE descriptors (image_id INTEGER PRIMARY KEY NOT NULL, rows INTEGER NOT NULL,
+                              cols INTEGER NOT NULL, data BLOB);
+    CREATE TABLE matches (pair_id INTEGER PRIMARY KEY NOT NULL, rows INTEGER NOT NULL,
+                          cols INTEGER NOT NULL, data BLOB);
+    CREATE TABLE two_view_geometries (pair_id INTEGER PRIMARY KEY NOT NULL, rows INTEGER NOT NULL,
+                                      cols INTEGER NOT NULL, data BLOB, config INTEGER NOT NULL,
+                                      F BLOB, E BLOB, H BLOB, qvec BLOB, tvec BLOB);
+"""
+
+
+def camera_positions(num_images, layout, rng):
+    """
+    Ground-plane camera positions with unit mean spacing between neighbouring cameras
+
+    Args:
+        num_images (int): Number of cameras
+        layout (str): "grid" (aerial survey), "corridor" (street sequence) or
+            "buildings" (rings of cameras around separate buildings)
+        rng (np.random.Generator): Random generator
+
+    Returns:
+        np.ndarray: (num_images, 2) positions
+    """
+    if layout == 'grid':
+        side = int(np.ceil(np.sqrt(num_images)))
+        index = np.arange(num_images)
+        positions = np.stack([index % side, index // side], axis=1).astype(np.float64)
+    elif layout == 'corridor':
+        # A long street with a few parallel lanes, slightly winding
+        index = np.arange(num_images)
+        along = index / 3.0
+        positions = np.stack([along, (index % 3) * 0.5 + np.sin(along / 50.0) * 5.0], axis=1)
+    elif layout == 'buildings':
+        # Buildings of a few hundred images, separated by open space
+        num_buildings = max(1, num_images // 300)
+        building = rng.integers(0, num_buildings, size=num_images)
+        side = int(np.ceil(np.sqrt(num_buildings)))
+        centers = np.stack([np.arange(num_buildings) % side, np.arange(num_buildings) // side], axis=1) * 60.0
+        counts = np.bincount(building, minlength=num_buildings)
+        radius = np.maximum(counts / (2 * np.pi), 1.0)[building]
+        angle = rng.uniform(0, 2 * np.pi, size=num_images)
+        positions = centers[building] + radius[:, None] * np.stack([np.cos(angle), np.sin(angle)], axis=1)
+    else:
+        raise ValueError(f"Unknown layout: {layout}")
+    return positions + rng.normal(scale=0.1, size=positions.shape)
+
+
+def synthetic_edges(positions, mean_degree, rng, max_degree=64, chunk_size=100000):
+    """
+    Heavy-tailed k-nearest-neighbour view graph
+
+    Every image is linked to a log-normally distributed number of its nearest
+    neighbours, so most images have a moderate degree and a few hubs have
+    many matches, as in real collections.
+
+    Args:
+        positions (np.ndarray): (N, 2) camera positions
+        mean_degree (float): Target mean number of neighbours per image
+        rng (np.random.Generator): Random generator
+        max_degree (int): Largest number of neighbours per image
+        chunk_size (int): Number of images queried at once
+
+    Returns:
+        tuple: (image_ids1, image_ids2, inlier_counts) int64 arrays, ids starting at 1, ids1 < ids2
+    """
+    num_images = len(positions)
+    max_degree = min(max_degree, num_images - 1)
+    if max_degree <= 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty.copy(), empty.copy()
+    tree = cKDTree(positions)
+    degrees = np.clip(rng.lognormal(np.log(mean_degree / 2), 0.6, size=num_images).round().astype(np.int64),
+                      1, max_degree)
+
+    src_chunks, dst_chunks, distance_chunks = [], [], []
+    for start in range(0, num_images, chunk_size):
+        stop = min(start + chunk_size, num_images)
+        distances, neighbors = tree.query(positions[start:stop], k=max_degree + 1)
+        # Column 0 is the image itself
+        keep = np.arange(1, max_degree + 1)[None, :] <= degrees[start:stop, None]
+        rows = np.broadcast_to(np.arange(start, stop)[:, None], keep.shape)
+        src_chunks.append(rows[keep])
+        dst_chunks.append(neighbors[:, 1:][keep])
+        distance_chunks.append(distances[:, 1:][keep])
+
+    src = np.concatenate(src_chunks)
+    dst = np.concatenate(dst_chunks)
+    distances = np.concatenate(distance_chunks)
+    pairs = np.sort(np.stack([src, dst], axis=1), axis=1)
+    pairs, first = np.unique(pairs, axis=0, return_index=True)
+    distances = distances[first]
+    inliers = np.maximum(15, 400 * np.exp(-distances / 2.0) * rng.uniform(0.5, 1.5, size=len(pairs)))
+    return pairs[:, 0] + 1, pairs[:, 1] + 1, inliers.astype(np.int64)
+
+
+def generate_database(database_path, num_images, layout='grid', mean_degree=12, seed=0, chunk_size=100000):
+    """
+    Write a synthetic COLMAP-schema database
+
+    Args:
+        database_path (str): Path of the database to create (overwritten)
+        num_images (int): Number of images
+        layout (str): One of LAYOUTS
+        mean_degree (float): Target mean number of neighbours per image
+        seed (int): Random seed
+        chunk_size (int): Number of rows inserted per executemany call
+
+    Returns:
+        dict: num_images, num_pairs, mean_degree and max_degree of the generated view graph
+    """
+    rng = np.random.default_rng(seed)
+    positions = camera_positions(num_images, layout, rng)
+    image_ids1, image_ids2, inliers = synthetic_edges(positions, mean_degree, rng)
+    pair_ids = image_ids_to_pair_ids(image_ids1, image_ids2)
+    keypoints = rng.integers(2000, 8192, size=num_images)
+
+    if os.path.exists(database_path):
+        os.remove(database_path)
+    connection = sqlite3.connect(database_path)
+    connection.execute("PRAGMA journal_mode=OFF")
+    connection.execute("PRAGMA synchronous=OFF")
+    connection.executescript(SCHEMA)
+    connection.execute("INSERT INTO cameras VALUES (1, 0, 1920, 1080, NULL, 0)")
+    for start in range(0, num_images, chunk_size):
+        ids = range(start + 1, min(start + chunk_size, num_images) + 1)
+        connection.executemany("INSERT INTO images VALUES (?, ?, 1)",
+                               ((image_id, f"image_{image_id:07d}.jpg") for image_id in ids))
+        connection.executemany("INSERT INTO keypoints VALUES (?, ?, 6, NULL)",
+                               ((image_id, int(keypoints[image_id - 1])) for image_id in ids))
+    for start in range(0, len(pair_ids), chunk_size):
+        rows = zip(pair_ids[start:start + chunk_size].tolist(), inliers[start:start + chunk_size].tolist())
+        connection.executemany("INSERT INTO two_view_geometries (pair_id, rows, cols, data, config) "
+                               "VALUES (?, ?, 2, NULL, 2)", rows)
+    connection.commit()
+    connection.close()
+
+    degrees = np.bincount(np.concatenate([image_ids1, image_ids2]), minlength=num_images + 1)[1:]
+    return {'num_images': num_images, 'num_pairs': len(pair_ids),
+            'mean_degree': float(degrees.mean()) if num_images else 0.0,
+            'max_degree': int(degrees.max()) if num_images else 0}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic COLMAP-schema database")
+    parser.add_argument("database_path", help="Database file to create")
+    parser.add_argument("--images", type=int, default=10000, help="Number of images")
+    parser.add_argument("--layout", choices=LAYOUTS, default='grid', help="Camera layout")
+    parser.add_argument("--mean_degree", type=float, default=12, help="Target mean number of matched neighbours")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args(argv)
+    statistics = generate_database(args.database_path, args.images, args.layout, args.mean_degree, args.seed)
+    print(statistics)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,398 @@
+"""
+Bundle adjustment module for DAGSfM-Python
+
+Residuals and Jacobians of all observations of a SubModel are evaluated in
+single array operations; the Levenberg-Marquardt solver works on the
+block structure of the normal equations (6x6 camera blocks, 3x3 point
+blocks and one 6x3 coupling block per observation).
+"""
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.linalg import LinearOperator, cg, spsolve
+from scipy.spatial.transform import Rotation
+
+
+def reprojection_residuals(model):
+    """
+    Reprojection residuals of all observations of a model
+
+    Args:
+        model (SubModel): Model with pinhole camera parameters (focal, cx, cy)
+
+    Returns:
+        np.ndarray: (T, 2) projected minus observed image coordinates
+    """
+    rotations = model.rotations[model.track_image]
+    points = np.einsum('tij,tj->ti', rotations, model.points_xyz[model.track_point]) \
+        + model.translations[model.track_image]
+    params = model.camera_params[model.track_image]
+    return params[:, :1] * points[:, :2] / points[:, 2:] + params[:, 1:] - model.track_xy
+
+
+def reprojection_jacobians(model):
+    """
+    Reprojection residuals and their Jacobians for all observations
+
+    Camera updates are left perturbations R <- exp(w) R, t <- t + dt with
+    the 6 parameters ordered (w, dt); point updates are additive.
+
+    Args:
+        model (SubModel): Model with pinhole camera parameters (focal, cx, cy)
+
+    Returns:
+        tuple: (residuals (T, 2), camera Jacobians (T, 2, 6), point Jacobians (T, 2, 3))
+    """
+    rotations = model.rotations[model.track_image]
+    rotated = np.einsum('tij,tj->ti', rotations, model.points_xyz[model.track_point])
+    points = rotated + model.translations[model.track_image]
+    params = model.camera_params[model.track_image]
+    inverse_depth = 1.0 / points[:, 2]
+    focal = params[:, 0]
+    residuals = params[:, :1] * points[:, :2] * inverse_depth[:, None] + params[:, 1:] - model.track_xy
+
+    # Derivative of the projection with respect to the point in camera coordinates
+    d_projection = np.zeros((len(points), 2, 3))
+    d_projection[:, 0, 0] = focal * inverse_depth
+    d_projection[:, 1, 1] = focal * inverse_depth
+    d_projection[:, :, 2] = -focal[:, None] * points[:, :2] * (inverse_depth ** 2)[:, None]
+
+    # d(exp(w) R X)/dw = -[R X]_x
+    negative_skew = np.zeros((len(points), 3, 3))
+    negative_skew[:, 0, 1], negative_skew[:, 0, 2] = rotated[:, 2], -rotated[:, 1]
+    negative_skew[:, 1, 0], negative_skew[:, 1, 2] = -rotated[:, 2], rotated[:, 0]
+    negative_skew[:, 2, 0], negative_skew[:, 2, 1] = rotated[:, 1], -rotated[:, 0]
+
+    camera_jacobians = np.concatenate([d_projection @ negative_skew, d_projection], axis=2)
+    point_jacobians = d_projection @ rotations
+    return residuals, camera_jacobians, point_jacobians
+
+
+def camera_tangents(rotations, translations, reference_rotations, reference_translations):
+    """
+    Camera poses as 6-vectors (w, dt) relative to reference poses, the inverse of apply_camera_updates
+
+    Returns:
+        np.ndarray: (N, 6) tangent vectors
+    """
+    rotation_vectors = Rotation.from_matrix(rotations @ np.transpose(reference_rotations, (0, 2, 1))).as_rotvec()
+    return np.concatenate([rotation_vectors, translations - reference_translations], axis=1)
+
+
+def apply_camera_updates(rotations, translations, updates):
+    """
+    Apply (w, dt) camera updates as left perturbations
+
+    Returns:
+        tuple: (rotations (N, 3, 3), translations (N, 3))
+    """
+    return Rotation.from_rotvec(updates[:, :3]).as_matrix() @ rotations, translations + updates[:, 3:]
+
+
+def accumulate_blocks(indices, values, size):
+    """
+    Sum per-observation blocks into per-camera or per-point blocks
+
+    Args:
+        indices (np.ndarray): (T,) target index of every block
+        values (np.ndarray): (T, ...) blocks
+        size (int): Number of targets
+
+    Returns:
+        np.ndarray: (size, ...) summed blocks
+    """
+    block_shape = values.shape[1:]
+    block_size = int(np.prod(block_shape))
+    flat_indices = (np.asarray(indices, dtype=np.int64)[:, None] * block_size + np.arange(block_size)).ravel()
+    sums = np.bincount(flat_indices, weights=values.reshape(-1), minlength=size * block_size)
+    return sums.reshape((size,) + block_shape)
+
+
+class BundleAdjuster:
+    """
+    Levenberg-Marquardt bundle adjustment of camera poses and 3D points of a SubModel
+
+    Intrinsics are kept fixed. Quadratic priors can pull cameras and points
+    towards target values, which is how consensus terms of a distributed
+    adjustment are expressed.
+    """
+
+    def __init__(self, max_iterations=20, initial_damping=1e-4, function_tolerance=1e-8, chunk_size=500000):
+        """
+        Initialize the bundle adjuster
+
+        Args:
+            max_iterations (int): Maximum number of Levenberg-Marquardt iterations
+            initial_damping (float): Initial relative damping of the normal equations
+            function_tolerance (float): Stop when an accepted step reduces the cost by less than this fraction
+            chunk_size (int): Observations per chunk when accumulating the normal equations,
+                bounds the size of the per-observation temporaries
+        """
+        self.max_iterations = max_iterations
+        self.initial_damping = initial_damping
+        self.function_tolerance = function_tolerance
+        self.chunk_size = chunk_size
+
+    def adjust(self, model, fixed_images=(), camera_priors=None, point_priors=None):
+        """
+        Refine camera poses and 3D points of a model in place
+
+        Args:
+            model (SubModel): Model to adjust
+            fixed_images (iterable): Indices of images whose poses stay fixed
+            camera_priors (dict): Optional quadratic camera priors with keys indices (k,),
+                rotations (k, 3, 3) and translations (k, 3) of the reference poses,
+                targets (k, 6) tangent vectors relative to the references, and weight
+            point_priors (dict): Optional quadratic point priors with keys indices (k,),
+                targets (k, 3) and weight
+
+        Returns:
+            dict: initial_cost, final_cost, iterations and num_observations
+        """
+        fixed = np.zeros(model.num_images, dtype=bool)
+        fixed[list(fixed_images)] = True
+        damping = self.initial_damping
+
+        residuals, camera_jacobians, point_jacobians = reprojection_jacobians(model)
+        prior_terms = self._prior_terms(model, camera_priors, point_priors)
+        cost = self._cost(residuals, prior_terms)
+        initial_cost = cost
+        iterations = 0
+        for iterations in range(1, self.max_iterations + 1):
+            blocks = self._normal_equations(model, residuals, camera_jacobians, point_jacobians, prior_terms, fixed)
+            camera_updates, point_updates = self._solve_step(model, blocks, damping)
+
+            rotations, translations = model.rotations, model.translations
+            points_xyz = model.points_xyz
+            model.rotations, model.translations = apply_camera_updates(rotations, translations, camera_updates)
+            model.points_xyz = points_xyz + point_updates
+            candidate_prior_terms = self._prior_terms(model, camera_priors, point_priors)
+            candidate_cost = self._cost(reprojection_residuals(model), candidate_prior_terms)
+
+            if np.isfinite(candidate_cost) and candidate_cost < cost:
+                converged = (cost - candidate_cost) < self.function_tolerance * cost
+                cost = candidate_cost
+                prior_terms = candidate_prior_terms
+                damping = max(damping / 10, 1e-12)
+                if converged:
+                    break
+                residuals, camera_jacobians, point_jacobians = reprojection_jacobians(model)
+            else:
+                model.rotations, model.translations, model.points_xyz = rotations, translations, points_xyz
+                damping *= 10
+                if damping > 1e8:
+                    break
+
+        return {'initial_cost': initial_cost, 'final_cost': cost, 'iterations': iterations,
+                'num_observations': model.num_observations}
+
+    def _solve_step(self, model, blocks, damping):
+        """
+        Solve the damped normal equations for the camera and point updates
+
+        Args:
+            model (SubModel): Model being adjusted
+            blocks (dict): Output of _normal_equations
+            damping (float): Relative Levenberg-Marquardt damping
+
+        Returns:
+            tuple: (camera updates (N, 6), point updates (M, 3))
+        """
+        camera_hessian, point_hessian = self._damped_diagonal_blocks(blocks, damping)
+        num_cameras, num_points = model.num_images, model.num_points
+        num_camera_params = 6 * num_cameras
+
+        camera_block_rows = (6 * np.arange(num_cameras))[:, None, None] + np.arange(6)[None, :, None]
+        point_block_rows = num_camera_params + (3 * np.arange(num_points))[:, None, None] + np.arange(3)[None, :, None]
+        coupling_rows = (6 * blocks['coupling_cameras'])[:, None, None] + np.arange(6)[None, :, None]
+        coupling_cols = num_camera_params + (3 * blocks['coupling_points'])[:, None, None] + np.arange(3)[None, None, :]
+
+        rows = [np.broadcast_to(camera_block_rows, camera_hessian.shape),
+                np.broadcast_to(point_block_rows, point_hessian.shape),
+                np.broadcast_to(coupling_rows, blocks['coupling'].shape),
+                np.broadcast_to(coupling_cols, blocks['coupling'].shape).transpose(0, 2, 1)]
+        cols = [np.broadcast_to(np.transpose(camera_block_rows, (0, 2, 1)), camera_hessian.shape),
+                np.broadcast_to(np.transpose(point_block_rows, (0, 2, 1)), point_hessian.shape),
+                np.broadcast_to(coupling_cols, blocks['coupling'].shape),
+                np.broadcast_to(coupling_rows, blocks['coupling'].shape).transpose(0, 2, 1)]
+        data = [camera_hessian, point_hessian, blocks['coupling'], np.transpose(blocks['coupling'], (0, 2, 1))]
+        size = num_camera_params + 3 * num_points
+        hessian = sp.csc_matrix((np.concatenate([d.ravel() for d in data]),
+                                 (np.concatenate([r.ravel() for r in rows]), np.concatenate([c.ravel() for c in cols]))),
+                                shape=(size, size))
+        gradient = np.concatenate([blocks['camera_gradient'].ravel(), blocks['point_gradient'].ravel()])
+        step = -spsolve(hessian, gradient)
+        return step[:num_camera_params].reshape(-1, 6), step[num_camera_params:].reshape(-1, 3)
+
+    @staticmethod
+    def _damped_diagonal_blocks(blocks, damping):
+        """
+        Camera and point diagonal blocks with Marquardt damping added to their diagonals
+        """
+        camera_hessian = blocks['camera_hessian'].copy()
+        point_hessian = blocks['point_hessian'].copy()
+        for hessian in (camera_hessian, point_hessian):
+            diagonal = np.einsum('nii->ni', hessian)
+            diagonal += damping * diagonal + 1e-12
+        return camera_hessian, point_hessian
+
+    def _normal_equations(self, model, residuals, camera_jacobians, point_jacobians, prior_terms, fixed):
+        """
+        Blocks of the Gauss-Newton normal equations J^T J dx = -J^T r
+
+        Returns:
+            dict: camera_hessian (N, 6, 6), point_hessian (M, 3, 3), coupling (T, 6, 3)
+                with coupling_cameras/coupling_points indices, camera_gradient (N, 6)
+                and point_gradient (M, 3)
+        """
+        camera_hessian = np.zeros((model.num_images, 6, 6))
+        point_hessian = np.zeros((model.num_points, 3, 3))
+        camera_gradient = np.zeros((model.num_images, 6))
+        point_gradient = np.zeros((model.num_points, 3))
+        coupling = np.empty((model.num_observations, 6, 3))
+        for start in range(0, model.num_observations, self.chunk_size):
+            chunk = slice(start, start + self.chunk_size)
+            images, points = model.track_image[chunk], model.track_point[chunk]
+            camera_jacobian = camera_jacobians[chunk] * ~fixed[images, None, None]
+            point_jacobian = point_jacobians[chunk]
+            camera_jacobian_t = np.transpose(camera_jacobian, (0, 2, 1))
+            point_jacobian_t = np.transpose(point_jacobian, (0, 2, 1))
+            camera_hessian += accumulate_blocks(images, camera_jacobian_t @ camera_jacobian, model.num_images)
+            point_hessian += accumulate_blocks(points, point_jacobian_t @ point_jacobian, model.num_points)
+            camera_gradient += accumulate_blocks(
+                images, np.einsum('tki,tk->ti', camera_jacobian, residuals[chunk]), model.num_images)
+            point_gradient += accumulate_blocks(
+                points, np.einsum('tki,tk->ti', point_jacobian, residuals[chunk]), model.num_points)
+            coupling[chunk] = camera_jacobian_t @ point_jacobian
+
+        camera_prior, point_prior = prior_terms
+        if camera_prior is not None:
+            indices, weight, values = camera_prior
+            np.einsum('nii->ni', camera_hessian)[indices] += weight
+            camera_gradient[indices] += weight * values
+        if point_prior is not None:
+            indices, weight, values = point_prior
+            np.einsum('nii->ni', point_hessian)[indices] += weight
+            point_gradient[indices] += weight * values
+
+        # Fixed cameras get an identity block and no gradient, so their update is zero
+        camera_hessian[fixed] = np.eye(6)
+        camera_gradient[fixed] = 0
+
+        return {'camera_hessian': camera_hessian, 'point_hessian': point_hessian,
+                'coupling': coupling,
+                'coupling_cameras': model.track_image, 'coupling_points': model.track_point,
+                'camera_gradient': camera_gradient, 'point_gradient': point_gradient}
+
+    @staticmethod
+    def _prior_terms(model, camera_priors, point_priors):
+        """
+        (indices, weight, residual values) of the camera and point priors at the current state
+        """
+        camera_prior = point_prior = None
+        if camera_priors is not None and len(camera_priors['indices']):
+            indices = np.asarray(camera_priors['indices'])
+            tangents = camera_tangents(model.rotations[indices], model.translations[indices],
+                                       camera_priors['rotations'], camera_priors['translations'])
+            camera_prior = (indices, camera_priors['weight'], tangents - camera_priors['targets'])
+        if point_priors is not None and len(point_priors['indices']):
+            indices = np.asarray(point_priors['indices'])
+            point_prior = (indices, point_priors['weight'], model.points_xyz[indices] - point_priors['targets'])
+        return camera_prior, point_prior
+
+    @staticmethod
+    def _cost(residuals, prior_terms):
+        """
+        Half the sum of squared reprojection residuals plus the weighted prior terms
+        """
+        cost = 0.5 * np.sum(residuals ** 2)
+        for prior in prior_terms:
+            if prior is not None:
+                _, weight, values = prior
+                cost += 0.5 * weight * np.sum(values ** 2)
+        return cost
+
+
+class SchurBundleAdjuster(BundleAdjuster):
+    """
+    Bundle adjuster solving the Levenberg-Marquardt steps on the reduced camera system
+
+    The 3x3 point blocks are eliminated with the Schur complement
+    S = C - B P^-1 B^T, which only couples cameras observing common points,
+    and S dx_c = -(g_c - B P^-1 g_p) is solved by conjugate gradients with a
+    block-Jacobi preconditioner. Points are then recovered by back
+    substitution, so no factorisation of the full system is ever formed.
+    """
+
+    def __init__(self, max_iterations=20, initial_damping=1e-4, function_tolerance=1e-8, chunk_size=500000,
+                 cg_tolerance=1e-6, cg_max_iterations=None):
+        """
+        Initialize the bundle adjuster
+
+        Args:
+            max_iterations (int): Maximum number of Levenberg-Marquardt iterations
+            initial_damping (float): Initial relative damping of the normal equations
+            function_tolerance (float): Stop when an accepted step reduces the cost by less than this fraction
+            chunk_size (int): Observations per chunk when accumulating the normal equations
+            cg_tolerance (float): Relative residual at which conjugate gradients stop
+            cg_max_iterations (int): Maximum conjugate gradient iterations per step, defaults to SciPy's choice
+        """
+        super().__init__(max_iterations, initial_damping, function_tolerance, chunk_size)
+        self.cg_tolerance = cg_tolerance
+        self.cg_max_iterations = cg_max_iterations
+        self.cg_iterations = []  # conjugate gradient iterations of every solved step
+
+    def _solve_step(self, model, blocks, damping):
+        """
+        Solve the damped normal equations through the reduced camera system
+
+        Args:
+            model (SubModel): Model being adjusted
+            blocks (dict): Output of _normal_equations
+            damping (float): Relative Levenberg-Marquardt damping
+
+        Returns:
+            tuple: (camera updates (N, 6), point updates (M, 3))
+        """
+        camera_hessian, point_hessian = self._damped_diagonal_blocks(blocks, damping)
+        num_cameras, num_points = model.num_images, model.num_points
+        point_inverse = np.linalg.inv(point_hessian)
+
+        # B: 6N x 3M block-sparse coupling matrix with one 6x3 block per observation, rows grouped by camera;
+        # V = B P^-1 has the same sparsity, so neither needs a general sparse product
+        order = np.argsort(blocks['coupling_cameras'], kind='stable')
+        block_points = blocks['coupling_points'][order]
+        block_rows = np.searchsorted(blocks['coupling_cameras'][order], np.arange(num_cameras + 1))
+        coupling_blocks = blocks['coupling'][order]
+        scaled_blocks = coupling_blocks @ point_inverse[block_points]
+        shape = (6 * num_cameras, 3 * num_points)
+        coupling = sp.bsr_matrix((coupling_blocks, block_points, block_rows), shape=shape)
+        coupling_point_inverse = sp.bsr_matrix((scaled_blocks, block_points, block_rows), shape=shape)
+        block_diagonal = np.arange(num_cameras + 1)
+        camera_matrix = sp.bsr_matrix((camera_hessian, block_diagonal[:-1], block_diagonal),
+                                      shape=(6 * num_cameras, 6 * num_cameras))
+
+        schur = (camera_matrix - coupling_point_inverse @ coupling.T).tocsr()
+        point_gradient = blocks['point_gradient'].ravel()
+        rhs = -(blocks['camera_gradient'].ravel() - coupling_point_inverse @ point_gradient)
+
+        # Block-Jacobi preconditioner: the 6x6 diagonal blocks of S
+        contributions = scaled_blocks @ np.transpose(coupling_blocks, (0, 2, 1))
+        diagonal_blocks = camera_hessian - accumulate_blocks(blocks['coupling_cameras'][order], contributions,
+                                                             num_cameras)
+        preconditioner_blocks = np.linalg.inv(diagonal_blocks)
+        preconditioner = LinearOperator(
+            schur.shape, matvec=lambda x: np.einsum('nij,nj->ni', preconditioner_blocks, x.reshape(-1, 6)).ravel())
+
+        iterations = [0]
+
+        def count_iteration(_):
+            iterations[0] += 1
+
+        camera_step, _ = cg(schur, rhs, rtol=self.cg_tolerance, maxiter=self.cg_max_iterations,
+                            M=preconditioner, callback=count_iteration)
+        self.cg_iterations.append(iterations[0])
+
+        point_step = -np.einsum('mij,mj->mi', point_inverse,
+                                (point_gradient + coupling.T @ camera_step).reshape(-1, 3))
+        return camera_step.reshape(-1, 6), point_step
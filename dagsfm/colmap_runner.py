@@ -0,0 +1,228 @@
+"""
+COLMAP command runner for DAGSfM-Python
+
+Every COLMAP command line call of the package goes through ColmapRunner:
+commands are run as argv lists (no shell), at most num_workers at a time,
+with an optional per-command timeout and retries. stdout is streamed and
+parsed into progress and throughput metrics (images/s, pairs/s).
+"""
+
+import re
+import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from dagsfm.tracing import tracer
+
+
+# Progress lines printed by COLMAP, mapped to the unit they count
+PROGRESS_PATTERNS = {
+    'feature_extractor': ('images', re.compile(r"Processed file \[(\d+)/(\d+)\]")),
+    'exhaustive_matcher': ('blocks', re.compile(r"Matching block \[(\d+)/(\d+), (\d+)/(\d+)\]")),
+    'spatial_matcher': ('images', re.compile(r"Matching image \[(\d+)/(\d+)\]")),
+    'matches_importer': ('blocks', re.compile(r"Matching block \[(\d+)/(\d+)\]")),
+    'mapper': ('images', re.compile(r"Registering image #\d+ \((\d+)\)")),
+}
+
+# Units of the work size callers may pass for commands whose output does not count it
+WORK_UNITS = {
+    'exhaustive_matcher': 'pairs',
+    'spatial_matcher': 'pairs',
+    'matches_importer': 'pairs',
+    'database_merger': 'databases',
+}
+
+
+class ColmapRunner:
+    """
+    Runs COLMAP sub-commands with a bounded number of concurrent processes
+    """
+
+    def __init__(self, colmap_path="colmap", num_workers=None, timeout=None, retries=0,
+                 progress_callback=None, log_lines=50):
+        """
+        Initialize the runner
+
+        Args:
+            colmap_path (str or list): Path to the COLMAP executable, or an argv prefix
+                such as [sys.executable, "fake_colmap.py"]
+            num_workers (int): Maximum number of COLMAP processes running at once, None for no limit
+            timeout (float): Seconds after which a command is killed, None for no limit
+            retries (int): Number of times a failed or timed-out command is run again
+            progress_callback (callable): Called as callback(subcommand, unit, done, total) on progress lines
+            log_lines (int): Number of trailing output lines kept for error messages
+        """
+        self.colmap_path = colmap_path
+        self.num_workers = num_workers
+        self.timeout = timeout
+        self.retries = retries
+        self.progress_callback = progress_callback
+        self.log_lines = log_lines
+        self.history = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(num_workers) if num_workers else None
+
+    def __getstate__(self):
+        # Runners travel to worker processes with their reconstructor; locks cannot be pickled
+        state = self.__dict__.copy()
+        del state['_lock'], state['_slots']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.num_workers) if self.num_workers else None
+
+    def command(self, subcommand, options=None):
+        """
+        argv list of a COLMAP sub-command
+
+        Args:
+            subcommand (str): COLMAP sub-command, e.g. "feature_extractor"
+            options (dict): Option name -> value, passed as --name=value
+
+        Returns:
+            list: Command line arguments
+        """
+        prefix = [self.colmap_path] if isinstance(self.colmap_path, str) else list(self.colmap_path)
+        return prefix + [subcommand] + [f"--{key}={value}" for key, value in (options or {}).items()]
+
+    def run(self, subcommand, options=None, work_items=None, timeout=None, retries=None):
+        """
+        Run a COLMAP sub-command, retrying it on failure
+
+        Args:
+            subcommand (str): COLMAP sub-command
+            options (dict): Option name -> value
+            work_items (int): Size of the job (e.g. number of pairs) when COLMAP does not report it
+            timeout (float): Overrides the runner timeout
+            retries (int): Overrides the runner retries
+
+        Returns:
+            dict: Metrics of the successful attempt: subcommand, seconds, attempts,
+                unit, items and rate (items per second)
+        """
+        timeout = self.timeout if timeout is None else timeout
+        retries = self.retries if retries is None else retries
+        argv = self.command(subcommand, options)
+
+        with tracer.span(f"colmap.{subcommand}", category="colmap") as span:
+            for attempt in range(1, retries + 2):
+                try:
+                    metrics = self._run_once(subcommand, argv, work_items, timeout)
+                except RuntimeError:
+                    if attempt > retries:
+                        raise
+                    continue
+                metrics['attempts'] = attempt
+                with self._lock:
+                    self.history.append(metrics)
+                if tracer.enabled:
+                    span.args.update(unit=metrics['unit'], items=metrics['items'], attempts=attempt)
+                    tracer.count(f"colmap_{subcommand}_{metrics['unit']}", metrics['items'] or 0)
+                return metrics
+
+    def run_many(self, jobs):
+        """
+        Run several COLMAP sub-commands concurrently, at most num_workers at a time
+
+        Args:
+            jobs (list): (subcommand, options) tuples or dicts of run() keyword arguments
+
+        Returns:
+            list: Metrics of every job, in job order
+        """
+        jobs = [job if isinstance(job, dict) else {'subcommand': job[0], 'options': job[1]} for job in jobs]
+        with ThreadPoolExecutor(max_workers=max(1, self.num_workers or len(jobs) or 1)) as executor:
+            futures = [executor.submit(self.run, **job) for job in jobs]
+            return [future.result() for future in futures]
+
+    def summary(self):
+        """
+        Totals per sub-command over every successful run
+
+        Returns:
+            dict: subcommand -> {'runs', 'seconds', 'unit', 'items', 'rate'}
+        """
+        totals = {}
+        with self._lock:
+            history = list(self.history)
+        for metrics in history:
+            total = totals.setdefault(metrics['subcommand'], {'runs': 0, 'seconds': 0.0,
+                                                             'unit': metrics['unit'], 'items': 0})
+            total['runs'] += 1
+            total['seconds'] += metrics['seconds']
+            total['items'] += metrics['items'] or 0
+        for total in totals.values():
+            total['rate'] = total['items'] / total['seconds'] if total['seconds'] > 0 else 0.0
+        return totals
+
+    def _run_once(self, subcommand, argv, work_items, timeout):
+        """
+        Run a command once, streaming its output through the progress parser
+        """
+        unit, pattern = PROGRESS_PATTERNS.get(subcommand, (WORK_UNITS.get(subcommand, 'items'), None))
+        if work_items is not None:
+            unit = WORK_UNITS.get(subcommand, unit)
+        tail = deque(maxlen=self.log_lines)
+        progress = {'done': 0, 'total': None}
+
+        if self._slots:
+            self._slots.acquire()
+        try:
+            start = time.perf_counter()
+            try:
+                process = subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                                           errors='replace')
+            except OSError as e:
+                raise RuntimeError(f"COLMAP {subcommand} could not be started: {e}")
+
+            timed_out = threading.Event()
+            watchdog = None
+            if timeout is not None:
+                def kill():
+                    timed_out.set()
+                    process.kill()
+                watchdog = threading.Timer(timeout, kill)
+                watchdog.start()
+            try:
+                for line in process.stdout:
+                    tail.append(line.rstrip('\n'))
+                    if pattern is not None:
+                        self._parse_progress(subcommand, unit, pattern, line, progress)
+                returncode = process.wait()
+            finally:
+                if watchdog is not None:
+                    watchdog.cancel()
+                process.stdout.close()
+            seconds = time.perf_counter() - start
+        finally:
+            if self._slots:
+                self._slots.release()
+
+        if timed_out.is_set():
+            raise RuntimeError(f"COLMAP {subcommand} timed out after {timeout}s:\n" + "\n".join(tail))
+        if returncode != 0:
+            raise RuntimeError(f"COLMAP {subcommand} failed with exit code {returncode}:\n" + "\n".join(tail))
+
+        items = work_items if work_items is not None else progress['done']
+        return {'subcommand': subcommand, 'seconds': seconds, 'unit': unit, 'items': items,
+                'rate': items / seconds if seconds > 0 else 0.0}
+
+    def _parse_progress(self, subcommand, unit, pattern, line, progress):
+        match = pattern.search(line)
+        if match is None:
+            return
+        numbers = [int(group) for group in match.groups()]
+        if len(numbers) == 4:
+            # Matching block [i/n, j/m]: blocks are numbered row-major
+            progress['done'] = (numbers[0] - 1) * numbers[3] + numbers[2]
+            progress['total'] = numbers[1] * numbers[3]
+        elif len(numbers) == 2:
+            progress['done'], progress['total'] = numbers
+        else:
+            progress['done'] = numbers[0]
+        if self.progress_callback is not None:
+            self.progress_callback(subcommand, unit, progress['done'], progress['total'])
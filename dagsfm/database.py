@@ -0,0 +1,351 @@
+"""
+COLMAP database access helpers for DAGSfM-Python
+
+These helpers read the COLMAP SQLite database directly so that large
+tables can be streamed in chunks instead of going through per-row
+pycolmap objects.
+"""
+
+import os
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+
+import numpy as np
+
+
+# COLMAP encodes an image pair as image_id1 * MAX_IMAGE_ID + image_id2
+MAX_IMAGE_ID = 2**31 - 1
+
+# COLMAP SensorType::CAMERA, the sensor type under which images are stored in frame_data/pose_priors
+SENSOR_TYPE_CAMERA = 0
+
+
+def connect_read_only(database_path):
+    """
+    Open a read-only SQLite connection to a COLMAP database
+
+    Args:
+        database_path (str): Path to the COLMAP database file
+
+    Returns:
+        sqlite3.Connection: Read-only connection
+    """
+    uri = Path(database_path).resolve().as_uri() + "?mode=ro"
+    return sqlite3.connect(uri, uri=True)
+
+
+def pair_ids_to_image_ids(pair_ids):
+    """
+    Decode COLMAP pair ids into image id arrays
+
+    Args:
+        pair_ids (np.ndarray): Array of COLMAP pair ids
+
+    Returns:
+        tuple: (image_ids1, image_ids2) int64 arrays with image_ids1 < image_ids2
+    """
+    pair_ids = np.asarray(pair_ids, dtype=np.int64)
+    image_ids2 = pair_ids % MAX_IMAGE_ID
+    image_ids1 = (pair_ids - image_ids2) // MAX_IMAGE_ID
+    return image_ids1, image_ids2
+
+
+def image_ids_to_pair_ids(image_ids1, image_ids2):
+    """
+    Encode image id arrays into COLMAP pair ids
+
+    Args:
+        image_ids1 (np.ndarray): First image ids
+        image_ids2 (np.ndarray): Second image ids
+
+    Returns:
+        np.ndarray: int64 pair ids (order of the two ids does not matter)
+    """
+    image_ids1 = np.asarray(image_ids1, dtype=np.int64)
+    image_ids2 = np.asarray(image_ids2, dtype=np.int64)
+    low = np.minimum(image_ids1, image_ids2)
+    high = np.maximum(image_ids1, image_ids2)
+    return low * MAX_IMAGE_ID + high
+
+
+def read_images(database_path):
+    """
+    Read all image ids and names from a COLMAP database
+
+    Args:
+        database_path (str): Path to the COLMAP database file
+
+    Returns:
+        tuple: (image_ids, names) where image_ids is an int64 array and names a list
+    """
+    with closing(connect_read_only(database_path)) as connection:
+        rows = connection.execute("SELECT image_id, name FROM images ORDER BY image_id").fetchall()
+    image_ids = np.array([row[0] for row in rows], dtype=np.int64)
+    names = [row[1] for row in rows]
+    return image_ids, names
+
+
+def iter_descriptors(database_path, image_ids=None, chunk_size=256):
+    """
+    Stream the SIFT descriptors of the images of a COLMAP database
+
+    Args:
+        database_path (str): Path to the COLMAP database file
+        image_ids (list): Only read these images, defaults to every image with descriptors
+        chunk_size (int): Number of images fetched from SQLite per chunk
+
+    Yields:
+        tuple: (image_id, descriptors) with descriptors a (N, D) uint8 array, in image_id order
+    """
+    with closing(connect_read_only(database_path)) as connection:
+        if image_ids is None:
+            cursor = connection.execute("SELECT image_id, rows, cols, data FROM descriptors ORDER BY image_id")
+        else:
+            connection.execute("CREATE TEMP TABLE selected_images (image_id INTEGER PRIMARY KEY)")
+            connection.executemany("INSERT INTO selected_images VALUES (?)",
+                                   [(int(image_id),) for image_id in image_ids])
+            cursor = connection.execute(
+                "SELECT image_id, rows, cols, data FROM descriptors "
+                "WHERE image_id IN (SELECT image_id FROM selected_images) ORDER BY image_id")
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for image_id, num_rows, num_cols, data in rows:
+                if not num_rows:
+                    yield image_id, np.zeros((0, num_cols), dtype=np.uint8)
+                    continue
+                yield image_id, np.frombuffer(data, dtype=np.uint8).reshape(num_rows, num_cols)
+
+
+def delete_images(database_path, image_ids):
+    """
+    Delete images and every row that refers to them from a COLMAP database
+
+    Rows keyed by image_id are deleted, rows keyed by pair_id when either
+    image is deleted, and frames holding a deleted image are deleted with
+    all their frame_data. Global tables (cameras, rigs, ...) are kept.
+
+    Args:
+        database_path (str): Path to the COLMAP database file
+        image_ids (list): Ids of the images to delete
+    """
+    image_ids = [int(image_id) for image_id in image_ids]
+    if not image_ids:
+        return
+
+    with closing(sqlite3.connect(database_path)) as connection, connection:
+        connection.execute("CREATE TEMP TABLE deleted_images (image_id INTEGER PRIMARY KEY)")
+        connection.executemany("INSERT INTO deleted_images VALUES (?)", [(image_id,) for image_id in image_ids])
+        tables = [row[0] for row in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+        columns = {table: [row[1] for row in connection.execute(f'PRAGMA table_info("{table}")')]
+                   for table in tables}
+
+        if 'frame_data' in columns:
+            connection.execute(
+                "CREATE TEMP TABLE deleted_frames AS SELECT DISTINCT frame_id FROM frame_data "
+                "WHERE sensor_type = ? AND data_id IN (SELECT image_id FROM deleted_images)",
+                (SENSOR_TYPE_CAMERA,))
+            connection.execute("DELETE FROM frame_data WHERE frame_id IN (SELECT frame_id FROM deleted_frames)")
+            if 'frames' in columns:
+                connection.execute("DELETE FROM frames WHERE frame_id IN (SELECT frame_id FROM deleted_frames)")
+
+        for table, table_columns in columns.items():
+            if 'image_id' in table_columns:
+                connection.execute(f'DELETE FROM "{table}" WHERE image_id IN (SELECT image_id FROM deleted_images)')
+            elif 'pair_id' in table_columns:
+                connection.execute(
+                    f'DELETE FROM "{table}" WHERE pair_id % {MAX_IMAGE_ID} IN (SELECT image_id FROM deleted_images) '
+                    f'OR pair_id / {MAX_IMAGE_ID} IN (SELECT image_id FROM deleted_images)')
+            elif 'corr_data_id' in table_columns and 'corr_sensor_type' in table_columns:
+                connection.execute(
+                    f'DELETE FROM "{table}" WHERE corr_sensor_type = ? '
+                    f'AND corr_data_id IN (SELECT image_id FROM deleted_images)', (SENSOR_TYPE_CAMERA,))
+
+
+def read_keypoint_counts(database_path):
+    """
+    Read the number of keypoints of every image without decoding the keypoint blobs
+
+    Args:
+        database_path (str): Path to the COLMAP database file
+
+    Returns:
+        tuple: (image_ids, counts) int64 arrays
+    """
+    with closing(connect_read_only(database_path)) as connection:
+        rows = connection.execute("SELECT image_id, rows FROM keypoints").fetchall()
+    rows = np.array(rows, dtype=np.int64).reshape(-1, 2)
+    return rows[:, 0], rows[:, 1]
+
+
+def read_two_view_geometry_edges(database_path, chunk_size=1000000):
+    """
+    Stream verified image pairs and their inlier counts from the
+    two_view_geometries table without decoding any match blobs
+
+    The inlier count of a pair is the ``rows`` column of its inlier
+    match blob, so only integer columns are read.
+
+    Args:
+        database_path (str): Path to the COLMAP database file
+        chunk_size (int): Number of rows fetched from SQLite per chunk
+
+    Returns:
+        tuple: (image_ids1, image_ids2, inlier_counts) int64 arrays
+    """
+    pair_id_chunks = []
+    inlier_chunks = []
+    with closing(connect_read_only(database_path)) as connection:
+        cursor = connection.execute("SELECT pair_id, rows FROM two_view_geometries")
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            chunk = np.array(rows, dtype=np.int64).reshape(-1, 2)
+            pair_id_chunks.append(chunk[:, 0])
+            inlier_chunks.append(chunk[:, 1])
+
+    if not pair_id_chunks:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty.copy(), empty.copy()
+
+    image_ids1, image_ids2 = pair_ids_to_image_ids(np.concatenate(pair_id_chunks))
+    return image_ids1, image_ids2, np.concatenate(inlier_chunks)
+
+
+def slice_database(database_path, clusters, output_directory, chunk_size=10000):
+    """
+    Materialise one COLMAP database per cluster that only contains the rows
+    of the cluster's images, in a single streaming pass over the source
+
+    Every table is read once. Rows keyed by image_id are routed to the
+    clusters containing that image, rows keyed by pair_id to the clusters
+    containing both images, frames follow the images they hold, and small
+    global tables (cameras, rigs, ...) are copied to every output.
+
+    Args:
+        database_path (str): Path to the source COLMAP database
+        clusters (dict): cluster_id -> list of image ids
+        output_directory (str): Directory receiving cluster_<id>.db files
+        chunk_size (int): Number of rows fetched from SQLite per chunk
+
+    Returns:
+        dict: cluster_id -> path of the cluster database
+    """
+    os.makedirs(output_directory, exist_ok=True)
+
+    image_clusters = {}
+    for cluster_id, image_ids in clusters.items():
+        for image_id in image_ids:
+            image_clusters.setdefault(int(image_id), []).append(cluster_id)
+    frame_clusters = {}
+    all_clusters = list(clusters)
+
+    source = connect_read_only(database_path)
+    schema = source.execute(
+        "SELECT type, name, sql FROM sqlite_master "
+        "WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'").fetchall()
+
+    output_paths = {}
+    outputs = {}
+    try:
+        for cluster_id in clusters:
+            output_path = os.path.join(output_directory, f"cluster_{cluster_id}.db")
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            connection = sqlite3.connect(output_path)
+            connection.execute("PRAGMA journal_mode=OFF")
+            connection.execute("PRAGMA synchronous=OFF")
+            for object_type, _, sql in schema:
+                if object_type == 'table':
+                    connection.execute(sql)
+            output_paths[cluster_id] = output_path
+            outputs[cluster_id] = connection
+
+        tables = [name for object_type, name, _ in schema if object_type == 'table']
+        # frame_data must be routed before frames so frame membership is known
+        tables.sort(key=lambda name: {'frame_data': 1, 'frames': 2}.get(name, 0))
+
+        for table in tables:
+            columns = [row[1] for row in source.execute(f'PRAGMA table_info("{table}")')]
+            route = _table_router(table, columns, image_clusters, frame_clusters, all_clusters)
+            insert = f'INSERT INTO "{table}" VALUES ({", ".join("?" * len(columns))})'
+            order = " ORDER BY sensor_type" if table == 'frame_data' else ""
+            cursor = source.execute(f'SELECT * FROM "{table}"{order}')
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                buffers = {}
+                for row in rows:
+                    for cluster_id in route(row):
+                        buffers.setdefault(cluster_id, []).append(row)
+                for cluster_id, cluster_rows in buffers.items():
+                    outputs[cluster_id].executemany(insert, cluster_rows)
+
+        # Indices are created after the bulk insert, which is much faster than maintaining them row by row
+        for cluster_id, connection in outputs.items():
+            for object_type, _, sql in schema:
+                if object_type == 'index':
+                    connection.execute(sql)
+            connection.commit()
+    finally:
+        for connection in outputs.values():
+            connection.close()
+        source.close()
+
+    return output_paths
+
+
+def _table_router(table, columns, image_clusters, frame_clusters, all_clusters):
+    """
+    Build the function mapping a row of a table to the clusters it belongs to
+    """
+    no_clusters = ()
+
+    if 'image_id' in columns:
+        position = columns.index('image_id')
+        return lambda row: image_clusters.get(row[position], no_clusters)
+
+    if 'pair_id' in columns:
+        position = columns.index('pair_id')
+
+        def route_pair(row):
+            image_id2 = row[position] % MAX_IMAGE_ID
+            image_id1 = (row[position] - image_id2) // MAX_IMAGE_ID
+            clusters1 = image_clusters.get(image_id1, no_clusters)
+            if not clusters1:
+                return no_clusters
+            clusters2 = image_clusters.get(image_id2, no_clusters)
+            return [cluster_id for cluster_id in clusters1 if cluster_id in clusters2]
+        return route_pair
+
+    if table == 'frame_data':
+        frame_position = columns.index('frame_id')
+        data_position = columns.index('data_id')
+        type_position = columns.index('sensor_type')
+
+        def route_frame_data(row):
+            if row[type_position] != SENSOR_TYPE_CAMERA:
+                return frame_clusters.get(row[frame_position], no_clusters)
+            cluster_ids = image_clusters.get(row[data_position], no_clusters)
+            if cluster_ids:
+                frame_clusters.setdefault(row[frame_position], set()).update(cluster_ids)
+            return cluster_ids
+        return route_frame_data
+
+    if table == 'frames':
+        position = columns.index('frame_id')
+        return lambda row: frame_clusters.get(row[position], no_clusters)
+
+    if 'corr_data_id' in columns and 'corr_sensor_type' in columns:
+        data_position = columns.index('corr_data_id')
+        type_position = columns.index('corr_sensor_type')
+        return lambda row: image_clusters.get(row[data_position], no_clusters) \
+            if row[type_position] == SENSOR_TYPE_CAMERA else no_clusters
+
+    # Small global tables (cameras, rigs, rig_sensors, ...) go to every cluster
+    return lambda row: all_clusters
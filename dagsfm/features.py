@@ -2,22 +2,52 @@
 Feature extraction and matching module for DAGSfM-Python
 """
 
-import subprocess
 import os
+import hashlib
+import json
+import queue
+import shutil
+import threading
+import sqlite3
+from contextlib import closing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import numpy as np
+
+from dagsfm.colmap_runner import ColmapRunner
+from dagsfm.database import (delete_images, image_ids_to_pair_ids, iter_descriptors, read_images,
+                             read_keypoint_counts, read_two_view_geometry_edges)
+from dagsfm.retrieval import VladRetrieval
+from dagsfm.tracing import traced, tracer
+from dagsfm.utils import load_images_from_directory
+from dagsfm.view_graph import ViewGraph
 
 class FeatureExtractor:
     """
     Class for extracting features from images using various algorithms like SIFT, SURF, etc.
     """
     
-    def __init__(self, colmap_path="colmap"):
+    def __init__(self, colmap_path="colmap", worker_slots=None, shard_size=1000, incremental=True,
+                 image_signature="stat", runner=None):
         """
         Initialize feature extractor
         
         Args:
             colmap_path (str): Path to the COLMAP executable, defaults to "colmap"
+            worker_slots (list): One dict of extractor options per concurrent extractor process,
+                e.g. [{"use_gpu": 1, "gpu_index": 0}, {"use_gpu": 0, "num_threads": 8}].
+                Short keys are SiftExtraction options. None runs a single extractor over the folder.
+            shard_size (int): Number of images per shard database in sharded mode
+            incremental (bool): Only extract images that are new or changed since the last run on the database
+            image_signature (str): How changed images are detected, "stat" (size + mtime) or "sha1" (content hash)
+            runner (ColmapRunner): Runner of the COLMAP commands, defaults to one for colmap_path
         """
-        self.colmap_path = "colmap"
+        self.colmap_path = colmap_path
+        self.runner = runner or ColmapRunner(colmap_path)
+        self.worker_slots = worker_slots
+        self.shard_size = shard_size
+        self.incremental = incremental
+        self.image_signature = image_signature
         self.feature_cfg = {    
                     "ImageReader.camera_model": "OPENCV",
                     # "ImageReader.single_camera_per_folder": "1",
@@ -30,6 +60,7 @@ class FeatureExtractor:
                     "SiftExtraction.gpu_index": "0,1,2,3",
         }  # Configuration dictionary for COLMAP parameters
     
+    @traced("features.extract_features")
     def extract_features(self, image_path, database_path):
         """
         Extract features from an image and store in database
@@ -41,40 +72,330 @@ class FeatureExtractor:
         Returns:
             str: Path to the database file with extracted features
         """
-        # Build COLMAP feature extractor command
-        cmd = (
-            f"{self.colmap_path} feature_extractor "
-            f"--database_path={database_path} "
-            f"--image_path={image_path}"
-        )
-        
+        image_names = None
+        signatures = None
+        if self.incremental:
+            image_names, signatures, stale_image_ids = self.pending_images(image_path, database_path)
+            # Changed images are extracted again, their old features and matches are removed first
+            delete_images(database_path, stale_image_ids)
+            if image_names == []:
+                self.write_manifest(database_path, signatures)
+                return database_path
+
+        if self.worker_slots:
+            self.extract_features_sharded(image_path, database_path, image_names)
+        else:
+            self.extract_features_single(image_path, database_path, image_names)
+
+        if signatures is not None:
+            self.write_manifest(database_path, signatures)
+        return database_path
+
+    def extract_features_single(self, image_path, database_path, image_names=None):
+        """
+        Extract features with one COLMAP feature extractor process
+
+        Args:
+            image_path (str): Directory containing the images
+            database_path (str): Path to the database file
+            image_names (list): Only extract these images, defaults to the whole directory
+        """
+        # Build COLMAP feature extractor options
+        options = {"database_path": database_path, "image_path": image_path}
+
+        image_list_path = database_path + ".images.txt"
+        if image_names is not None:
+            with open(image_list_path, 'w') as f:
+                for image_name in image_names:
+                    f.write(image_name + '\n')
+            options["image_list_path"] = image_list_path
+
         # Add any additional COLMAP configuration parameters
-        for k, v in self.feature_cfg.items():
-            cmd += f" --{k}={v}"
-        
+        options.update(self.feature_cfg)
+
         # Execute the command
         try:
-            subprocess.run(cmd, shell=True, check=True)
-        except subprocess.CalledProcessError as e:
-            raise RuntimeError(f"COLMAP feature extraction failed: {e}")
-        
+            self.runner.run("feature_extractor", options)
+        finally:
+            if image_names is not None:
+                os.remove(image_list_path)
+
         return database_path
 
+    @traced("features.pending_images")
+    def pending_images(self, image_directory, database_path):
+        """
+        Diff the image directory against the database and the manifest of the last run
+
+        Images missing from the database are new. Images in the database whose
+        signature differs from the one recorded in the manifest have changed
+        and have to be extracted again, after their old rows are deleted.
+        Images in the database but not in the manifest (databases from before
+        the manifest existed) are trusted. The database is only read.
+
+        Args:
+            image_directory (str): Directory containing the images
+            database_path (str): Path to the database file
+
+        Returns:
+            tuple: (image_names, signatures, stale_image_ids) where image_names lists the
+                images to extract, or is None when the database is new and every image has
+                to be extracted, signatures maps every image name of the directory to its
+                signature and stale_image_ids are the database ids of the changed images
+        """
+        signatures = {}
+        for path in load_images_from_directory(image_directory):
+            signatures[os.path.relpath(path, image_directory)] = self.signature(path)
+
+        if not os.path.exists(database_path) or os.path.getsize(database_path) == 0:
+            return None, signatures, []
+
+        image_ids, names = read_images(database_path)
+        existing = dict(zip(names, image_ids.tolist()))
+        manifest = self.read_manifest(database_path)
+        pending, stale_image_ids = [], []
+        for name, signature in signatures.items():
+            if name not in existing:
+                pending.append(name)
+            elif name in manifest and manifest[name] != signature:
+                pending.append(name)
+                stale_image_ids.append(existing[name])
+        return pending, signatures, stale_image_ids
+
+    def signature(self, path):
+        """
+        Signature of an image file used to detect changes between runs
+
+        Args:
+            path (str): Path of the image file
+
+        Returns:
+            list: [size, mtime in ns] or [size, sha1 hex digest] depending on image_signature
+        """
+        stat = os.stat(path)
+        if self.image_signature == "stat":
+            return [stat.st_size, stat.st_mtime_ns]
+        if self.image_signature == "sha1":
+            digest = hashlib.sha1()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+            return [stat.st_size, digest.hexdigest()]
+        raise ValueError(f"Unknown image signature: {self.image_signature}")
+
+    @staticmethod
+    def manifest_path(database_path):
+        return database_path + ".manifest.json"
+
+    def read_manifest(self, database_path):
+        """
+        Image signatures recorded by the last run on the database, empty if there is none
+        """
+        path = self.manifest_path(database_path)
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r') as f:
+            manifest = json.load(f)
+        if manifest.get('image_signature') != self.image_signature:
+            return {}
+        return manifest['images']
+
+    def write_manifest(self, database_path, signatures):
+        """
+        Record the image signatures of a finished run next to the database
+        """
+        path = self.manifest_path(database_path)
+        with open(path + ".tmp", 'w') as f:
+            json.dump({'image_signature': self.image_signature, 'images': signatures}, f)
+        os.replace(path + ".tmp", path)
+
+    @traced("features.extract_features_sharded")
+    def extract_features_sharded(self, image_directory, database_path, image_names=None):
+        """
+        Extract features with several concurrent extractor processes and merge their shard databases
+
+        The image list is split into shards of shard_size images. Every
+        worker slot runs one extractor at a time with its own options (GPU
+        index, thread count, ...), taking the next shard as soon as it is
+        done. Shard databases are then merged pairwise in rounds, with the
+        merges of a round running concurrently. An existing database at
+        database_path is merged with the combined shards once at the end
+        instead of being copied in every round. COLMAP database_merger
+        renumbers the image and camera ids of both inputs, so image ids read
+        before the extraction are not valid afterwards and have to be read
+        again from the database.
+
+        Args:
+            image_directory (str): Directory containing the images
+            database_path (str): Path to the database file
+            image_names (list): Image names relative to image_directory, defaults to every image in it
+
+        Returns:
+            str: Path to the database file with extracted features
+        """
+        if image_names is None:
+            image_names = [os.path.relpath(path, image_directory)
+                           for path in load_images_from_directory(image_directory)]
+        shard_directory = database_path + ".shards"
+        os.makedirs(shard_directory, exist_ok=True)
+
+        shards = queue.Queue()
+        shard_paths = []
+        for index, start in enumerate(range(0, len(image_names), self.shard_size)):
+            shard_path = os.path.join(shard_directory, f"shard_{index}.db")
+            if os.path.exists(shard_path):
+                os.remove(shard_path)
+            shards.put((shard_path, image_names[start:start + self.shard_size]))
+            shard_paths.append(shard_path)
+
+        errors = []
+
+        def run_slot(slot):
+            while not errors:
+                try:
+                    shard_path, shard_images = shards.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    self.extract_shard(image_directory, shard_images, shard_path, slot)
+                except Exception as e:
+                    errors.append(e)
+
+        threads = [threading.Thread(target=run_slot, args=(slot,)) for slot in self.worker_slots]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+        merged_path = self.merge_databases(shard_paths, shard_directory)
+        if os.path.exists(database_path) and os.path.getsize(database_path) > 0:
+            merged_path = self.merge_database_pair(database_path, merged_path,
+                                                   os.path.join(shard_directory, "merged_main.db"))
+        os.replace(merged_path, database_path)
+        shutil.rmtree(shard_directory)
+        return database_path
+
+    def extract_shard(self, image_directory, image_names, database_path, slot):
+        """
+        Run one COLMAP feature extractor over a shard of images
+
+        Args:
+            image_directory (str): Directory containing the images
+            image_names (list): Image names of the shard
+            database_path (str): Shard database to create
+            slot (dict): Extractor options of the worker slot running the shard
+        """
+        image_list_path = database_path + ".images.txt"
+        with open(image_list_path, 'w') as f:
+            for image_name in image_names:
+                f.write(image_name + '\n')
+
+        options = {"database_path": database_path, "image_path": image_directory,
+                   "image_list_path": image_list_path}
+        options.update(self.feature_cfg)
+        options.update(self.slot_options(slot))
+        try:
+            self.runner.run("feature_extractor", options)
+        finally:
+            os.remove(image_list_path)
+
+    @traced("features.merge_databases")
+    def merge_databases(self, database_paths, work_directory):
+        """
+        Merge databases pairwise in rounds, running the merges of a round concurrently
+
+        Args:
+            database_paths (list): Databases to merge, the first one keeps its ids
+            work_directory (str): Directory receiving the intermediate databases
+
+        Returns:
+            str: Path of the merged database (the single input if only one is given)
+        """
+        paths = list(database_paths)
+        round_index = 0
+        with ThreadPoolExecutor(max_workers=max(1, len(self.worker_slots or [None]))) as executor:
+            while len(paths) > 1:
+                futures = []
+                for index in range(0, len(paths) - 1, 2):
+                    merged_path = os.path.join(work_directory, f"merged_{round_index}_{index // 2}.db")
+                    futures.append(executor.submit(self.merge_database_pair, paths[index], paths[index + 1],
+                                                   merged_path))
+                merged = [future.result() for future in futures]
+                if len(paths) % 2:
+                    merged.append(paths[-1])
+                paths = merged
+                round_index += 1
+        return paths[0]
+
+    def merge_database_pair(self, database_path1, database_path2, merged_database_path):
+        """
+        Merge two databases with COLMAP database_merger
+
+        Returns:
+            str: Path of the merged database
+        """
+        if os.path.exists(merged_database_path):
+            os.remove(merged_database_path)
+        self.runner.run("database_merger", {"database_path1": database_path1,
+                                            "database_path2": database_path2,
+                                            "merged_database_path": merged_database_path}, work_items=2)
+        return merged_database_path
+
+    @staticmethod
+    def slot_options(slot):
+        """
+        COLMAP options of a worker slot, short keys being SiftExtraction options
+        """
+        return {(key if '.' in key else f"SiftExtraction.{key}"): str(value) for key, value in slot.items()}
+
+    @staticmethod
+    def cpu_worker_slots(num_workers=None):
+        """
+        Worker slots for CPU-only nodes, splitting the cores evenly between the extractors
+
+        Args:
+            num_workers (int): Number of concurrent extractors, defaults to one per 4 cores
+
+        Returns:
+            list: Worker slots
+        """
+        cores = os.cpu_count() or 1
+        num_workers = num_workers or max(1, cores // 4)
+        return [{"use_gpu": 0, "num_threads": max(1, cores // num_workers)} for _ in range(num_workers)]
+
 
 class FeatureMatcher:
     """
     Class for matching features between images
     """
     
-    def __init__(self, colmap_path="colmap"):
+    def __init__(self, colmap_path="colmap", runner=None):
         """
         Initialize feature matcher
         
         Args:
             colmap_path (str): Path to the COLMAP executable, defaults to "colmap"
+            runner (ColmapRunner): Runner of the COLMAP commands, defaults to one for colmap_path
         """
         self.colmap_path = colmap_path
+        self.runner = runner or ColmapRunner(colmap_path)
         self.matcher_cfg = {}  # Configuration dictionary for COLMAP matching parameters
+        self.retrieval_cfg = {
+                    "num_neighbors": 30,
+                    "num_words": 64,
+                    "dimension": 256,
+                    "training_images": 1000,
+        }  # Configuration of the retrieval-based candidate pair selection
+        self.pair_matching_cfg = {
+                    "chunk_size": 10000,
+                    "num_workers": None,
+                    "max_ratio": 0.8,
+                    "max_distance": 0.7,
+                    "cross_check": True,
+                    "block_size": 1024,
+        }  # Configuration of the parallel pair-list matcher
     
     def exhaustive_matcher(self, database_path):
         """
@@ -86,21 +407,15 @@ class FeatureMatcher:
         Returns:
             str: Path to the database file with computed matches
         """
-        # Build COLMAP exhaustive_matcher command
-        cmd = (
-            f"{self.colmap_path} exhaustive_matcher "
-            f"--database_path={database_path}"
-        )
+        # Build COLMAP exhaustive_matcher options
+        options = {"database_path": database_path}
         
         # Add any additional COLMAP configuration parameters
-        for k, v in self.matcher_cfg.items():
-            cmd += f" --{k}={v}"
+        options.update(self.matcher_cfg)
         
-        # Execute the command
-        try:
-            subprocess.run(cmd, shell=True, check=True)
-        except subprocess.CalledProcessError as e:
-            raise RuntimeError(f"COLMAP exhaustive matching failed: {e}")
+        # Execute the command; every image pair is matched
+        num_images = len(read_images(database_path)[0])
+        self.runner.run("exhaustive_matcher", options, work_items=num_images * (num_images - 1) // 2)
         
         return database_path
     
@@ -114,33 +429,349 @@ class FeatureMatcher:
         Returns:
             str: Path to the database file with computed matches
         """
-        # Build COLMAP exhaustive_matcher command
-        cmd = (
-            f"{self.colmap_path} spatial_matcher "
-            f"--database_path={database_path}"
-        )
+        # Build COLMAP spatial_matcher options
+        options = {"database_path": database_path}
         
         # Add any additional COLMAP configuration parameters
-        for k, v in self.matcher_cfg.items():
-            cmd += f" --{k}={v}"
+        options.update(self.matcher_cfg)
         
         # Execute the command
-        try:
-            subprocess.run(cmd, shell=True, check=True)
-        except subprocess.CalledProcessError as e:
-            raise RuntimeError(f"COLMAP exhaustive matching failed: {e}")
+        self.runner.run("spatial_matcher", options)
         
         return database_path
     
-    def build_matching_graph(self, features_list):
+    @traced("features.retrieval_matcher")
+    def retrieval_matcher(self, database_path):
         """
-        Build a graph representing matching relationships between images
-        
+        Match every image only against its top-K retrieved images
+
+        A VLAD global descriptor is computed per image from the SIFT
+        descriptors in the database, the nearest neighbours of every image
+        are written to a pair list and the pairs are matched with COLMAP
+        matches_importer.
+
         Args:
-            features_list: List of features from all images
-            
+            database_path (str): Path to the database file
+
+        Returns:
+            str: Path to the database file with computed matches
+        """
+        retrieval = VladRetrieval(num_words=self.retrieval_cfg["num_words"],
+                                  dimension=self.retrieval_cfg["dimension"],
+                                  training_images=self.retrieval_cfg["training_images"])
+        pairs = retrieval.candidate_pairs(database_path, self.retrieval_cfg["num_neighbors"])
+        image_ids, names = read_images(database_path)
+        image_names = dict(zip(image_ids.tolist(), names))
+
+        match_list_path = database_path + ".pairs.txt"
+        with open(match_list_path, 'w') as f:
+            for image_id1, image_id2 in pairs.tolist():
+                f.write(f"{image_names[image_id1]} {image_names[image_id2]}\n")
+
+        # Build COLMAP matches_importer options
+        options = {"database_path": database_path, "match_list_path": match_list_path, "match_type": "pairs"}
+        options.update(self.matcher_cfg)
+
+        # Execute the command
+        self.runner.run("matches_importer", options, work_items=len(pairs))
+
+        return database_path
+
+    def pair_list_matcher(self, database_path, match_list_path, verify=True):
+        """
+        Match the image pairs listed in a text file, one "name1 name2" pair per line
+
+        Args:
+            database_path (str): Path to the database file
+            match_list_path (str): Path to the pair list
+            verify (bool): Run COLMAP geometric verification on the matched pairs
+
+        Returns:
+            str: Path to the database file with computed matches
+        """
+        image_ids, names = read_images(database_path)
+        name_to_id = dict(zip(names, image_ids.tolist()))
+        pairs = []
+        with open(match_list_path, 'r') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 2:
+                    pairs.append((name_to_id[fields[0]], name_to_id[fields[1]]))
+        # The matching progress is kept until verification is done, so that an
+        # interrupted verification does not match everything again
+        self.match_pairs(database_path, np.array(pairs, dtype=np.int64).reshape(-1, 2), keep_progress=verify)
+        if verify:
+            self.verify_pairs(database_path, match_list_path)
+            _clear_progress(database_path, "match")
+        return database_path
+
+    @traced("features.match_pairs")
+    def match_pairs(self, database_path, pairs, keep_progress=False):
+        """
+        Match image pairs in parallel chunks and store the raw matches in the database
+
+        Pairs are sorted and split into chunks of chunk_size pairs, which are
+        matched by at most num_workers processes reading descriptors from the
+        database. Only the main process writes: the matches of a chunk are
+        inserted in one transaction together with a progress row, so an
+        interrupted run resumes after the last committed chunk. The progress
+        rows are removed once every chunk is done.
+
+        A worker holds the descriptors of two images and one block of
+        block_size x (keypoints of the second image) distances at a time,
+        and at most two chunks per worker are in flight.
+
+        Args:
+            database_path (str): Path to the database file
+            pairs (np.ndarray): (P, 2) image id pairs
+            keep_progress (bool): Keep the progress rows after the last chunk, for a later step
+
+        Returns:
+            int: Number of pairs matched by this call (pairs of committed chunks are skipped)
+        """
+        cfg = self.pair_matching_cfg
+        pairs = np.unique(np.sort(np.asarray(pairs, dtype=np.int64).reshape(-1, 2), axis=1), axis=0)
+        pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+        chunk_size = cfg["chunk_size"]
+        chunks = [pairs[start:start + chunk_size] for start in range(0, len(pairs), chunk_size)]
+        fingerprint = hashlib.sha1(pairs.tobytes() + str(chunk_size).encode()).hexdigest()
+
+        connection = sqlite3.connect(database_path)
+        try:
+            done = _start_progress(connection, "match", fingerprint)
+            pending = [chunk_id for chunk_id in range(len(chunks)) if chunk_id not in done]
+
+            num_workers = cfg["num_workers"] or os.cpu_count() or 1
+            options = (cfg["max_ratio"], cfg["max_distance"], cfg["cross_check"], cfg["block_size"])
+            num_matched = 0
+            with ProcessPoolExecutor(max_workers=num_workers) as executor:
+                # At most two chunks per worker are in flight, which bounds the memory held by results
+                running = {}
+                while pending or running:
+                    while pending and len(running) < 2 * num_workers:
+                        chunk_id = pending.pop(0)
+                        future = executor.submit(_match_pair_chunk, database_path, chunks[chunk_id], *options)
+                        running[future] = chunk_id
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        chunk_id = running.pop(future)
+                        rows = future.result()
+                        with connection:
+                            connection.executemany("INSERT OR REPLACE INTO matches VALUES (?, ?, 2, ?)", rows)
+                            connection.execute(f"INSERT INTO {_PROGRESS_TABLE} VALUES ('match', ?, ?)",
+                                               (fingerprint, chunk_id))
+                        num_matched += len(chunks[chunk_id])
+                        tracer.count("matched_pairs", len(chunks[chunk_id]))
+        finally:
+            connection.close()
+        if not keep_progress:
+            _clear_progress(database_path, "match")
+        return num_matched
+
+    def verify_pairs(self, database_path, match_list_path):
+        """
+        Geometrically verify matched pairs with COLMAP matches_importer, chunk by chunk
+
+        The pair list is split into chunks of chunk_size pairs, each verified
+        by one matches_importer run and recorded in the progress table once
+        it is done, so an interrupted verification resumes after the last
+        verified chunk. Pairs whose matches are already in the database are
+        not matched again, only verified.
+
+        Args:
+            database_path (str): Path to the database file
+            match_list_path (str): Path to the pair list
+
+        Returns:
+            int: Number of pairs verified by this call (pairs of verified chunks are skipped)
+        """
+        with open(match_list_path, 'r') as f:
+            lines = [line.strip() for line in f if line.strip()]
+        chunk_size = self.pair_matching_cfg["chunk_size"]
+        chunks = [lines[start:start + chunk_size] for start in range(0, len(lines), chunk_size)]
+        fingerprint = hashlib.sha1(("\n".join(lines) + str(chunk_size)).encode()).hexdigest()
+
+        chunk_list_path = database_path + ".verify_pairs.txt"
+        options = {"database_path": database_path, "match_list_path": chunk_list_path, "match_type": "pairs"}
+        options.update(self.matcher_cfg)
+        num_verified = 0
+        connection = sqlite3.connect(database_path)
+        try:
+            done = _start_progress(connection, "verify", fingerprint)
+            for chunk_id, chunk in enumerate(chunks):
+                if chunk_id in done:
+                    continue
+                with open(chunk_list_path, 'w') as f:
+                    f.write("\n".join(chunk) + "\n")
+                self.runner.run("matches_importer", options, work_items=len(chunk))
+                with connection:
+                    connection.execute(f"INSERT INTO {_PROGRESS_TABLE} VALUES ('verify', ?, ?)",
+                                       (fingerprint, chunk_id))
+                num_verified += len(chunk)
+        finally:
+            connection.close()
+            if os.path.exists(chunk_list_path):
+                os.remove(chunk_list_path)
+        _clear_progress(database_path, "verify")
+        return num_verified
+
+    @traced("features.build_matching_graph")
+    def build_matching_graph(self, database_path, weighting="inliers", min_inliers=0):
+        """
+        Build the view graph of the verified image pairs in the database
+
+        Pairs and inlier counts are read as integer columns of the
+        two_view_geometries table, without decoding any match blobs, and
+        turned into edge weights with array operations.
+
+        Args:
+            database_path (str): Path to the database file
+            weighting (str): Edge weight, one of
+                "inliers" (inlier count), "log" (log(1 + inliers)) or
+                "normalized" (inliers divided by the smaller keypoint count of the two images)
+            min_inliers (int): Pairs with fewer inliers are dropped
+
         Returns:
-            matching_graph: Graph of image matching relationships
+            ViewGraph: View graph over all images of the database, with image names
         """
-        # TODO: Construct image matching graph
-        pass
\ No newline at end of file
+        image_ids, names = read_images(database_path)
+        image_ids1, image_ids2, inlier_counts = read_two_view_geometry_edges(database_path)
+        keep = inlier_counts >= min_inliers
+        image_ids1, image_ids2, inlier_counts = image_ids1[keep], image_ids2[keep], inlier_counts[keep]
+
+        if weighting == "inliers":
+            weights = inlier_counts.astype(np.float32)
+        elif weighting == "log":
+            weights = np.log1p(inlier_counts).astype(np.float32)
+        elif weighting == "normalized":
+            keypoint_ids, keypoint_counts = read_keypoint_counts(database_path)
+            graph = ViewGraph(keypoint_ids)
+            counts = np.zeros(graph.num_nodes + 1, dtype=np.int64)
+            counts[:graph.num_nodes] = keypoint_counts[np.argsort(keypoint_ids, kind='stable')]
+            # Index -1 (image without keypoints) reads the trailing zero
+            smaller = np.minimum(counts[graph.image_id_to_index(image_ids1)],
+                                 counts[graph.image_id_to_index(image_ids2)])
+            weights = (inlier_counts / np.maximum(smaller, 1)).astype(np.float32)
+        else:
+            raise ValueError(f"Unknown edge weighting: {weighting}")
+
+        return ViewGraph.from_edges(image_ids, image_ids1, image_ids2, weights, names)
+
+
+def match_descriptors(descriptors1, descriptors2, max_ratio=0.8, max_distance=0.7, cross_check=True,
+                      block_size=1024):
+    """
+    Nearest-neighbour SIFT matching with ratio test, distance threshold and cross check
+
+    Distances are angles between L2-normalised descriptors, as in COLMAP.
+    They are computed for block_size descriptors of the first image at a
+    time, so at most block_size x N2 distances are held in memory; the
+    best match of every descriptor of the second image, needed by the
+    cross check, is tracked across the blocks.
+
+    Args:
+        descriptors1 (np.ndarray): (N1, D) descriptors of the first image
+        descriptors2 (np.ndarray): (N2, D) descriptors of the second image
+        max_ratio (float): Maximum ratio between the best and second best distance
+        max_distance (float): Maximum distance of the best match
+        cross_check (bool): Only keep mutual nearest neighbours
+        block_size (int): Descriptors of the first image per block of distances
+
+    Returns:
+        np.ndarray: (M, 2) uint32 keypoint index pairs
+    """
+    if len(descriptors1) < 2 or len(descriptors2) < 2:
+        return np.zeros((0, 2), dtype=np.uint32)
+    descriptors1 = descriptors1.astype(np.float32)
+    descriptors2 = descriptors2.astype(np.float32)
+    descriptors1 /= np.maximum(np.linalg.norm(descriptors1, axis=1, keepdims=True), 1e-12)
+    descriptors2 /= np.maximum(np.linalg.norm(descriptors2, axis=1, keepdims=True), 1e-12)
+
+    best = np.empty(len(descriptors1), dtype=np.int64)
+    keep = np.empty(len(descriptors1), dtype=bool)
+    column_best = np.full(len(descriptors2), -np.inf, dtype=np.float32)
+    column_argbest = np.zeros(len(descriptors2), dtype=np.int64)
+    for start in range(0, len(descriptors1), block_size):
+        similarities = descriptors1[start:start + block_size] @ descriptors2.T
+        rows = np.arange(len(similarities))
+        top2 = np.argpartition(-similarities, 1, axis=1)[:, :2]
+        top2_similarities = similarities[rows[:, None], top2]
+        order = np.argsort(-top2_similarities, axis=1)
+        best[start:start + len(rows)] = top2[rows, order[:, 0]]
+        distances = np.arccos(np.clip(top2_similarities[rows[:, None], order], -1, 1))
+        keep[start:start + len(rows)] = (distances[:, 0] <= max_distance) \
+            & (distances[:, 0] < max_ratio * distances[:, 1])
+        if cross_check:
+            # Strictly better only, so that ties keep the first row like argmax
+            block_best = similarities.max(axis=0)
+            improved = block_best > column_best
+            column_best[improved] = block_best[improved]
+            column_argbest[improved] = start + np.argmax(similarities[:, improved], axis=0)
+
+    rows = np.arange(len(descriptors1))
+    if cross_check:
+        keep &= column_argbest[best] == rows
+    return np.stack([rows[keep], best[keep]], axis=1).astype(np.uint32)
+
+
+def _match_pair_chunk(database_path, pairs, max_ratio, max_distance, cross_check, block_size):
+    """
+    Match one chunk of sorted image pairs in a worker process
+
+    Pairs are grouped by their first image, whose descriptors are read
+    once per group while the partners are streamed, so memory stays
+    bounded by one group whatever the chunk size.
+
+    Returns:
+        list: (pair_id, num_matches, blob) rows of the matches table
+    """
+    rows = []
+    starts = np.flatnonzero(np.r_[True, pairs[1:, 0] != pairs[:-1, 0]])
+    for start, end in zip(starts, np.r_[starts[1:], len(pairs)]):
+        image_id1 = int(pairs[start, 0])
+        descriptors1 = next(iter_descriptors(database_path, [image_id1]), (None, np.zeros((0, 128))))[1]
+        for image_id2, descriptors2 in iter_descriptors(database_path, pairs[start:end, 1]):
+            matches = match_descriptors(descriptors1, descriptors2, max_ratio, max_distance, cross_check, block_size)
+            pair_id = int(image_ids_to_pair_ids([image_id1], [image_id2])[0])
+            rows.append((pair_id, len(matches), matches.tobytes()))
+    return rows
+
+
+# Chunks of the pair matcher and of the verification already committed to the database
+_PROGRESS_TABLE = "dagsfm_matching_progress"
+
+
+def _start_progress(connection, stage, fingerprint):
+    """
+    Create the progress table if needed and drop stale rows of the stage
+
+    Args:
+        connection (sqlite3.Connection): Open database connection
+        stage (str): "match" or "verify"
+        fingerprint (str): Hash of the pairs and chunking of the current run of the stage
+
+    Returns:
+        set: Chunk ids of the stage already done by a previous run with the same fingerprint
+    """
+    columns = [row[1] for row in connection.execute(f"PRAGMA table_info({_PROGRESS_TABLE})")]
+    if columns and "stage" not in columns:
+        # Progress written before the verification was resumable
+        connection.execute(f"DROP TABLE {_PROGRESS_TABLE}")
+    connection.execute(f"CREATE TABLE IF NOT EXISTS {_PROGRESS_TABLE} "
+                       "(stage TEXT NOT NULL, fingerprint TEXT NOT NULL, chunk_id INTEGER NOT NULL, "
+                       "PRIMARY KEY (stage, fingerprint, chunk_id))")
+    connection.execute(f"DELETE FROM {_PROGRESS_TABLE} WHERE stage = ? AND fingerprint != ?", (stage, fingerprint))
+    connection.commit()
+    return {row[0] for row in connection.execute(
+        f"SELECT chunk_id FROM {_PROGRESS_TABLE} WHERE stage = ? AND fingerprint = ?", (stage, fingerprint))}
+
+
+def _clear_progress(database_path, stage):
+    """
+    Remove the progress rows of a finished stage, and the table once it is empty
+    """
+    with closing(sqlite3.connect(database_path)) as connection:
+        with connection:
+            connection.execute(f"DELETE FROM {_PROGRESS_TABLE} WHERE stage = ?", (stage,))
+            if connection.execute(f"SELECT COUNT(*) FROM {_PROGRESS_TABLE}").fetchone()[0] == 0:
+                connection.execute(f"DROP TABLE {_PROGRESS_TABLE}")
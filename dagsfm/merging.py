@@ -2,72 +2,853 @@
 Sub-reconstruction merging and bundle adjustment module for DAGSfM-Python
 """
 
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import scipy.sparse as sp
+
+from dagsfm.bundle_adjustment import (SchurBundleAdjuster, apply_camera_updates, camera_tangents,
+                                      reprojection_residuals)
+from dagsfm.sub_model import SubModel
+from dagsfm.tracing import submit_traced, traced, tracer
+
+
+def maximum_spanning_tree(num_nodes, edges):
+    """
+    Maximum spanning tree (forest, if the graph is disconnected) with Kruskal's algorithm
+
+    Args:
+        num_nodes (int): Number of nodes, labelled 0..num_nodes-1
+        edges (list): (node1, node2, weight) tuples
+
+    Returns:
+        list: (node1, node2, weight) tuples of the tree edges
+    """
+    parent = list(range(num_nodes))
+
+    def find(node):
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    tree = []
+    for node1, node2, weight in sorted(edges, key=lambda edge: edge[2], reverse=True):
+        root1, root2 = find(node1), find(node2)
+        if root1 != root2:
+            parent[root2] = root1
+            tree.append((node1, node2, weight))
+    return tree
+
+
+def batched_umeyama(src, dst, weights=None):
+    """
+    Least-squares similarity transforms dst ~ s * R @ src + t for a batch of point sets (Umeyama 1991)
+
+    Args:
+        src (np.ndarray): (B, n, 3) source points
+        dst (np.ndarray): (B, n, 3) destination points
+        weights (np.ndarray): (B, n) non-negative point weights, optional
+
+    Returns:
+        tuple: (scales (B,), rotations (B, 3, 3), translations (B, 3))
+    """
+    if weights is None:
+        weights = np.ones(src.shape[:2])
+    weight_sums = np.maximum(weights.sum(axis=1), np.finfo(np.float64).tiny)
+    mean_src = np.einsum('bn,bni->bi', weights, src) / weight_sums[:, None]
+    mean_dst = np.einsum('bn,bni->bi', weights, dst) / weight_sums[:, None]
+    centered_src = src - mean_src[:, None]
+    centered_dst = dst - mean_dst[:, None]
+
+    covariance = np.einsum('bn,bni,bnj->bij', weights, centered_dst, centered_src) / weight_sums[:, None, None]
+    variance_src = np.einsum('bn,bni,bni->b', weights, centered_src, centered_src) / weight_sums
+
+    u, singular_values, vt = np.linalg.svd(covariance)
+    # Flip the last axis where needed so that R is a proper rotation
+    signs = np.ones((len(src), 3))
+    signs[:, 2] = np.sign(np.linalg.det(u) * np.linalg.det(vt))
+    signs[signs[:, 2] == 0, 2] = 1
+    rotations = np.einsum('bij,bj,bjk->bik', u, signs, vt)
+    safe_variance = np.where(variance_src > 0, variance_src, 1)
+    scales = np.where(variance_src > 0, (singular_values * signs).sum(axis=1) / safe_variance, 0)
+    translations = mean_dst - scales[:, None] * np.einsum('bij,bj->bi', rotations, mean_src)
+    return scales, rotations, translations
+
+
+def estimate_sim3(src, dst, inlier_threshold=None, relative_threshold=0.02, confidence=0.999,
+                  max_hypotheses=2000, batch_size=256, local_iterations=10, seed=0):
+    """
+    Robust similarity transform dst ~ s * R @ src + t with LO-RANSAC
+
+    Minimal 3-point hypotheses are solved and scored in batches: every batch
+    is one batched Umeyama solve followed by one residual evaluation over
+    all correspondences. Whenever a batch improves the best inlier count the
+    winner is refined by iterated least squares on its inliers (the local
+    optimisation step). Sampling stops when the adaptive RANSAC bound for
+    the requested confidence is reached.
+
+    Args:
+        src (np.ndarray): (n, 3) points in the frame to be aligned
+        dst (np.ndarray): (n, 3) corresponding points in the reference frame
+        inlier_threshold (float): Inlier distance in reference units, optional
+        relative_threshold (float): Inlier distance as a fraction of the median
+            spread of dst, used when inlier_threshold is None
+        confidence (float): Probability of having drawn an all-inlier sample when stopping
+        max_hypotheses (int): Upper bound on the number of minimal hypotheses
+        batch_size (int): Hypotheses solved and scored per array operation
+        local_iterations (int): Maximum number of least-squares refinements per local optimisation
+        seed (int): Seed of the sampler
+
+    Returns:
+        dict: scale, rotation, translation, inliers (boolean mask), num_correspondences,
+            num_inliers, inlier_ratio, rmse (over inliers), num_hypotheses and inlier_threshold
+    """
+    src = np.asarray(src, dtype=np.float64).reshape(-1, 3)
+    dst = np.asarray(dst, dtype=np.float64).reshape(-1, 3)
+    num_correspondences = len(src)
+    if num_correspondences < 3:
+        raise ValueError(f"At least 3 correspondences are needed for a Sim(3), got {num_correspondences}")
+
+    if inlier_threshold is None:
+        spread = np.median(np.linalg.norm(dst - dst.mean(axis=0), axis=1))
+        inlier_threshold = relative_threshold * spread if spread > 0 else 1e-9
+    squared_threshold = inlier_threshold ** 2
+
+    def inlier_mask(scale, rotation, translation):
+        residuals = scale * src @ rotation.T + translation - dst
+        return np.einsum('ni,ni->n', residuals, residuals) < squared_threshold
+
+    def local_optimisation(inliers):
+        model = None
+        for _ in range(local_iterations):
+            if inliers.sum() < 3:
+                break
+            scales, rotations, translations = batched_umeyama(src[inliers][None], dst[inliers][None])
+            candidate = (scales[0], rotations[0], translations[0])
+            candidate_inliers = inlier_mask(*candidate)
+            if model is not None and candidate_inliers.sum() <= inliers.sum():
+                break
+            model, inliers = candidate, candidate_inliers
+        return model, inliers
+
+    rng = np.random.default_rng(seed)
+    # Keep the (hypotheses x correspondences x 3) residual tensor around 4M entries
+    score_chunk = max(1, 4000000 // (3 * num_correspondences))
+    best_model, best_inliers, best_count = None, None, 0
+    required = max_hypotheses
+    num_hypotheses = 0
+    while num_hypotheses < min(required, max_hypotheses):
+        count = min(batch_size, max_hypotheses - num_hypotheses)
+        samples = rng.integers(0, num_correspondences, size=(count, 3))
+        distinct = (samples[:, 0] != samples[:, 1]) & (samples[:, 0] != samples[:, 2]) & (samples[:, 1] != samples[:, 2])
+        samples = samples[distinct]
+        num_hypotheses += count
+        if len(samples) == 0:
+            continue
+
+        scales, rotations, translations = batched_umeyama(src[samples], dst[samples])
+        counts = np.empty(len(samples), dtype=np.int64)
+        for start in range(0, len(samples), score_chunk):
+            end = start + score_chunk
+            predicted = scales[start:end, None, None] * np.einsum('hij,nj->hni', rotations[start:end], src) \
+                + translations[start:end, None]
+            residuals = predicted - dst
+            counts[start:end] = (np.einsum('hni,hni->hn', residuals, residuals) < squared_threshold).sum(axis=1)
+
+        winner = int(np.argmax(counts))
+        if counts[winner] <= best_count:
+            continue
+        model = (scales[winner], rotations[winner], translations[winner])
+        refined, inliers = local_optimisation(inlier_mask(*model))
+        if refined is not None:
+            model = refined
+        best_model, best_inliers, best_count = model, inliers, int(inliers.sum())
+
+        inlier_ratio = best_count / num_correspondences
+        if inlier_ratio >= 1:
+            break
+        required = np.log(1 - confidence) / np.log(1 - inlier_ratio ** 3)
+
+    if best_model is None or best_count < 3:
+        raise ValueError(f"No Sim(3) with at least 3 inliers among {num_correspondences} correspondences")
+
+    scale, rotation, translation = best_model
+    residuals = scale * src[best_inliers] @ rotation.T + translation - dst[best_inliers]
+    return {
+        'scale': float(scale),
+        'rotation': rotation,
+        'translation': translation,
+        'inliers': best_inliers,
+        'num_correspondences': num_correspondences,
+        'num_inliers': best_count,
+        'inlier_ratio': best_count / num_correspondences,
+        'rmse': float(np.sqrt(np.mean(np.einsum('ni,ni->n', residuals, residuals)))),
+        'num_hypotheses': num_hypotheses,
+        'inlier_threshold': float(inlier_threshold),
+    }
+
+
+def find_correspondences(reference, other):
+    """
+    3D-3D correspondences between two sub-models from their shared images
+
+    Every shared image contributes its camera centre. Every 3D point of
+    ``other`` observed by the same keypoint of a shared image as a 3D point
+    of ``reference`` contributes that point pair (once per pair).
+
+    Args:
+        reference (SubModel): Model defining the reference frame
+        other (SubModel): Model to be aligned
+
+    Returns:
+        tuple: (src, dst) (n, 3) arrays, src in the frame of other and dst in the frame of reference
+    """
+    reference_index = {name: index for index, name in enumerate(reference.image_names)}
+    shared = [(reference_index[name], index) for index, name in enumerate(other.image_names)
+              if name in reference_index]
+    if not shared:
+        return np.empty((0, 3)), np.empty((0, 3))
+    shared_reference, shared_other = np.array(shared, dtype=np.int64).T
+
+    src = [other.camera_centers()[shared_other]]
+    dst = [reference.camera_centers()[shared_reference]]
+
+    # Key every observation by (image index in reference, keypoint index)
+    other_to_reference = np.full(other.num_images, -1, dtype=np.int64)
+    other_to_reference[shared_other] = shared_reference
+    other_images = other_to_reference[other.track_image]
+    other_mask = other_images >= 0
+    other_keys = (other_images[other_mask] << 32) | other.track_point2D[other_mask].astype(np.int64)
+    reference_mask = np.isin(reference.track_image, shared_reference)
+    reference_keys = (reference.track_image[reference_mask].astype(np.int64) << 32) \
+        | reference.track_point2D[reference_mask].astype(np.int64)
+
+    _, reference_positions, other_positions = np.intersect1d(reference_keys, other_keys, return_indices=True)
+    if len(reference_positions):
+        point_pairs = np.unique(np.stack([reference.track_point[reference_mask][reference_positions],
+                                          other.track_point[other_mask][other_positions]], axis=1), axis=0)
+        src.append(other.points_xyz[point_pairs[:, 1]])
+        dst.append(reference.points_xyz[point_pairs[:, 0]])
+
+    return np.concatenate(src), np.concatenate(dst)
+
+
+def _reserve(array, size):
+    """
+    Make an owned buffer hold at least size rows, growing its capacity geometrically
+
+    The buffer is resized in place (realloc), so growing usually does not copy.
+    """
+    if len(array) < size:
+        array.resize((max(size, 2 * len(array)),) + array.shape[1:], refcheck=False)
+    return array
+
+
+class _TrackIndex:
+    """
+    Map from observation keys to merged 3D points, kept as a few sorted runs
+
+    Every batch of new keys is a sorted run; runs are merged pairwise like a
+    binary counter, so there are at most log2(#keys) runs and every key is
+    re-sorted O(log #keys) times in total instead of once per sub-model.
+    """
+
+    def __init__(self):
+        self.runs = []  # (sorted keys, points), sizes strictly decreasing
+
+    def lookup(self, keys):
+        """
+        Merged point of every key, -1 for keys not in the index
+        """
+        points = np.full(len(keys), -1, dtype=np.int64)
+        for run_keys, run_points in self.runs:
+            positions = np.minimum(np.searchsorted(run_keys, keys), len(run_keys) - 1)
+            found = run_keys[positions] == keys
+            points[found] = run_points[positions[found]]
+        return points
+
+    def add(self, keys, points):
+        """
+        Add sorted keys that are not in the index yet
+        """
+        if len(keys) == 0:
+            return
+        while self.runs and len(self.runs[-1][0]) <= len(keys):
+            run_keys, run_points = self.runs.pop()
+            keys = np.concatenate([run_keys, keys])
+            points = np.concatenate([run_points, points])
+            # Two sorted runs: the stable sort is a linear merge
+            order = np.argsort(keys, kind='stable')
+            keys, points = keys[order], points[order]
+        self.runs.append((keys, points))
+
+
+def _adjust_block(adjuster, model, fixed_images, camera_priors, point_priors):
+    """
+    Run one local bundle adjustment of a partitioned adjustment inside a worker process
+    """
+    with tracer.span("merging.local_bundle_adjustment", images=model.num_images):
+        adjuster.adjust(model, fixed_images, camera_priors, point_priors)
+    return model
+
+
 class SubReconstructionMerger:
     """
     Merges multiple sub-reconstructions and performs global bundle adjustment
     """
-    
-    def __init__(self):
+
+    def __init__(self, num_workers=None, work_directory=None, ba_mode='global', ba_backend='auto', ba_iterations=20,
+                 admm_iterations=10, local_iterations=5, admm_penalty=1e3):
         """
         Initialize merger
+
+        Args:
+            num_workers (int): Maximum number of pairwise merges (and local bundle adjustments) running concurrently
+            work_directory (str): Directory where sub-models and intermediate merges are
+                spilled as .npz files, optional. When set, only the models of the merges
+                in flight are held in memory.
+            ba_mode (str): 'global' for one bundle adjustment of the merged model, 'partitioned'
+                for parallel local adjustments of the clusters reconciled by ADMM consensus
+            ba_backend (str): Solver of the global adjustment: 'pycolmap' (Ceres), 'schur'
+                (SchurBundleAdjuster), or 'auto' to use pycolmap when it is installed
+            ba_iterations (int): Levenberg-Marquardt iterations of the global adjustment
+            admm_iterations (int): Consensus rounds of the partitioned adjustment
+            local_iterations (int): Levenberg-Marquardt iterations of every local adjustment per round
+            admm_penalty (float): Weight of the consensus terms on shared cameras and points
+        """
+        self.num_workers = num_workers
+        self.work_directory = work_directory
+        self.ba_mode = ba_mode
+        self.ba_backend = ba_backend
+        self.ba_iterations = ba_iterations
+        self.admm_iterations = admm_iterations
+        self.local_iterations = local_iterations
+        self.admm_penalty = admm_penalty
+        self.ba_statistics = {}
+        self._spill_counter = itertools.count()
+        self._spilled = set()  # intermediate files written by this merger
+        self.alignment_cfg = {}  # Keyword arguments of estimate_sim3
+        self.merge_rounds = []  # pairs merged in every round of the last hierarchical merge
+        self.alignments = []  # (reference images, other images, estimate_sim3 statistics) per alignment
+
+    def build_cluster_graph(self, reconstructions):
+        """
+        Build the graph of sub-reconstructions weighted by the number of shared images
+
+        Args:
+            reconstructions (list): List of sub-reconstructions
+
+        Returns:
+            list: (index1, index2, num_shared_images) tuples for every overlapping pair
+        """
+        image_to_models = {}
+        for index, reconstruction in enumerate(reconstructions):
+            for image_name in self._registered_image_names(reconstruction):
+                image_to_models.setdefault(image_name, []).append(index)
+
+        shared_counts = {}
+        for model_indices in image_to_models.values():
+            for i, index1 in enumerate(model_indices):
+                for index2 in model_indices[i + 1:]:
+                    pair = (index1, index2)
+                    shared_counts[pair] = shared_counts.get(pair, 0) + 1
+
+        return [(index1, index2, count) for (index1, index2), count in shared_counts.items()]
+
+    @traced("merging.merge_hierarchically")
+    def merge_hierarchically(self, reconstructions):
         """
-        pass
-    
+        Merge sub-reconstructions bottom-up along the maximum spanning tree of the cluster graph
+
+        Each round merges a set of vertex-disjoint tree edges, strongest
+        overlap first, with all merges of a round running concurrently; the
+        merged model replaces both endpoints and the tree is contracted.
+        For a balanced tree this needs O(log(#clusters)) rounds.
+
+        Args:
+            reconstructions (list): List of sub-reconstructions
+
+        Returns:
+            list: One merged reconstruction per connected component of the
+                cluster graph, largest component first
+        """
+        models = dict(enumerate(reconstructions))
+        sizes = {index: len(self._registered_image_names(model)) for index, model in models.items()}
+        tree = maximum_spanning_tree(len(reconstructions), self.build_cluster_graph(reconstructions))
+        self.merge_rounds = []
+
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            while tree:
+                # Greedy matching on the tree: strongest overlaps first, each model in at most one merge
+                used = set()
+                batch = []
+                for index1, index2, weight in sorted(tree, key=lambda edge: edge[2], reverse=True):
+                    if index1 not in used and index2 not in used:
+                        used.update((index1, index2))
+                        # The larger model is the reference frame the smaller one is aligned to
+                        if sizes[index2] > sizes[index1]:
+                            index1, index2 = index2, index1
+                        batch.append((index1, index2))
+                self.merge_rounds.append(batch)
+
+                futures = [executor.submit(self.merge_pair, models[index1], models[index2])
+                           for index1, index2 in batch]
+                merged_into = {}
+                for (index1, index2), future in zip(batch, futures):
+                    models[index1] = future.result()
+                    sizes[index1] = len(self._registered_image_names(models[index1]))
+                    del models[index2]
+                    del sizes[index2]
+                    merged_into[index2] = index1
+
+                # Contract the merged edges; a contracted tree is still a tree
+                contracted = []
+                for index1, index2, weight in tree:
+                    index1 = merged_into.get(index1, index1)
+                    index2 = merged_into.get(index2, index2)
+                    if index1 != index2:
+                        contracted.append((index1, index2, weight))
+                tree = contracted
+
+        return sorted(models.values(), key=lambda model: len(self._registered_image_names(model)), reverse=True)
+
+    @traced("merging.merge_pair")
+    def merge_pair(self, reference, other):
+        """
+        Align one sub-reconstruction to another and merge them
+
+        Args:
+            reference: Reconstruction defining the coordinate frame
+            other: Reconstruction aligned to the reference
+
+        Returns:
+            merged_reconstruction: The merged reconstruction
+        """
+        reference_path, other_path = reference, other
+        aligned = self.align_reconstructions([self._load(reference), self._load(other)])
+        merged = self.merge_reconstructions(aligned)
+        if self.work_directory is None:
+            return merged
+        for path in (reference_path, other_path):
+            self._discard(path)
+        return self._spill(merged)
+
     def align_reconstructions(self, reconstructions):
         """
-        Align multiple sub-reconstructions to a common coordinate system
-        
+        Align multiple sub-reconstructions to the coordinate system of the first one
+
+        Each model is aligned with a robust Sim(3) estimated from shared
+        camera centres and shared 3D tracks. The models after the first are
+        transformed in place (no copies, to keep one model per input in
+        memory); callers that still need the original frame must pass copies.
+
         Args:
-            reconstructions (list): List of sub-reconstructions to align
-            
+            reconstructions (list): List of SubModel, the first one is the reference
+
         Returns:
-            aligned_reconstructions: List of aligned reconstructions
+            aligned_reconstructions: The same SubModel objects, now in the reference frame
         """
-        # TODO: Implement reconstruction alignment
-        # This typically involves finding common points between reconstructions
-        # and applying transformation to align them
-        pass
-    
+        reference = reconstructions[0]
+        for other in reconstructions[1:]:
+            src, dst = find_correspondences(reference, other)
+            alignment = estimate_sim3(src, dst, **self.alignment_cfg)
+            other.transform(alignment['scale'], alignment['rotation'], alignment['translation'])
+            self.alignments.append((reference.num_images, other.num_images, alignment))
+            print(f"Aligned sub-model of {other.num_images} images to {reference.num_images} images: "
+                  f"{alignment['num_inliers']}/{alignment['num_correspondences']} inliers, "
+                  f"RMSE {alignment['rmse']:.4f}, {alignment['num_hypotheses']} hypotheses")
+        return list(reconstructions)
+
     def merge_reconstructions(self, aligned_reconstructions):
         """
         Merge aligned reconstructions into a single consistent model
-        
+
+        Sub-models are streamed in one at a time (paths are loaded only when
+        their turn comes). 3D points are deduplicated through a track index
+        keyed by (merged image index, keypoint index): a point observed by a
+        keypoint that already belongs to a merged point is fused into it,
+        its position averaged over all sub-models containing it. Images
+        shared by several sub-models keep the pose of the first one, and so
+        do cameras (by COLMAP camera id) their intrinsics. The cameras are
+        only kept when every sub-model has them.
+
+        Memory: the output is built in place in buffers whose capacity grows
+        geometrically, and only observations and points not already merged
+        are stored. Peak memory is therefore the merged output (at most
+        twice its size while a buffer grows) plus the track index (16 bytes
+        per merged observation) plus one input model. It is proportional to
+        the deduplicated merged model, which the caller receives in memory,
+        and not to the sum of the inputs.
+
         Args:
-            aligned_reconstructions: List of aligned reconstructions
-            
+            aligned_reconstructions: List of aligned SubModel or .npz paths
+
         Returns:
-            merged_reconstruction: Single merged reconstruction
+            merged_reconstruction: Single merged SubModel
         """
-        # TODO: Implement reconstruction merging
-        # Combine points, images, and cameras from all sub-reconstructions
-        pass
-    
-    def global_bundle_adjustment(self, merged_reconstruction):
+        image_index = {}
+        image_names, rotations, translations, camera_params = [], [], [], []
+        cameras, image_camera_ids = {}, []
+        keep_cameras = True
+        # Output buffers, the first num_points / num_observations rows are in use
+        num_points = num_observations = 0
+        xyz_sums = np.empty((0, 3))
+        error_sums = np.empty(0)
+        point_counts = np.empty(0, dtype=np.int64)
+        points_rgb = np.empty((0, 3), dtype=np.uint8)
+        track_point = np.empty(0, dtype=np.int64)
+        track_image = np.empty(0, dtype=np.int32)
+        track_point2D = np.empty(0, dtype=np.int32)
+        track_xy = np.empty((0, 2))
+        track_index = _TrackIndex()
+
+        for reconstruction in aligned_reconstructions:
+            model = self._load(reconstruction)
+            keep_cameras = keep_cameras and model.cameras is not None
+            if keep_cameras:
+                for camera_id, camera in model.cameras.items():
+                    cameras.setdefault(camera_id, camera)
+
+            # Merged index of every image of the sub-model, appending unseen images
+            local_to_merged = np.empty(model.num_images, dtype=np.int64)
+            for local, name in enumerate(model.image_names):
+                if name not in image_index:
+                    image_index[name] = len(image_names)
+                    image_names.append(name)
+                    rotations.append(model.rotations[local])
+                    translations.append(model.translations[local])
+                    camera_params.append(model.camera_params[local])
+                    if keep_cameras:
+                        image_camera_ids.append(model.image_camera_ids[local])
+                local_to_merged[local] = image_index[name]
+
+            merged_images = local_to_merged[model.track_image]
+            keys = (merged_images << 32) | model.track_point2D.astype(np.int64)
+            indexed_points = track_index.lookup(keys)
+            found = indexed_points >= 0
+
+            # A local point seen through any already indexed keypoint is fused into that merged point
+            point_targets = np.full(model.num_points, -1, dtype=np.int64)
+            np.maximum.at(point_targets, model.track_point[found], indexed_points[found])
+            is_new = point_targets < 0
+            num_new = int(is_new.sum())
+            point_targets[is_new] = num_points + np.arange(num_new)
+
+            existing = ~is_new
+            np.add.at(xyz_sums, point_targets[existing], model.points_xyz[existing])
+            np.add.at(error_sums, point_targets[existing], model.points_error[existing])
+            np.add.at(point_counts, point_targets[existing], 1)
+            for buffer, values in ((xyz_sums, model.points_xyz[is_new]), (error_sums, model.points_error[is_new]),
+                                   (point_counts, 1), (points_rgb, model.points_rgb[is_new])):
+                _reserve(buffer, num_points + num_new)[num_points:num_points + num_new] = values
+            num_points += num_new
+
+            # Observations already present in the merged tracks are dropped
+            new_observations = ~found
+            new_keys, first = np.unique(keys[new_observations], return_index=True)
+            selected = np.flatnonzero(new_observations)[first]
+            new_points = point_targets[model.track_point[selected]]
+            end = num_observations + len(selected)
+            for buffer, values in ((track_point, new_points), (track_image, merged_images[selected]),
+                                   (track_point2D, model.track_point2D[selected]),
+                                   (track_xy, model.track_xy[selected])):
+                _reserve(buffer, end)[num_observations:end] = values
+            num_observations = end
+            track_index.add(new_keys, new_points)
+            del model
+
+        del track_index
+        # Trim the buffers to their used rows, in place
+        for buffer, size in ((xyz_sums, num_points), (error_sums, num_points), (point_counts, num_points),
+                             (points_rgb, num_points), (track_point, num_observations),
+                             (track_image, num_observations), (track_point2D, num_observations),
+                             (track_xy, num_observations)):
+            buffer.resize((size,) + buffer.shape[1:], refcheck=False)
+        xyz_sums /= point_counts[:, None]
+        error_sums /= point_counts
+        return SubModel(image_names, rotations, translations, camera_params,
+                        xyz_sums, points_rgb, error_sums, track_point, track_image, track_point2D, track_xy,
+                        cameras if keep_cameras else None, image_camera_ids if keep_cameras else None)
+
+    @traced("merging.global_bundle_adjustment")
+    def global_bundle_adjustment(self, merged_reconstruction, clusters=None):
         """
         Perform global bundle adjustment on the merged reconstruction
-        
+
+        The first image is held fixed to remove the gauge freedom.
+
         Args:
-            merged_reconstruction: The merged reconstruction to optimize
-            
+            merged_reconstruction: The merged SubModel to optimize, adjusted in place
+            clusters (list): Image names of every cluster, used by the partitioned mode
+
         Returns:
             optimized_reconstruction: Bundle-adjusted reconstruction
         """
-        # TODO: Implement global bundle adjustment
-        # This will refine the merged reconstruction for better accuracy
-        pass
-    
+        if merged_reconstruction.num_observations == 0:
+            return merged_reconstruction
+        if self.ba_mode == 'partitioned' and clusters is not None and len(clusters) > 1:
+            self.ba_statistics = self.partitioned_bundle_adjustment(merged_reconstruction, clusters)
+        elif self.ba_mode not in ('global', 'partitioned'):
+            raise ValueError(f"Unknown bundle adjustment mode: {self.ba_mode}")
+        elif self._bundle_adjustment_backend() == 'pycolmap':
+            self.ba_statistics = self._pycolmap_bundle_adjustment(merged_reconstruction)
+        else:
+            adjuster = SchurBundleAdjuster(max_iterations=self.ba_iterations)
+            self.ba_statistics = adjuster.adjust(merged_reconstruction, fixed_images=[0])
+        print(f"Bundle adjustment ({self.ba_mode}): cost {self.ba_statistics['initial_cost']:.4g} -> "
+              f"{self.ba_statistics['final_cost']:.4g}")
+        return merged_reconstruction
+
+    @traced("merging.partitioned_bundle_adjustment")
+    def partitioned_bundle_adjustment(self, model, clusters):
+        """
+        Distributed bundle adjustment over the clusters with ADMM consensus
+
+        Every observation is assigned to one block (cluster): the block that
+        sees its 3D point most often if it contains the image, otherwise the
+        first cluster containing the image. Cameras and points touched by
+        several blocks are consensus variables. Each round runs the local
+        adjustments of all blocks in a process pool, every block pulled
+        towards the consensus by a quadratic penalty, then sets the consensus
+        to the average of the block estimates and updates the scaled duals.
+        Variables private to a block are written back directly.
+
+        Args:
+            model (SubModel): Merged model, adjusted in place
+            clusters (list): Image names of every cluster
+
+        Returns:
+            dict: initial_cost, final_cost, iterations, num_blocks, num_shared_cameras,
+                num_shared_points and primal_residuals (consensus disagreement per round)
+        """
+        image_index = {name: index for index, name in enumerate(model.image_names)}
+        membership = np.zeros((model.num_images, len(clusters)), dtype=bool)
+        for block, names in enumerate(clusters):
+            membership[[image_index[name] for name in names if name in image_index], block] = True
+        membership[~membership.any(axis=1), 0] = True
+        image_owner = membership.argmax(axis=1)
+
+        observation_owner = image_owner[model.track_image]
+        point_block_counts = sp.csr_matrix((np.ones(model.num_observations), (model.track_point, observation_owner)),
+                                           shape=(model.num_points, len(clusters)))
+        point_home = np.asarray(point_block_counts.argmax(axis=1)).ravel()
+        observation_home = point_home[model.track_point]
+        observation_block = np.where(membership[model.track_image, observation_home], observation_home,
+                                     observation_owner)
+
+        blocks = []
+        camera_counts = np.zeros(model.num_images, dtype=np.int64)
+        point_counts = np.zeros(model.num_points, dtype=np.int64)
+        for block in range(len(clusters)):
+            observations = np.flatnonzero(observation_block == block)
+            if len(observations) == 0:
+                continue
+            cameras = np.unique(model.track_image[observations])
+            points = np.unique(model.track_point[observations])
+            camera_counts[cameras] += 1
+            point_counts[points] += 1
+            blocks.append({'observations': observations, 'cameras': cameras, 'points': points})
+        for block in blocks:
+            block['shared_cameras'] = np.flatnonzero(camera_counts[block['cameras']] > 1)
+            block['shared_points'] = np.flatnonzero(point_counts[block['points']] > 1)
+            block['camera_duals'] = np.zeros((len(block['shared_cameras']), 6))
+            block['point_duals'] = np.zeros((len(block['shared_points']), 3))
+
+        initial_cost = 0.5 * np.sum(reprojection_residuals(model) ** 2)
+        adjuster = SchurBundleAdjuster(max_iterations=self.local_iterations)
+        primal_residuals = []
+        with ProcessPoolExecutor(max_workers=self.num_workers) as executor:
+            for _ in range(self.admm_iterations):
+                futures = [submit_traced(executor, _adjust_block, adjuster, *self._block_problem(model, block))
+                           for block in blocks]
+
+                camera_sums = np.zeros((model.num_images, 6))
+                point_sums = np.zeros((model.num_points, 3))
+                camera_deltas, point_deltas = [], []
+                for block, future in zip(blocks, futures):
+                    local = future.result()
+                    cameras, points = block['cameras'], block['points']
+                    private_cameras = camera_counts[cameras] == 1
+                    private_points = point_counts[points] == 1
+                    model.rotations[cameras[private_cameras]] = local.rotations[private_cameras]
+                    model.translations[cameras[private_cameras]] = local.translations[private_cameras]
+                    model.points_xyz[points[private_points]] = local.points_xyz[private_points]
+
+                    shared_cameras = cameras[block['shared_cameras']]
+                    shared_points = points[block['shared_points']]
+                    camera_delta = camera_tangents(local.rotations[block['shared_cameras']],
+                                                   local.translations[block['shared_cameras']],
+                                                   model.rotations[shared_cameras], model.translations[shared_cameras])
+                    point_delta = local.points_xyz[block['shared_points']] - model.points_xyz[shared_points]
+                    camera_sums[shared_cameras] += camera_delta + block['camera_duals']
+                    point_sums[shared_points] += point_delta + block['point_duals']
+                    camera_deltas.append(camera_delta)
+                    point_deltas.append(point_delta)
+
+                # Consensus: average of the block estimates plus their scaled duals
+                shared_cameras = camera_counts > 1
+                shared_points = point_counts > 1
+                camera_means = camera_sums[shared_cameras] / camera_counts[shared_cameras, None]
+                point_means = point_sums[shared_points] / point_counts[shared_points, None]
+                model.rotations[shared_cameras], model.translations[shared_cameras] = apply_camera_updates(
+                    model.rotations[shared_cameras], model.translations[shared_cameras], camera_means)
+                model.points_xyz[shared_points] += point_means
+                camera_sums[shared_cameras] = camera_means
+                point_sums[shared_points] = point_means
+
+                primal_residual = 0.0
+                for block, camera_delta, point_delta in zip(blocks, camera_deltas, point_deltas):
+                    camera_disagreement = camera_delta - camera_sums[block['cameras'][block['shared_cameras']]]
+                    point_disagreement = point_delta - point_sums[block['points'][block['shared_points']]]
+                    block['camera_duals'] += camera_disagreement
+                    block['point_duals'] += point_disagreement
+                    primal_residual += np.sum(camera_disagreement ** 2) + np.sum(point_disagreement ** 2)
+                primal_residuals.append(float(np.sqrt(primal_residual)))
+
+        return {'initial_cost': initial_cost, 'final_cost': 0.5 * np.sum(reprojection_residuals(model) ** 2),
+                'iterations': self.admm_iterations, 'num_blocks': len(blocks),
+                'num_shared_cameras': int((camera_counts > 1).sum()), 'num_shared_points': int((point_counts > 1).sum()),
+                'primal_residuals': primal_residuals}
+
+    def _bundle_adjustment_backend(self):
+        """
+        Resolve the 'auto' backend to pycolmap when it can be imported, otherwise to the SciPy Schur solver
+        """
+        if self.ba_backend not in ('auto', 'pycolmap', 'schur'):
+            raise ValueError(f"Unknown bundle adjustment backend: {self.ba_backend}")
+        if self.ba_backend != 'auto':
+            return self.ba_backend
+        try:
+            import pycolmap  # noqa: F401
+        except ImportError:
+            return 'schur'
+        return 'pycolmap'
+
+    def _pycolmap_bundle_adjustment(self, model):
+        """
+        Bundle-adjust a model with pycolmap (Ceres), intrinsics held fixed
+
+        The problem is built on the original cameras of the model, shared by
+        their images and with their distortion, when the model has them.
+        Points observed only once are not part of the problem and keep their position.
+        """
+        import pycolmap
+
+        initial_cost = 0.5 * np.sum(reprojection_residuals(model) ** 2)
+        adjusted_points = np.bincount(model.track_point, minlength=model.num_points) >= 2
+        reconstruction = model.to_reconstruction(min_track_length=2)
+        options = pycolmap.BundleAdjustmentOptions()
+        options.refine_focal_length = False
+        options.refine_extra_params = False
+        options.print_summary = False
+        options.ceres.solver_options.max_num_iterations = self.ba_iterations
+        pycolmap.bundle_adjustment(reconstruction, options)
+
+        adjusted = SubModel.from_reconstruction(reconstruction)
+        model.rotations, model.translations = adjusted.rotations, adjusted.translations
+        model.points_xyz[adjusted_points] = adjusted.points_xyz
+        return {'initial_cost': initial_cost, 'final_cost': 0.5 * np.sum(reprojection_residuals(model) ** 2),
+                'iterations': None, 'num_observations': model.num_observations}
+
+    def _block_problem(self, model, block):
+        """
+        Local model, fixed images and consensus priors of one block of the partitioned adjustment
+        """
+        cameras, points, observations = block['cameras'], block['points'], block['observations']
+        local = SubModel([model.image_names[index] for index in cameras], model.rotations[cameras],
+                         model.translations[cameras], model.camera_params[cameras], model.points_xyz[points],
+                         track_point=np.searchsorted(points, model.track_point[observations]),
+                         track_image=np.searchsorted(cameras, model.track_image[observations]),
+                         track_point2D=model.track_point2D[observations], track_xy=model.track_xy[observations])
+        shared_cameras = cameras[block['shared_cameras']]
+        camera_priors = {'indices': block['shared_cameras'], 'rotations': model.rotations[shared_cameras],
+                         'translations': model.translations[shared_cameras], 'targets': -block['camera_duals'],
+                         'weight': self.admm_penalty}
+        point_priors = {'indices': block['shared_points'],
+                        'targets': model.points_xyz[points[block['shared_points']]] - block['point_duals'],
+                        'weight': self.admm_penalty}
+        # The first image of the merged model anchors the gauge in every block that contains it
+        fixed_images = [0] if len(cameras) and cameras[0] == 0 else []
+        return local, fixed_images, camera_priors, point_priors
+
+    @traced("merging.merge_and_refine")
     def merge_and_refine(self, reconstructions):
         """
         Complete pipeline for merging and refining sub-reconstructions
-        
+
         Args:
             reconstructions (list): List of sub-reconstructions
-            
+
         Returns:
             final_reconstruction: Final refined and merged reconstruction
         """
-        # TODO: Implement complete merging and refinement pipeline
-        aligned = self.align_reconstructions(reconstructions)
-        merged = self.merge_reconstructions(aligned)
-        refined = self.global_bundle_adjustment(merged)
-        return refined
\ No newline at end of file
+        if not reconstructions:
+            return None
+        if self.work_directory is not None:
+            # Convert COLMAP models to .npz one at a time so that they can be streamed later
+            reconstructions = [reconstruction if isinstance(reconstruction, str) and reconstruction.endswith('.npz')
+                               else self._spill(self._load(reconstruction))
+                               for reconstruction in reconstructions]
+        else:
+            reconstructions = [self._load(reconstruction) for reconstruction in reconstructions]
+        # Cluster membership is kept for the partitioned bundle adjustment
+        clusters = [self._registered_image_names(reconstruction) for reconstruction in reconstructions]
+        merged_components = self.merge_hierarchically(reconstructions)
+        if len(merged_components) > 1:
+            print(f"Cluster graph has {len(merged_components)} connected components, "
+                  f"keeping the largest merged model")
+        for component in merged_components[1:]:
+            self._discard(component)
+        merged = self._load(merged_components[0])
+        self._discard(merged_components[0])
+        refined = self.global_bundle_adjustment(merged, clusters)
+        return refined
+
+    @staticmethod
+    def _registered_image_names(reconstruction):
+        """
+        Names of the images registered in a reconstruction
+        """
+        if hasattr(reconstruction, 'image_names'):
+            return set(reconstruction.image_names)
+        if isinstance(reconstruction, (str, os.PathLike)) and str(reconstruction).endswith('.npz'):
+            # Only the image_names member of the archive is read
+            with np.load(reconstruction) as data:
+                return set(data['image_names'].tolist())
+        if isinstance(reconstruction, (str, os.PathLike)):
+            # COLMAP model directory, loaded like the merge inputs
+            return set(SubReconstructionMerger._load(reconstruction).image_names)
+        # pycolmap.Reconstruction
+        return {image.name for image in reconstruction.images.values()}
+
+    @staticmethod
+    def _load(reconstruction):
+        """
+        SubModel of a reconstruction given as SubModel, pycolmap.Reconstruction or path
+        """
+        if isinstance(reconstruction, SubModel):
+            return reconstruction
+        if isinstance(reconstruction, (str, os.PathLike)):
+            return SubModel.read(reconstruction)
+        return SubModel.from_reconstruction(reconstruction)
+
+    def _spill(self, model):
+        """
+        Write a model to the work directory and return its path
+        """
+        os.makedirs(self.work_directory, exist_ok=True)
+        path = os.path.join(self.work_directory, f"submodel_{next(self._spill_counter)}.npz")
+        model.save(path)
+        self._spilled.add(path)
+        return path
+
+    def _discard(self, reconstruction):
+        """
+        Remove an intermediate file written by _spill, other inputs are left untouched
+        """
+        if isinstance(reconstruction, str) and reconstruction in self._spilled:
+            self._spilled.discard(reconstruction)
+            os.remove(reconstruction)
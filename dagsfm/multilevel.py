@@ -0,0 +1,447 @@
+"""
+Multilevel graph partitioning for DAGSfM-Python
+
+An alternative to spectral N-cut in the spirit of METIS: the view graph is
+coarsened by heavy-edge matching until it has a few nodes per part, the
+coarsest graph is cut by recursive greedy graph-growing bisection, and the
+cut is projected back level by level, with boundary refinement at every
+level: vectorized greedy moves of boundary nodes under a balance
+constraint on all levels, plus Fiduccia-Mattheyses hill climbing on the
+levels small enough for a sequential pass.
+"""
+
+import heapq
+
+import numpy as np
+import scipy.sparse as sp
+
+
+def cut_weight(rows, cols, weights, labels):
+    """
+    Total weight of the edges between different parts
+
+    Args:
+        rows (np.ndarray): Source node of every directed edge (each undirected edge twice)
+        cols (np.ndarray): Target node of every directed edge
+        weights (np.ndarray): Weight of every directed edge
+        labels (np.ndarray): Part of every node
+
+    Returns:
+        float: Cut weight, every undirected edge counted once
+    """
+    return float(weights[labels[rows] != labels[cols]].sum()) / 2
+
+
+def heavy_edge_matching(rows, cols, weights, node_weights, max_node_weight, rng, rounds=4):
+    """
+    Match every node with at most one neighbour, preferring heavy edges
+
+    Every round, each unmatched node proposes to its heaviest unmatched
+    neighbour (ties broken randomly) and mutual proposals are matched; the
+    merged weight of a pair may not exceed max_node_weight.
+
+    Args:
+        rows, cols, weights (np.ndarray): Symmetric directed edge arrays
+        node_weights (np.ndarray): Weight of every node
+        max_node_weight (float): Largest weight of a matched pair
+        rng (np.random.Generator): Random generator for tie breaking
+        rounds (int): Number of proposal rounds
+
+    Returns:
+        np.ndarray: Matched partner of every node, the node itself if unmatched
+    """
+    num_nodes = len(node_weights)
+    partner = np.arange(num_nodes)
+    matched = np.zeros(num_nodes, dtype=bool)
+    isolated = np.flatnonzero(np.bincount(rows, minlength=num_nodes) == 0)
+    keys = weights * (1 + 1e-6 * rng.random(len(weights)))
+    allowed = node_weights[rows] + node_weights[cols] <= max_node_weight
+    rows, cols, keys = rows[allowed], cols[allowed], keys[allowed]
+
+    for _ in range(rounds):
+        free = ~matched[rows] & ~matched[cols]
+        rows, cols, keys = rows[free], cols[free], keys[free]
+        if len(rows) == 0:
+            break
+        # Heaviest edge of every row: sort by row, then by decreasing weight
+        order = np.lexsort((-keys, rows))
+        proposers, first = np.unique(rows[order], return_index=True)
+        proposal = np.full(num_nodes, -1)
+        proposal[proposers] = cols[order][first]
+        mutual = proposers[proposal[proposal[proposers]] == proposers]
+        if len(mutual) == 0:
+            break
+        partner[mutual] = proposal[mutual]
+        matched[mutual] = True
+
+    # Nodes without edges are paired with each other, lightest first, so that they do not stall coarsening
+    isolated = isolated[np.argsort(node_weights[isolated], kind='stable')]
+    first, second = isolated[0:len(isolated) - 1:2], isolated[1::2]
+    fits = node_weights[first] + node_weights[second] <= max_node_weight
+    partner[first[fits]], partner[second[fits]] = second[fits], first[fits]
+    return partner
+
+
+def coarsen(rows, cols, weights, node_weights, partner):
+    """
+    Contract matched pairs into single nodes
+
+    Args:
+        rows, cols, weights (np.ndarray): Symmetric directed edge arrays
+        node_weights (np.ndarray): Weight of every node
+        partner (np.ndarray): Result of heavy_edge_matching
+
+    Returns:
+        tuple: (coarse node of every fine node, coarse rows, cols, weights, coarse node weights)
+    """
+    representative = np.minimum(np.arange(len(partner)), partner)
+    _, mapping = np.unique(representative, return_inverse=True)
+    num_coarse = int(mapping.max()) + 1 if len(mapping) else 0
+    coarse_rows, coarse_cols = mapping[rows], mapping[cols]
+    # Edges inside a matched pair disappear, parallel edges are summed
+    keep = coarse_rows != coarse_cols
+    adjacency = sp.coo_matrix((weights[keep], (coarse_rows[keep], coarse_cols[keep])),
+                              shape=(num_coarse, num_coarse)).tocsr()
+    adjacency.sum_duplicates()
+    adjacency = adjacency.tocoo()
+    coarse_weights = np.bincount(mapping, weights=node_weights, minlength=num_coarse)
+    return mapping, adjacency.row, adjacency.col, adjacency.data, coarse_weights
+
+
+def refine_partition(rows, cols, weights, node_weights, labels, max_part_weights, passes=8):
+    """
+    Greedy boundary refinement under a balance constraint
+
+    Every pass computes, for all boundary nodes at once, the edge weight
+    connecting them to each adjacent part, and moves nodes to the part
+    with the largest gain (best gains first) while the target part stays
+    within its maximum weight. Nodes of overweight parts may also move at a
+    loss. Passes alternate between moves towards higher and lower part
+    ids, so two neighbours never swap in the same pass, and a pass that
+    does not improve (overweight, cut) is undone.
+
+    Args:
+        rows, cols, weights (np.ndarray): Symmetric directed edge arrays
+        node_weights (np.ndarray): Weight of every node
+        labels (np.ndarray): Part of every node, refined in place
+        max_part_weights (np.ndarray): Maximum weight of every part
+        passes (int): Maximum number of passes
+
+    Returns:
+        np.ndarray: The refined labels
+    """
+    num_parts = len(max_part_weights)
+    part_weights = np.bincount(labels, weights=node_weights, minlength=num_parts)
+
+    def objective():
+        overweight = float(np.maximum(part_weights - max_part_weights, 0).sum())
+        return overweight, cut_weight(rows, cols, weights, labels)
+
+    best = objective()
+    stalled = 0
+    for iteration in range(passes):
+        external = labels[rows] != labels[cols]
+        overweight_parts = part_weights > max_part_weights
+        boundary = np.zeros(len(labels), dtype=bool)
+        boundary[rows[external]] = True
+        mask = boundary[rows]
+        if not mask.any():
+            break
+
+        candidate_rows, candidate_parts = rows[mask], labels[cols[mask]]
+        key = candidate_rows.astype(np.int64) * num_parts + candidate_parts
+        unique_keys, inverse = np.unique(key, return_inverse=True)
+        connection = np.bincount(inverse, weights=weights[mask])
+        nodes, parts = unique_keys // num_parts, unique_keys % num_parts
+
+        own = np.zeros(len(labels))
+        is_own = parts == labels[nodes]
+        own[nodes[is_own]] = connection[is_own]
+        gains = connection - own[nodes]
+        direction = parts > labels[nodes] if iteration % 2 == 0 else parts < labels[nodes]
+        useful = ~is_own & direction & ((gains > 0) | overweight_parts[labels[nodes]])
+        nodes, parts, gains = nodes[useful], parts[useful], gains[useful]
+        if len(nodes) == 0:
+            stalled += 1
+            if stalled == 2:
+                break
+            continue
+
+        # Best target part of every node, then nodes in order of decreasing gain
+        order = np.lexsort((-gains, nodes))
+        _, first = np.unique(nodes[order], return_index=True)
+        choice = order[first]
+        choice = choice[np.argsort(-gains[choice], kind='stable')]
+
+        moved = []
+        for node, part, gain in zip(nodes[choice].tolist(), parts[choice].tolist(), gains[choice].tolist()):
+            source = labels[node]
+            weight = node_weights[node]
+            if part_weights[part] + weight > max_part_weights[part]:
+                continue
+            if gain <= 0 and part_weights[source] <= max_part_weights[source]:
+                continue
+            labels[node] = part
+            part_weights[source] -= weight
+            part_weights[part] += weight
+            moved.append((node, source, part))
+
+        current = objective()
+        if moved and current < best:
+            best = current
+            stalled = 0
+            continue
+        for node, source, part in moved:
+            labels[node] = source
+            part_weights[part] -= node_weights[node]
+            part_weights[source] += node_weights[node]
+        stalled += 1
+        if stalled == 2:
+            break
+    return labels
+
+
+def fm_refine(adjacency, node_weights, labels, max_part_weights, passes=4, max_stall_moves=50):
+    """
+    k-way Fiduccia-Mattheyses refinement with hill climbing
+
+    Unlike refine_partition, a pass keeps moving the best boundary node even
+    at a loss (every node at most once per pass) and finally rolls back to
+    the best prefix of moves, so groups of nodes that only pay off together
+    (e.g. shifting a cut by a whole row) are found. A pass ends after
+    max_stall_moves moves without a new best. Sequential, hence used on the
+    coarse levels only.
+
+    Args:
+        adjacency (scipy.sparse.csr_matrix): Symmetric adjacency
+        node_weights (np.ndarray): Weight of every node
+        labels (np.ndarray): Part of every node, refined in place
+        max_part_weights (np.ndarray): Maximum weight of every part
+        passes (int): Maximum number of passes
+        max_stall_moves (int): Moves without improvement after which a pass stops
+
+    Returns:
+        np.ndarray: The refined labels
+    """
+    num_nodes, num_parts = len(labels), len(max_part_weights)
+    indptr, indices, data = adjacency.indptr, adjacency.indices, adjacency.data
+    node_weights = np.asarray(node_weights, dtype=np.float64)
+    max_part_weights = np.asarray(max_part_weights, dtype=np.float64)
+    # connection[i, p]: edge weight between node i and part p
+    connection = np.asarray((adjacency @ sp.csr_matrix(
+        (np.ones(num_nodes), (np.arange(num_nodes), labels)), shape=(num_nodes, num_parts))).todense())
+    part_weights = np.bincount(labels, weights=node_weights, minlength=num_parts)
+
+    def best_move(node):
+        own = labels[node]
+        targets = np.flatnonzero(connection[node] > 0)
+        targets = targets[(targets != own) & (part_weights[targets] + node_weights[node] <= max_part_weights[targets])]
+        if len(targets) == 0:
+            return None, None
+        target = targets[np.argmax(connection[node, targets])]
+        return connection[node, target] - connection[node, own], target
+
+    for _ in range(passes):
+        heap = []
+        for node in np.flatnonzero((connection > 0).sum(axis=1) > 1).tolist():
+            gain, target = best_move(node)
+            if target is not None:
+                heap.append((-gain, node))
+        heapq.heapify(heap)
+        locked = np.zeros(num_nodes, dtype=bool)
+        overweight = float(np.maximum(part_weights - max_part_weights, 0).sum())
+        best = (overweight, 0.0)
+        moves, best_length, total_gain, stall = [], 0, 0.0, 0
+        while heap and stall < max_stall_moves:
+            key, node = heapq.heappop(heap)
+            if locked[node]:
+                continue
+            gain, target = best_move(node)
+            if target is None:
+                continue
+            if -key != gain:
+                heapq.heappush(heap, (-gain, node))  # stale entry, requeue with the current gain
+                continue
+            source = labels[node]
+            locked[node] = True
+            labels[node] = target
+            part_weights[source] -= node_weights[node]
+            part_weights[target] += node_weights[node]
+            total_gain += gain
+            moves.append((node, source, target))
+            for position in range(indptr[node], indptr[node + 1]):
+                neighbor, weight = indices[position], data[position]
+                connection[neighbor, source] -= weight
+                connection[neighbor, target] += weight
+                if not locked[neighbor]:
+                    neighbor_gain, neighbor_target = best_move(neighbor)
+                    if neighbor_target is not None:
+                        heapq.heappush(heap, (-neighbor_gain, neighbor))
+            current = (float(np.maximum(part_weights - max_part_weights, 0).sum()), -total_gain)
+            if current < best:
+                best, best_length, stall = current, len(moves), 0
+            else:
+                stall += 1
+
+        # Roll back to the best prefix
+        for node, source, target in reversed(moves[best_length:]):
+            labels[node] = source
+            part_weights[target] -= node_weights[node]
+            part_weights[source] += node_weights[node]
+            for position in range(indptr[node], indptr[node + 1]):
+                connection[indices[position], target] -= data[position]
+                connection[indices[position], source] += data[position]
+        if best_length == 0:
+            break
+    return labels
+
+
+def grow_bisection(adjacency, node_weights, target_weight, rng, tries=4):
+    """
+    Greedy graph-growing bisection of a small graph
+
+    A region is grown from a seed node by repeatedly adding the frontier
+    node with the largest (edge weight into the region - edge weight out of
+    it) until it holds target_weight; disconnected leftovers are reached by
+    reseeding. The smallest cut over several seeds wins.
+
+    Args:
+        adjacency (scipy.sparse.csr_matrix): Symmetric adjacency
+        node_weights (np.ndarray): Weight of every node
+        target_weight (float): Weight of the grown part (label 0)
+        rng (np.random.Generator): Random generator for the seeds
+        tries (int): Number of seeds
+
+    Returns:
+        np.ndarray: 0/1 label of every node
+    """
+    num_nodes = adjacency.shape[0]
+    indptr, indices, data = adjacency.indptr, adjacency.indices, adjacency.data
+    degree = np.asarray(adjacency.sum(axis=1)).ravel()
+    coo = adjacency.tocoo()
+    best_labels, best_cut = None, np.inf
+
+    for seed in rng.permutation(num_nodes)[:tries].tolist():
+        labels = np.ones(num_nodes, dtype=np.int64)
+        # Gain of adding a node: 2 * (weight into the region) - degree
+        into_region = np.zeros(num_nodes)
+        heap = [(0.0, seed)]
+        grown = 0.0
+        unvisited = iter(rng.permutation(num_nodes).tolist())
+        while grown < target_weight:
+            while heap and labels[heap[0][1]] == 0:
+                heapq.heappop(heap)
+            if not heap:
+                # Disconnected remainder: continue from another node
+                node = next((node for node in unvisited if labels[node] == 1), None)
+                if node is None:
+                    break
+                heap = [(0.0, node)]
+                continue
+            _, node = heapq.heappop(heap)
+            # Stop before a node that would overshoot the target by more than it is missed now
+            if grown > 0 and grown + node_weights[node] - target_weight > target_weight - grown:
+                break
+            labels[node] = 0
+            grown += node_weights[node]
+            for position in range(indptr[node], indptr[node + 1]):
+                neighbor = indices[position]
+                if labels[neighbor] == 1:
+                    into_region[neighbor] += data[position]
+                    heapq.heappush(heap, (-(2 * into_region[neighbor] - degree[neighbor]), neighbor))
+        cut = cut_weight(coo.row, coo.col, coo.data, labels)
+        if cut < best_cut:
+            best_labels, best_cut = labels, cut
+    return best_labels
+
+
+def initial_partition(adjacency, node_weights, num_parts, imbalance, rng, passes=8):
+    """
+    k-way partition of the coarsest graph by recursive bisection
+
+    Args:
+        adjacency (scipy.sparse.csr_matrix): Symmetric adjacency
+        node_weights (np.ndarray): Weight of every node
+        num_parts (int): Number of parts
+        imbalance (float): Allowed relative excess weight of a part
+        rng (np.random.Generator): Random generator
+        passes (int): FM passes after every bisection
+
+    Returns:
+        np.ndarray: Part of every node, 0..num_parts-1
+    """
+    labels = np.zeros(adjacency.shape[0], dtype=np.int64)
+    pending = [(np.arange(adjacency.shape[0]), num_parts, 0)]
+    while pending:
+        nodes, parts, offset = pending.pop()
+        if parts == 1 or len(nodes) == 0:
+            labels[nodes] = offset
+            continue
+        left_parts = parts // 2
+        sub_adjacency = adjacency[nodes][:, nodes].tocsr()
+        sub_weights = node_weights[nodes]
+        total = sub_weights.sum()
+        fractions = np.array([left_parts, parts - left_parts]) / parts
+        halves = grow_bisection(sub_adjacency, sub_weights, total * fractions[0], rng)
+        halves = fm_refine(sub_adjacency, sub_weights, halves, total * fractions * (1 + imbalance), passes)
+        pending.append((nodes[halves == 0], left_parts, offset))
+        pending.append((nodes[halves == 1], parts - left_parts, offset + left_parts))
+    return labels
+
+
+def multilevel_partition(adjacency, num_parts, imbalance=0.1, coarsest_nodes_per_part=30, passes=8, seed=0,
+                         fm_max_entries=200000):
+    """
+    Partition a weighted graph into num_parts balanced parts with a small cut
+
+    Args:
+        adjacency (scipy.sparse matrix or np.ndarray): Symmetric (n, n) similarity matrix
+        num_parts (int): Number of parts k
+        imbalance (float): Allowed relative excess of a part over total weight / k
+        coarsest_nodes_per_part (int): Coarsening stops at about this many nodes per part
+        passes (int): Maximum refinement passes per level
+        seed (int): Random seed
+        fm_max_entries (int): Levels with nodes * num_parts up to this size are also refined with FM
+
+    Returns:
+        np.ndarray: Part label of every node, 0..num_parts-1
+    """
+    # Copied, the diagonal is cleared below and the caller's matrix must not change
+    adjacency = sp.csr_matrix(adjacency, dtype=np.float64, copy=True)
+    num_nodes = adjacency.shape[0]
+    num_parts = max(1, min(num_parts, num_nodes))
+    if num_parts == 1:
+        return np.zeros(num_nodes, dtype=np.int64)
+    rng = np.random.default_rng(seed)
+    adjacency.setdiag(0)
+    adjacency.eliminate_zeros()
+    coo = adjacency.tocoo()
+    rows, cols, weights = coo.row.astype(np.int64), coo.col.astype(np.int64), coo.data
+    node_weights = np.ones(num_nodes)
+
+    # Coarsening: keep every level to project the partition back
+    levels = []
+    coarsest_size = max(coarsest_nodes_per_part * num_parts, 2 * num_parts)
+    max_node_weight = 1.5 * num_nodes / coarsest_size
+    while len(node_weights) > coarsest_size:
+        partner = heavy_edge_matching(rows, cols, weights, node_weights, max_node_weight, rng)
+        mapping, coarse_rows, coarse_cols, coarse_weights, coarse_node_weights = coarsen(
+            rows, cols, weights, node_weights, partner)
+        if len(coarse_node_weights) > 0.95 * len(node_weights):
+            break  # Matching no longer shrinks the graph (e.g. only isolated nodes are left)
+        levels.append((mapping, rows, cols, weights, node_weights))
+        rows, cols, weights, node_weights = coarse_rows, coarse_cols, coarse_weights, coarse_node_weights
+
+    total = node_weights.sum()
+    max_part_weights = np.full(num_parts, (1 + imbalance) * total / num_parts)
+    coarse_adjacency = sp.csr_matrix((weights, (rows, cols)), shape=(len(node_weights),) * 2)
+    labels = initial_partition(coarse_adjacency, node_weights, num_parts, imbalance, rng, passes)
+    labels = fm_refine(coarse_adjacency, node_weights, labels, max_part_weights, passes)
+
+    # Uncoarsening: vectorized greedy refinement at every level, FM hill climbing while the level is small
+    for mapping, rows, cols, weights, node_weights in reversed(levels):
+        labels = refine_partition(rows, cols, weights, node_weights, labels[mapping], max_part_weights, passes)
+        if len(node_weights) * num_parts <= fm_max_entries:
+            adjacency = sp.csr_matrix((weights, (rows, cols)), shape=(len(node_weights),) * 2)
+            labels = fm_refine(adjacency, node_weights, labels, max_part_weights, passes)
+    return labels
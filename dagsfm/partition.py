@@ -2,11 +2,16 @@
 使用N-cut算法进行场景分割的模块
 """
 import yaml
-import pycolmap
 import numpy as np
-import networkx as nx
+import scipy.sparse as sp
 from sklearn.cluster import SpectralClustering
 
+from dagsfm.database import slice_database
+from dagsfm.features import FeatureMatcher
+from dagsfm.multilevel import multilevel_partition
+from dagsfm.tracing import traced
+from dagsfm.view_graph import ViewGraph
+
 
 class NcutPartitioner:
     """
@@ -22,15 +27,33 @@ class NcutPartitioner:
             database_path (str): COLMAP数据库文件的路径
         """
         self.database_path = database_path
-        self.graph = nx.Graph()
+        self.graph = ViewGraph()
         self.images = {}  # image_id -> image_name
         self.lost_egdes = []
         self.clusters = {}
         self.expanded_clusters = {}
 
+        # 扩展阶段的成员索引：聚类图像集合、图像->聚类集合、重复节点计数、聚类对重叠计数
+        self._cluster_images = None
+        self._image_clusters = None
+        self._repeated_node_counts = None
+        self._pair_overlap_counts = None
+
         # 默认配置参数
         self.config = {
             'ncut_k': 5,
+            'partition_mode': 'flat',
+            'max_cluster_size': 100,
+            'min_cluster_size': 10,
+            'edge_weighting': 'inliers',
+            'min_inliers': 0,
+            'keep_largest_component': True,
+            'min_edge_weight': 0,
+            'max_neighbors': None,
+            'ncut_engine': 'dense',
+            'eigen_solver': 'arpack',
+            'partition_method': 'spectral',
+            'multilevel_imbalance': 0.1,
             'expansion_ratio': 0.2,
             'max_image_overlap': 5,
             'completeness_ratio': 0.8
@@ -58,38 +81,72 @@ class NcutPartitioner:
         except Exception as e:
             print(f"加载配置文件时出错: {e}。使用默认参数。")
 
+    @traced("partition.load_database")
     def load_database(self):
         """
         从COLMAP数据库加载数据并构建初始视图图
         """
-        # 使用pycolmap加载数据库
-        db = pycolmap.Database(self.database_path)
-        
-        # 读取所有图像
-        images = db.read_all_images()
-
-        # 将图像ID和名称添加到self.images字典中，并添加为图的节点
-        for image in images:
-            self.images[image.image_id] = image.name
-            self.graph.add_node(image.image_id, name=image.name)
-        
-        # 为图添加有权边，匹配内点数量作为权重
-        pair_ids, two_view_geometries = db.read_two_view_geometries()
-        for i, pair_id in enumerate(pair_ids):
-            pair = db.pair_id_to_image_pair(pair_id)
-            inlier_count = len(two_view_geometries[i].inlier_matches)
-            self.graph.add_edge(pair[0], pair[1], weight=inlier_count)
+        # 视图图统一由FeatureMatcher.build_matching_graph构建：直接从SQLite批量读取图像与匹配对，
+        # 内点数取自two_view_geometries表的rows列，按edge_weighting计算边权重并剔除内点过少的匹配对
+        graph = FeatureMatcher().build_matching_graph(self.database_path,
+                                                      weighting=self.config['edge_weighting'],
+                                                      min_inliers=self.config['min_inliers'])
+        self.set_view_graph(graph)
             
         # 打印图的相关信息
         print(f"图信息:")
-        print(f"  节点数(图像): {self.graph.number_of_nodes()}")
-        print(f"  边数(匹配): {self.graph.number_of_edges()}")
-        if self.graph.number_of_nodes() > 0:
-            degrees = [degree for _, degree in self.graph.degree()]
+        print(f"  节点数(图像): {self.graph.num_nodes}")
+        print(f"  边数(匹配): {self.graph.num_edges}")
+        if self.graph.num_nodes > 0:
+            degrees = self.graph.degrees()
             print(f"  平均节点度数: {np.mean(degrees):.2f}")
             print(f"  最大节点度数: {np.max(degrees)}")
             print(f"  最小节点度数: {np.min(degrees)}")
     
+    def set_view_graph(self, graph):
+        """
+        直接使用已构建的视图图(如FeatureMatcher.build_matching_graph的结果)，无需再次读取数据库
+        
+        Args:
+            graph (ViewGraph): 带图像名称的视图图
+        """
+        self.graph = graph
+        names = graph.names if graph.names is not None else [str(image_id) for image_id in graph.image_ids]
+        self.images.update(zip(graph.image_ids.tolist(), names))
+
+    @traced("partition.filter_view_graph")
+    def filter_view_graph(self):
+        """
+        在分割前过滤视图图：剔除弱边、限制每张图像的邻居数并只保留最大连通分量
+        
+        所有步骤均在边数组上向量化完成。剔除弱边与限制邻居数可能使图断开，因此最后再取最大连通分量；
+        不在最大连通分量中的图像无法与其余图像配准，不参与分割
+        
+        Returns:
+            ViewGraph: 过滤后的视图图
+        """
+        graph = self.graph
+        num_nodes, num_edges = graph.num_nodes, graph.num_edges
+
+        # 剔除权重低于min_edge_weight的边(edge_weighting为inliers时即内点数阈值)
+        min_edge_weight = self.config.get('min_edge_weight', 0)
+        if min_edge_weight:
+            graph = graph.edge_subgraph(graph.edge_weights >= min_edge_weight)
+
+        # 只保留每张图像权重最大的max_neighbors条边(任一端点保留即保留该边)
+        max_neighbors = self.config.get('max_neighbors')
+        if max_neighbors:
+            graph = graph.edge_subgraph(graph.top_k_edges(max_neighbors))
+
+        if self.config.get('keep_largest_component', True):
+            graph = graph.largest_connected_component()
+
+        self.graph = graph
+        if graph.num_nodes != num_nodes or graph.num_edges != num_edges:
+            print(f"视图图过滤: 图像 {num_nodes} -> {graph.num_nodes}，边 {num_edges} -> {graph.num_edges}")
+        return graph
+
+    @traced("partition.compute_similarity_matrix")
     def compute_similarity_matrix(self):
         """
         根据视图图中的内点数计算相似性矩阵
@@ -98,22 +155,30 @@ class NcutPartitioner:
             np.ndarray: 大小为(n, n)的相似性矩阵，其中n是节点数
             list: 与矩阵索引对应的节点ID列表
         """
-        nodes = list(self.graph.nodes())
+        nodes = self.graph.image_ids.tolist()
         n = len(nodes)
-        node_to_idx = {node: idx for idx, node in enumerate(nodes)}
         
         # 初始化相似性矩阵
         similarity_matrix = np.zeros((n, n))
         
-        # 填充相似性值
-        for node1, node2, data in self.graph.edges(data=True):
-            i, j = node_to_idx[node1], node_to_idx[node2]
-            weight = data.get('weight', 0)
-            similarity_matrix[i, j] = weight
-            similarity_matrix[j, i] = weight  # 对称矩阵
+        # 填充相似性值(对称矩阵)
+        similarity_matrix[self.graph.edge_src, self.graph.edge_dst] = self.graph.edge_weights
+        similarity_matrix[self.graph.edge_dst, self.graph.edge_src] = self.graph.edge_weights
             
         return similarity_matrix, nodes
+
+    @traced("partition.compute_sparse_similarity_matrix")
+    def compute_sparse_similarity_matrix(self):
+        """
+        直接由边数组构建稀疏(CSR)相似性矩阵，内存随边数而非节点数平方增长
+        
+        Returns:
+            scipy.sparse.csr_matrix: 大小为(n, n)的对称稀疏相似性矩阵
+            list: 与矩阵索引对应的节点ID列表
+        """
+        return self.graph.adjacency(), self.graph.image_ids.tolist()
     
+    @traced("partition.normalized_cut")
     def normalized_cut(self, k):
         """
         使用谱聚类执行归一化割聚类
@@ -125,60 +190,183 @@ class NcutPartitioner:
             dict: cluster_id到该聚类中image_ids列表的映射
         """
         # 如果尚未加载数据，则加载数据
-        if self.graph.number_of_nodes() == 0:
+        if self.graph.num_nodes == 0:
             self.load_database()
             
         # 获取相似性矩阵
-        similarity_matrix, nodes = self.compute_similarity_matrix()
+        similarity_matrix, nodes = self._compute_engine_similarity_matrix()
         
         # 处理k大于节点数的情况
         num_nodes = len(nodes)
         if k > num_nodes:
             k = num_nodes
             
-        # 执行谱聚类
+        # 执行谱聚类或多层图分割
+        cluster_labels = self._partition_labels(similarity_matrix, k)
+        
+        return self._assign_clusters(nodes, cluster_labels)
+
+    @traced("partition.recursive_bisection")
+    def recursive_bisection(self, max_cluster_size=None, min_cluster_size=None):
+        """
+        递归二分割：不断对超过max_cluster_size的子块执行二路N-cut，
+        若二分后某一侧小于min_cluster_size则停止分割该子块
+        
+        Args:
+            max_cluster_size (int): 子块的最大图像数
+            min_cluster_size (int): 子块的最小图像数
+            
+        Returns:
+            dict: cluster_id到该聚类中image_ids列表的映射
+        """
+        # 使用配置中的默认值或传入的参数
+        if max_cluster_size is None:
+            max_cluster_size = self.config['max_cluster_size']
+        if min_cluster_size is None:
+            min_cluster_size = self.config['min_cluster_size']
+
+        # 如果尚未加载数据，则加载数据
+        if self.graph.num_nodes == 0:
+            self.load_database()
+
+        # 相似性矩阵只计算一次，子块通过索引取子矩阵
+        similarity_matrix, nodes = self._compute_engine_similarity_matrix()
+        cluster_labels = np.zeros(len(nodes), dtype=np.int64)
+
+        pending = [np.arange(len(nodes))]
+        num_clusters = 0
+        while pending:
+            indices = pending.pop()
+            if len(indices) <= max_cluster_size or len(indices) < 2 * min_cluster_size:
+                cluster_labels[indices] = num_clusters
+                num_clusters += 1
+                continue
+
+            labels = self._partition_labels(self._sub_matrix(similarity_matrix, indices), 2)
+            parts = [indices[labels == 0], indices[labels == 1]]
+
+            # 二分结果过小(例如只切下几张弱连接图像)或有一侧为空时不再继续分割该子块，
+            # 否则同样的子块会被无限次重复分割
+            if min(len(part) for part in parts) < max(1, min_cluster_size):
+                print(f"子块({len(indices)} 张图像)的二分结果小于最小子块大小 {min_cluster_size}，停止分割")
+                cluster_labels[indices] = num_clusters
+                num_clusters += 1
+                continue
+
+            pending.extend(parts)
+
+        return self._assign_clusters(nodes, cluster_labels)
+
+    def _compute_engine_similarity_matrix(self):
+        """
+        根据配置的N-cut引擎计算相似性矩阵
+        
+        Returns:
+            np.ndarray 或 scipy.sparse.csr_matrix: 相似性矩阵
+            list: 与矩阵索引对应的节点ID列表
+        """
+        # 稀疏引擎直接构建CSR矩阵，避免分配n x n的稠密矩阵；多层图分割只使用稀疏矩阵
+        engine = self.config.get('ncut_engine', 'dense')
+        if engine == 'sparse' or self.config.get('partition_method', 'spectral') == 'multilevel':
+            return self.compute_sparse_similarity_matrix()
+        if engine == 'dense':
+            return self.compute_similarity_matrix()
+        raise ValueError(f"未知的N-cut引擎: {engine}，可选值为 'dense' 或 'sparse'")
+
+    @staticmethod
+    def _sub_matrix(similarity_matrix, indices):
+        """
+        取相似性矩阵中indices对应的行和列
+        """
+        if sp.issparse(similarity_matrix):
+            return similarity_matrix[indices][:, indices]
+        return similarity_matrix[np.ix_(indices, indices)]
+
+    def _partition_labels(self, similarity_matrix, k):
+        """
+        按配置的partition_method将相似性矩阵分为k个子块
+        
+        Args:
+            similarity_matrix: 稠密或稀疏相似性矩阵
+            k (int): 聚类数
+            
+        Returns:
+            np.ndarray: 聚类标签
+        """
+        method = self.config.get('partition_method', 'spectral')
+        if method == 'spectral':
+            return self._spectral_labels(similarity_matrix, k)
+        if method == 'multilevel':
+            # 重边匹配粗化 + 最粗图上的初始分割 + 逐层投影时的边界FM细化，百万边规模在数秒内完成
+            return multilevel_partition(similarity_matrix, k,
+                                        imbalance=self.config.get('multilevel_imbalance', 0.1), seed=42)
+        raise ValueError(f"未知的分割方法: {method}，可选值为 'spectral' 或 'multilevel'")
+
+    def _spectral_labels(self, similarity_matrix, k):
+        """
+        对相似性矩阵执行谱聚类，返回每个节点的聚类标签
+        
+        Args:
+            similarity_matrix: 稠密或稀疏相似性矩阵
+            k (int): 聚类数
+            
+        Returns:
+            np.ndarray: 聚类标签
+        """
+        # 稀疏引擎下归一化拉普拉斯矩阵的特征分解使用稀疏求解器(arpack/lobpcg/amg)
+        eigen_solver = None
+        if sp.issparse(similarity_matrix):
+            eigen_solver = self.config.get('eigen_solver', 'arpack')
+
         spectral = SpectralClustering(
             n_clusters=k,
             affinity='precomputed',
+            eigen_solver=eigen_solver,
             assign_labels='discretize',
             random_state=42
         )
         
         # 拟合聚类模型
-        cluster_labels = spectral.fit_predict(similarity_matrix)
-        
-        # 按聚类分组节点
-        for i, label in enumerate(cluster_labels):
-            if label not in self.clusters:
-                self.clusters[label] = []
-            self.clusters[label].append(nodes[i])
-        
-        # 创建节点ID到数组索引的映射
-        node_to_idx = {node: idx for idx, node in enumerate(nodes)}
-
-        # 创建节点到聚类ID的映射
-        node_to_cluster = {}
-        for cluster_id, node_list in self.clusters.items():
-            for node in node_list:
-                node_to_cluster[node] = cluster_id
-
-        # 3. 找出所有割边 (丢失的边)
-        for u, v, data in self.graph.edges(data=True):
-            # 通过映射获取正确的数组索引
-            idx_u, idx_v = node_to_idx[u], node_to_idx[v]
-            if cluster_labels[idx_u] != cluster_labels[idx_v]:
-                # 存储边信息：(节点u, 节点v, 节点u的cluster_id, 节点v的cluster_id, 边权重)
-                edge_info = (
-                    u,  # 节点u的ID
-                    v,  # 节点v的ID
-                    node_to_cluster[u],  # 节点u所属的cluster ID
-                    node_to_cluster[v],  # 节点v所属的cluster ID
-                    data.get('weight', 1.0)  # 边的权重
-                )
-                self.lost_egdes.append(edge_info)
+        return spectral.fit_predict(similarity_matrix)
+
+    def _assign_clusters(self, nodes, cluster_labels):
+        """
+        根据聚类标签生成self.clusters，并找出所有割边存入self.lost_egdes
+        
+        Args:
+            nodes (list): 与标签索引对应的节点ID列表
+            cluster_labels (np.ndarray): 每个节点的聚类标签
+            
+        Returns:
+            dict: cluster_id到该聚类中image_ids列表的映射
+        """
+        cluster_labels = np.asarray(cluster_labels)
+        nodes = np.asarray(nodes)
+
+        # 按聚类分组节点(一次稳定排序后按标签切分)
+        order = np.argsort(cluster_labels, kind='stable')
+        unique_labels, starts = np.unique(cluster_labels[order], return_index=True)
+        self.clusters = {}
+        for label, cluster_nodes in zip(unique_labels.tolist(), np.split(nodes[order], starts[1:])):
+            self.clusters[label] = cluster_nodes.tolist()
+
+        # 向量化找出所有割边 (丢失的边)
+        cut_mask = self.graph.cut_edges(cluster_labels)
+        src = self.graph.edge_src[cut_mask]
+        dst = self.graph.edge_dst[cut_mask]
+
+        # 存储边信息：(节点u, 节点v, 节点u的cluster_id, 节点v的cluster_id, 边权重)
+        self.lost_egdes = list(zip(
+            nodes[src].tolist(),
+            nodes[dst].tolist(),
+            cluster_labels[src].tolist(),
+            cluster_labels[dst].tolist(),
+            self.graph.edge_weights[cut_mask].tolist()
+        ))
 
         return self.clusters
     
+    @traced("partition.expand_partitions")
     def expand_partitions(self, clusters):
         """
         通过包含相邻节点来扩展分区，基于边权重
@@ -194,6 +382,9 @@ class NcutPartitioner:
         self.expanded_clusters = {}
         for cluster_id, nodes in clusters.items():
             self.expanded_clusters[cluster_id] = list(nodes)  # 使用list保持一致性
+
+        # 建立图像->聚类成员索引，扩展过程中增量维护
+        self._build_membership_index()
         
         # 首先建立cluster之间的连接关系并收集丢失的边
         cluster_connections = {}  # 存储cluster对之间的连接信息 {(cluster1_id, cluster2_id): [lost_edges]}
@@ -222,6 +413,7 @@ class NcutPartitioner:
         
         return self.expanded_clusters
     
+    @traced("partition.partition_scene")
     def partition_scene(self, k=None, expansion_ratio=None):
         """
         将场景分割成可管理的块以进行SfM处理
@@ -240,18 +432,27 @@ class NcutPartitioner:
             expansion_ratio = self.config['expansion_ratio']
 
         # 如果尚未加载数据，则加载数据
-        if self.graph.number_of_nodes() == 0:
+        if self.graph.num_nodes == 0:
             self.load_database()
-        
-        # 执行N-cut分区
-        clusters = self.normalized_cut(k)
+
+        # 分割前过滤视图图
+        self.filter_view_graph()
+        
+        # 执行N-cut分区：flat为一次k路分割，recursive为带子块大小约束的递归二分割
+        partition_mode = self.config.get('partition_mode', 'flat')
+        if partition_mode == 'recursive':
+            clusters = self.recursive_bisection()
+        elif partition_mode == 'flat':
+            clusters = self.normalized_cut(k)
+        else:
+            raise ValueError(f"未知的分割模式: {partition_mode}，可选值为 'flat' 或 'recursive'")
         
         # 扩展分区
-        expanded_clusters = self.expand_partitions(clusters, self.config["expansion_ratio"])
+        expanded_clusters = self.expand_partitions(clusters)
         
         return expanded_clusters
     
-    def add_lost_edges_between_clusters(self, cluster1_id, cluster2_id, lost_edges_between_clusters, max_image_overlap=5, completeness_ratio=0.8):
+    def add_lost_edges_between_clusters(self, cluster1_id, cluster2_id, lost_edges_between_clusters, max_image_overlap=None, completeness_ratio=None):
         """
         在两个聚类之间添加丢失的边，以提高完整性比率并满足图像重叠约束。
         
@@ -271,18 +472,21 @@ class NcutPartitioner:
         if completeness_ratio is None:
             completeness_ratio = self.config['completeness_ratio']
 
-        # 获取两个聚类的图像集合
-        cluster1_images = set(self.expanded_clusters[cluster1_id])
-        cluster2_images = set(self.expanded_clusters[cluster2_id])
+        # 确保成员索引已建立(直接调用本方法而未经过expand_partitions时)
+        if self._cluster_images is None:
+            self._build_membership_index()
+
+        # 获取两个聚类的图像集合(与成员索引共享，添加图像时同步更新)
+        cluster1_images = self._cluster_images[cluster1_id]
+        cluster2_images = self._cluster_images[cluster2_id]
         
-        # 计算共同图像数量，如果超过最大重叠则返回
-        common_images = cluster1_images.intersection(cluster2_images)
-        if len(common_images) > max_image_overlap:
+        # 共同图像数量由增量维护的重叠计数直接得到，如果超过最大重叠则返回
+        if self._pair_overlap_counts.get(self._cluster_pair_key(cluster1_id, cluster2_id), 0) > max_image_overlap:
             return list(cluster1_images), list(cluster2_images)
         
         # 检查是否已经满足完整性比率
-        if self._is_satisfy_completeness_ratio(cluster1_images, cluster1_id, completeness_ratio) and \
-        self._is_satisfy_completeness_ratio(cluster2_images, cluster2_id, completeness_ratio):
+        if self._is_satisfy_completeness_ratio(cluster1_id, completeness_ratio) and \
+        self._is_satisfy_completeness_ratio(cluster2_id, completeness_ratio):
             return list(cluster1_images), list(cluster2_images)
         
         # 按权重降序排序
@@ -298,35 +502,79 @@ class NcutPartitioner:
                 added_image_for_cluster1 = u if u not in cluster2_images else v
                 added_image_for_cluster2 = u if u not in cluster1_images else v
                 
-            # 选择较小的聚类来添加图像，避免大的聚类变得过大
-            selected_cluster = cluster2_images if len(cluster1_images) > len(cluster2_images) else cluster1_images
-            selected_cluster_id = cluster2_id if len(cluster1_images) > len(cluster2_images) else cluster1_id
-            
-            # 添加图像到未满足完整性比率的聚类中
-            if selected_cluster is cluster1_images:
-                if not self._is_satisfy_completeness_ratio(cluster1_images, cluster1_id, completeness_ratio) and added_image_for_cluster1 not in cluster1_images:
-                    cluster1_images.add(added_image_for_cluster1)
+            # 选择较小的聚类来添加图像，避免大的聚类变得过大，
+            # 并只向未满足完整性比率的聚类中添加图像
+            if len(cluster1_images) > len(cluster2_images):
+                if not self._is_satisfy_completeness_ratio(cluster2_id, completeness_ratio):
+                    self._add_image_to_cluster(added_image_for_cluster2, cluster2_id)
             else:
-                if not self._is_satisfy_completeness_ratio(cluster2_images, cluster2_id, completeness_ratio) and added_image_for_cluster2 not in cluster2_images:
-                    cluster2_images.add(added_image_for_cluster2)
+                if not self._is_satisfy_completeness_ratio(cluster1_id, completeness_ratio):
+                    self._add_image_to_cluster(added_image_for_cluster1, cluster1_id)
                     
             # 如果两个聚类都满足完整性比率，则提前返回
-            if self._is_satisfy_completeness_ratio(cluster1_images, cluster1_id, completeness_ratio) and \
-            self._is_satisfy_completeness_ratio(cluster2_images, cluster2_id, completeness_ratio):
+            if self._is_satisfy_completeness_ratio(cluster1_id, completeness_ratio) and \
+            self._is_satisfy_completeness_ratio(cluster2_id, completeness_ratio):
                 break
         
-        # 更新expanded_clusters
-        self.expanded_clusters[cluster1_id] = list(cluster1_images)
-        self.expanded_clusters[cluster2_id] = list(cluster2_images)
-        
         return list(cluster1_images), list(cluster2_images)
 
-    def _is_satisfy_completeness_ratio(self, cluster_images, cluster_id, completeness_ratio=0.8):
+    def _build_membership_index(self):
+        """
+        根据expanded_clusters建立图像->聚类成员索引、每个聚类的重复节点计数以及聚类对之间的重叠计数，
+        之后添加图像时增量更新，使完整性检查为O(1)
+        """
+        self._cluster_images = {cluster_id: set(images) for cluster_id, images in self.expanded_clusters.items()}
+        self._image_clusters = {}
+        for cluster_id, images in self._cluster_images.items():
+            for image in images:
+                self._image_clusters.setdefault(image, set()).add(cluster_id)
+
+        # 重复节点数：聚类中每张图像还属于多少个其他聚类的总和
+        self._repeated_node_counts = {cluster_id: 0 for cluster_id in self._cluster_images}
+        self._pair_overlap_counts = {}
+        for image, cluster_ids in self._image_clusters.items():
+            if len(cluster_ids) < 2:
+                continue
+            for cluster_id in cluster_ids:
+                self._repeated_node_counts[cluster_id] += len(cluster_ids) - 1
+            sorted_ids = sorted(cluster_ids)
+            for i, cluster1_id in enumerate(sorted_ids):
+                for cluster2_id in sorted_ids[i + 1:]:
+                    key = (cluster1_id, cluster2_id)
+                    self._pair_overlap_counts[key] = self._pair_overlap_counts.get(key, 0) + 1
+
+    def _add_image_to_cluster(self, image, cluster_id):
+        """
+        将图像添加到聚类中，并增量更新成员索引与计数
+        
+        Args:
+            image (int): 图像ID
+            cluster_id (int): 聚类ID
+        """
+        cluster_images = self._cluster_images[cluster_id]
+        if image in cluster_images:
+            return
+
+        other_cluster_ids = self._image_clusters.setdefault(image, set())
+        self._repeated_node_counts[cluster_id] += len(other_cluster_ids)
+        for other_cluster_id in other_cluster_ids:
+            self._repeated_node_counts[other_cluster_id] += 1
+            key = self._cluster_pair_key(cluster_id, other_cluster_id)
+            self._pair_overlap_counts[key] = self._pair_overlap_counts.get(key, 0) + 1
+
+        other_cluster_ids.add(cluster_id)
+        cluster_images.add(image)
+        self.expanded_clusters[cluster_id].append(image)
+
+    @staticmethod
+    def _cluster_pair_key(cluster1_id, cluster2_id):
+        return (cluster1_id, cluster2_id) if cluster1_id <= cluster2_id else (cluster2_id, cluster1_id)
+
+    def _is_satisfy_completeness_ratio(self, cluster_id, completeness_ratio=None):
         """
         检查聚类是否满足完整性比率
         
         Args:
-            cluster_images (set): 聚类中的图像集合
             cluster_id (int): 聚类ID
             completeness_ratio (float): 完整性比率阈值
             
@@ -337,29 +585,21 @@ class NcutPartitioner:
         if completeness_ratio is None:
             completeness_ratio = self.config['completeness_ratio']
 
-        # 如果expanded_clusters为空或者当前聚类未初始化，则直接返回True
-        if self.expanded_clusters is None or cluster_id not in self.expanded_clusters:
+        # 如果成员索引为空或者当前聚类未初始化，则直接返回True
+        if self._cluster_images is None or cluster_id not in self._cluster_images:
             return True
         
-        # 计算重复节点数（与其他聚类的公共图像数量）
-        repeated_node_num = 0
-        for other_cluster_id, other_cluster_images in self.expanded_clusters.items():
-            if cluster_id == other_cluster_id:
-                continue
-            # 计算当前聚类与其它聚类之间的公共图像数量
-            common_images_num = len(set(cluster_images).intersection(set(other_cluster_images)))
-            repeated_node_num += common_images_num
-        
-        # 计算重复比例
-        cluster_size = len(cluster_images)
+        # 计算重复比例，重复节点数（与其他聚类的公共图像数量）由成员索引增量维护
+        cluster_size = len(self._cluster_images[cluster_id])
         if cluster_size == 0:
             return True
         
-        repeated_ratio = repeated_node_num / cluster_size
+        repeated_ratio = self._repeated_node_counts[cluster_id] / cluster_size
         
         # 检查是否满足完整性比率
         return repeated_ratio > completeness_ratio
 
+    @traced("partition.save_submodel_image_lists")
     def save_submodel_image_lists(self, output_dir="submodel_lists"):
         """
         将每个子模型的图像列表保存到单独的文本文件中。
@@ -393,4 +633,21 @@ class NcutPartitioner:
             print(f"子模型 {cluster_id} 的图像列表已保存到: {submodel_filename} ({len(image_ids)} 张图像)")
         
         print(f"所有子模型图像列表已创建在 '{output_dir}' 目录中")
-        return submodel_files
\ No newline at end of file
+        return submodel_files
+
+    @traced("partition.save_submodel_databases")
+    def save_submodel_databases(self, output_dir="submodel_databases"):
+        """
+        为每个子模型生成仅包含其图像、特征点与匹配的独立COLMAP数据库，
+        使并行的子块重建不再争用并重复扫描完整数据库
+        
+        Args:
+            output_dir (str): 保存子模型数据库的目录
+            
+        Returns:
+            dict: 子模型ID到其数据库路径的映射
+        """
+        submodel_databases = slice_database(self.database_path, self.expanded_clusters, output_dir)
+        for cluster_id, database_path in submodel_databases.items():
+            print(f"子模型 {cluster_id} 的数据库已保存到: {database_path} ({len(self.expanded_clusters[cluster_id])} 张图像)")
+        return submodel_databases
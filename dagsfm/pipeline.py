@@ -1,76 +1,679 @@
 """
-Pipeline orchestration using CGraph Python version for DAGSfM-Python
+Pipeline orchestration for DAGSfM-Python
+
+The pipeline is a task graph in the spirit of CGraph: every module is a
+node with explicit dependencies, and independent nodes (e.g. the mapper
+of each cluster) run concurrently.
 """
 
-class DAGSfMPipeline:
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import yaml
+
+from dagsfm.features import FeatureExtractor, FeatureMatcher
+from dagsfm.colmap_runner import ColmapRunner
+from dagsfm.partition import NcutPartitioner
+from dagsfm.reconstruction import SubReconstructor, ReconstructionScheduler
+from dagsfm.merging import SubReconstructionMerger
+from dagsfm.sub_model import SubModel
+from dagsfm.tracing import tracer
+
+
+class PipelineNode:
     """
-    Main pipeline orchestrator using CGraph Python version
+    A single task of the pipeline graph
     """
-    
+
+    def __init__(self, name, func, dependencies=()):
+        """
+        Initialize a pipeline node
+
+        Args:
+            name (str): Unique node name
+            func (callable): Called as func(context); its return value is stored in context[name]
+            dependencies (list): Names of nodes that must finish before this one starts
+        """
+        self.name = name
+        self.func = func
+        self.dependencies = list(dependencies)
+        self.status = "pending"  # pending -> running -> done / failed
+        self.result = None
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self.worker = None
+
+
+class TaskGraph:
+    """
+    Directed acyclic graph of pipeline nodes executed on a thread pool
+
+    Nodes may add further nodes and dependencies while the graph runs
+    (for example, the partition node adds one reconstruction node per
+    cluster), as long as they only depend on existing nodes.
+    """
+
     def __init__(self):
+        """
+        Initialize an empty task graph
+        """
+        self.nodes = {}
+        self._lock = threading.RLock()
+
+    def add_node(self, name, func, dependencies=()):
+        """
+        Add a node to the graph
+
+        Args:
+            name (str): Unique node name
+            func (callable): Called as func(context)
+            dependencies (list): Names of existing nodes this node depends on
+
+        Returns:
+            PipelineNode: The added node
+        """
+        with self._lock:
+            if name in self.nodes:
+                raise ValueError(f"Pipeline node '{name}' already exists")
+            for dependency in dependencies:
+                if dependency not in self.nodes:
+                    raise ValueError(f"Pipeline node '{name}' depends on unknown node '{dependency}'")
+            node = PipelineNode(name, func, dependencies)
+            self.nodes[name] = node
+            return node
+
+    def add_dependency(self, name, dependency):
+        """
+        Make an existing, not yet started node wait for another node
+
+        Args:
+            name (str): Node that gains the dependency
+            dependency (str): Node it has to wait for
+        """
+        with self._lock:
+            node = self.nodes[name]
+            if dependency not in self.nodes:
+                raise ValueError(f"Pipeline node '{name}' depends on unknown node '{dependency}'")
+            if node.status != "pending":
+                raise RuntimeError(f"Cannot add a dependency to pipeline node '{name}' after it started")
+            if name == dependency or name in self.ancestors(dependency):
+                raise ValueError(f"Dependency '{dependency}' -> '{name}' would create a cycle")
+            if dependency not in node.dependencies:
+                node.dependencies.append(dependency)
+
+    def ancestors(self, name):
+        """
+        All nodes the given node depends on, directly or transitively
+
+        Args:
+            name (str): Node name
+
+        Returns:
+            set: Names of the ancestor nodes
+        """
+        with self._lock:
+            result = set()
+            stack = list(self.nodes[name].dependencies)
+            while stack:
+                dependency = stack.pop()
+                if dependency not in result:
+                    result.add(dependency)
+                    stack.extend(self.nodes[dependency].dependencies)
+            return result
+
+    def run(self, context=None, max_workers=None):
+        """
+        Execute all nodes respecting their dependencies
+
+        Args:
+            context (dict): Shared state passed to every node, results are stored under the node names
+            max_workers (int): Maximum number of nodes running at the same time
+
+        Returns:
+            dict: The context, including the result of every node
+        """
+        context = {} if context is None else context
+        failure = None
+        running = {}
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dagsfm") as executor:
+            while True:
+                with self._lock:
+                    if failure is None:
+                        for node in list(self.nodes.values()):
+                            if node.status == "pending" and all(
+                                    self.nodes[dependency].status == "done" for dependency in node.dependencies):
+                                node.status = "running"
+                                running[executor.submit(self._execute, node, context)] = node
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = running.pop(future)
+                    try:
+                        future.result()
+                        node.status = "done"
+                    except Exception as e:
+                        node.status = "failed"
+                        node.error = e
+                        if failure is None:
+                            failure = node
+
+        if failure is not None:
+            raise RuntimeError(f"Pipeline node '{failure.name}' failed: {failure.error}") from failure.error
+
+        blocked = [node.name for node in self.nodes.values() if node.status == "pending"]
+        if blocked:
+            raise RuntimeError(f"Pipeline nodes never became ready: {', '.join(blocked)}")
+        return context
+
+    @staticmethod
+    def _execute(node, context):
+        node.worker = threading.current_thread().name
+        node.started_at = time.perf_counter()
+        try:
+            with tracer.span(f"pipeline.{node.name}", category="pipeline"):
+                node.result = node.func(context)
+            context[node.name] = node.result
+        finally:
+            node.finished_at = time.perf_counter()
+
+
+class StageCache:
+    """
+    Content-addressed store of stage results inside a run directory
+
+    A stage result lives in ``<root>/<stage name>/<key>`` where the key is
+    a hash of the stage's config values, the keys of its upstream stages
+    and the signatures (size/mtime) of its external inputs. A stage whose
+    directory holds a completion marker and whose declared outputs still
+    exist is considered valid and is not executed again.
+    """
+
+    MARKER = "_SUCCESS"
+    RESULT = "result.pkl"
+
+    def __init__(self, root):
+        """
+        Initialize the stage cache
+
+        Args:
+            root (str): Directory holding all stage directories
+        """
+        self.root = root
+
+    def stage_key(self, name, config=None, upstream_keys=None, input_paths=()):
+        """
+        Compute the content hash identifying one execution of a stage
+
+        Args:
+            name (str): Stage name
+            config (dict): Config values the stage depends on
+            upstream_keys (dict): Stage name -> key of every dependency
+            input_paths (list): External files or directories read by the stage
+
+        Returns:
+            str: Hex digest
+        """
+        payload = {
+            'name': name,
+            'config': config or {},
+            'upstream': upstream_keys or {},
+            'inputs': {path: path_signature(path) for path in input_paths},
+        }
+        encoded = json.dumps(payload, sort_keys=True, default=str).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()[:16]
+
+    def stage_directory(self, name, key):
+        """
+        Directory holding the outputs of one execution of a stage
+        """
+        return os.path.join(self.root, name.replace('/', '_'), key)
+
+    def load(self, name, key, outputs=None):
+        """
+        Load a stage result if it is complete and its outputs are still present
+
+        Args:
+            name (str): Stage name
+            key (str): Stage key
+            outputs (callable): Maps the result to the paths that must still exist
+
+        Returns:
+            tuple: (found, result)
+        """
+        directory = self.stage_directory(name, key)
+        if not os.path.exists(os.path.join(directory, self.MARKER)):
+            return False, None
+        try:
+            with open(os.path.join(directory, self.RESULT), 'rb') as f:
+                result = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return False, None
+        if outputs is not None and not all(os.path.exists(path) for path in outputs(result)):
+            return False, None
+        return True, result
+
+    def save(self, name, key, result):
+        """
+        Store a stage result and mark the stage as complete
+
+        Args:
+            name (str): Stage name
+            key (str): Stage key
+            result: Picklable stage result
+        """
+        directory = self.stage_directory(name, key)
+        os.makedirs(directory, exist_ok=True)
+        temp_path = os.path.join(directory, self.RESULT + ".tmp")
+        with open(temp_path, 'wb') as f:
+            pickle.dump(result, f)
+        os.replace(temp_path, os.path.join(directory, self.RESULT))
+        # The marker is written last, so a crash mid-stage never leaves a valid-looking stage behind
+        with open(os.path.join(directory, self.MARKER), 'w') as f:
+            f.write(key)
+
+
+def path_signature(path):
+    """
+    Cheap content signature of a file or directory based on sizes and mtimes
+
+    Args:
+        path (str): File or directory path
+
+    Returns:
+        list or None: Signature, None if the path does not exist
+    """
+    if os.path.isdir(path):
+        return sorted((entry.name, entry.stat().st_size, entry.stat().st_mtime_ns)
+                      for entry in os.scandir(path) if entry.is_file())
+    if os.path.exists(path):
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+    return None
+
+
+class DAGSfMPipeline:
+    """
+    Main pipeline orchestrator
+    """
+
+    def __init__(self, config_path=None, colmap_path="colmap"):
         """
         Initialize the DAGSfM pipeline
+
+        Args:
+            config_path (str): Path to the YAML configuration file, optional
+            colmap_path (str): Path to the COLMAP executable
         """
-        # TODO: Initialize CGraph pipeline
-        # This will manage the execution flow of all modules
-        pass
-    
+        self.config_path = config_path
+        self.config = {
+            'matcher': 'exhaustive',
+            'retrieval_neighbors': 30,
+            'pair_list_path': None,
+            'matching_chunk_size': 10000,
+            'matching_workers': None,
+            'num_workers': None,
+            'reconstruction_workers': None,
+            'threads_per_job': None,
+            'memory_limit_gb': None,
+            'max_retries': 1,
+            'colmap_workers': None,
+            'colmap_timeout': None,
+            'colmap_retries': 0,
+            'extraction_slots': None,
+            'extraction_shard_size': 1000,
+            'incremental_extraction': True,
+            'image_signature': 'stat',
+            'merge_workers': None,
+            'ba_mode': 'global',
+            'ba_backend': 'auto',
+            'ba_iterations': 20,
+            'admm_iterations': 10,
+            'local_ba_iterations': 5,
+            'trace_path': None,
+            'metrics_path': None,
+            'trace_memory_interval': 1.0
+        }
+        # Every other config value is a partitioning parameter and enters the partition stage key
+        self._pipeline_keys = set(self.config)
+        self._loaded_config = {}
+        if config_path and os.path.exists(config_path):
+            with open(config_path, 'r') as f:
+                self._loaded_config = yaml.safe_load(f) or {}
+            self.config.update(self._loaded_config)
+
+        # One runner for every COLMAP command line call, bounding the number of COLMAP processes
+        self.runner = ColmapRunner(colmap_path, num_workers=self.config['colmap_workers'],
+                                   timeout=self.config['colmap_timeout'], retries=self.config['colmap_retries'])
+        self.extractor = FeatureExtractor(colmap_path,
+                                          worker_slots=self.config['extraction_slots'],
+                                          shard_size=self.config['extraction_shard_size'],
+                                          incremental=self.config['incremental_extraction'],
+                                          image_signature=self.config['image_signature'],
+                                          runner=self.runner)
+        self.matcher = FeatureMatcher(colmap_path, runner=self.runner)
+        self.matcher.retrieval_cfg['num_neighbors'] = self.config['retrieval_neighbors']
+        self.matcher.pair_matching_cfg['chunk_size'] = self.config['matching_chunk_size']
+        self.matcher.pair_matching_cfg['num_workers'] = self.config['matching_workers']
+        self.reconstructor = SubReconstructor(colmap_path=colmap_path, runner=self.runner)
+        self.scheduler = ReconstructionScheduler(self.reconstructor,
+                                                 num_workers=self.config['reconstruction_workers'],
+                                                 threads_per_job=self.config['threads_per_job'],
+                                                 memory_limit_gb=self.config['memory_limit_gb'],
+                                                 max_retries=self.config['max_retries'])
+        self.merger = SubReconstructionMerger(num_workers=self.config['merge_workers'],
+                                              ba_mode=self.config['ba_mode'],
+                                              ba_backend=self.config['ba_backend'],
+                                              ba_iterations=self.config['ba_iterations'],
+                                              admm_iterations=self.config['admm_iterations'],
+                                              local_iterations=self.config['local_ba_iterations'])
+        self.partitioner = None
+        self.graph = None
+        self.cache = None
+        self.cached_stages = set()  # stages whose outputs were reused in the last run
+        self._cluster_nodes = {}  # reconstruction node name -> cluster_id
+        self._threads_per_job = None
+
     def setup_pipeline(self):
         """
         Setup the complete DAGSfM pipeline with all modules
+
+        The dependencies are:
+        - feature extraction -> feature matching -> view graph construction -> partitioning
+        - partitioning -> one reconstruction node per cluster (added once clusters are known)
+        - all reconstruction nodes -> merging and BA
         """
-        # TODO: Create pipeline elements for each module:
-        # 1. Feature extraction and matching
-        # 2. View graph construction
-        # 3. Scene partitioning (N-cut)
-        # 4. Sub-reconstruction
-        # 5. Sub-reconstruction merging and BA
-        
-        # TODO: Define dependencies between elements
-        # For example:
-        # - Feature extraction must complete before view graph construction
-        # - View graph construction must complete before partitioning
-        # - Partitioning must complete before sub-reconstructions
-        # - All sub-reconstructions must complete before merging
-        pass
-    
-    def run(self, image_directory, output_directory):
+        self.graph = TaskGraph()
+        self._cluster_nodes = {}
+        self.add_feature_extraction_step()
+        self.add_feature_matching_step()
+        self.add_view_graph_step()
+        self.add_partitioning_step()
+        self.add_reconstruction_step()
+        self.add_merging_step()
+        return self.graph
+
+    def run(self, image_directory, output_directory, resume=True):
         """
         Run the complete DAGSfM pipeline
-        
+
+        Every stage writes into ``output_directory/stages`` under a key
+        derived from its inputs and config, so a re-run only executes the
+        stages whose inputs changed or whose outputs are missing.
+
         Args:
             image_directory (str): Directory containing input images
             output_directory (str): Directory for output results
+            resume (bool): Reuse valid stage outputs from previous runs
+
+        Returns:
+            str: Directory of the merged and refined model (output_directory/merged), None if nothing was merged
+        """
+        # The graph is rebuilt on every run because cluster nodes are added while it executes
+        self.setup_pipeline()
+
+        os.makedirs(output_directory, exist_ok=True)
+        self.cache = StageCache(os.path.join(output_directory, "stages"))
+        self.cached_stages = set()
+        context = {
+            'image_directory': image_directory,
+            'output_directory': output_directory,
+            'database_path': os.path.join(output_directory, "database.db"),
+            'resume': resume,
+            'stage_keys': {},
+        }
+
+        tracing = bool(self.config['trace_path'] or self.config['metrics_path'])
+        if tracing:
+            tracer.reset()
+            tracer.start(self.config['trace_memory_interval'])
+        self.scheduler.open()
+        try:
+            self.graph.run(context, max_workers=self.config['num_workers'])
+            model_path = None
+            if context.get('merge') is not None:
+                model_path = self.write_model(SubModel.read(context['merge']), os.path.join(output_directory, "merged"))
+        finally:
+            self.scheduler.close()
+            if tracing:
+                tracer.stop()
+                self.write_trace(output_directory)
+        return model_path
+
+    @staticmethod
+    def write_model(model, model_directory):
+        """
+        Write the final model as a COLMAP sparse model (cameras.bin, images.bin, points3D.bin)
+
+        Falls back to SubModel.save (model.npz) when pycolmap is not installed.
+
+        Args:
+            model (SubModel): Merged and refined model
+            model_directory (str): Output directory
+
+        Returns:
+            str: model_directory
+        """
+        os.makedirs(model_directory, exist_ok=True)
+        with tracer.span("pipeline.write_model", images=model.num_images):
+            try:
+                import pycolmap  # noqa: F401
+            except ImportError:
+                model.save(os.path.join(model_directory, "model.npz"))
+            else:
+                model.to_reconstruction().write(model_directory)
+        return model_directory
+
+    def write_trace(self, output_directory):
+        """
+        Write the Chrome trace and Prometheus metrics of the last run, where configured
+
+        Args:
+            output_directory (str): Directory relative trace_path/metrics_path are resolved against
         """
-        # TODO: Execute the CGraph pipeline
-        # This will automatically manage the execution order based on dependencies
-        pass
-    
+        if self.config['trace_path']:
+            tracer.write_chrome_trace(os.path.join(output_directory, self.config['trace_path']))
+        if self.config['metrics_path']:
+            tracer.write_prometheus(os.path.join(output_directory, self.config['metrics_path']))
+
     def add_feature_extraction_step(self):
         """
         Add feature extraction step to the pipeline
         """
-        # TODO: Add feature extraction node to CGraph pipeline
-        pass
-    
+        def extract(context, stage_directory):
+            return self.extractor.extract_features(context['image_directory'], context['database_path'])
+
+        self.graph.add_node('extract', self._checkpointed(
+            'extract', extract,
+            config=lambda context: {'feature_cfg': self.extractor.feature_cfg},
+            input_paths=lambda context: [context['image_directory']],
+            outputs=lambda result: [result]))
+
+    def add_feature_matching_step(self):
+        """
+        Add feature matching step to the pipeline
+        """
+        def match(context, stage_directory):
+            if self.config['matcher'] == 'spatial':
+                return self.matcher.spatial_matcher(context['database_path'])
+            if self.config['matcher'] == 'retrieval':
+                return self.matcher.retrieval_matcher(context['database_path'])
+            if self.config['matcher'] == 'pairs':
+                return self.matcher.pair_list_matcher(context['database_path'], self.config['pair_list_path'])
+            return self.matcher.exhaustive_matcher(context['database_path'])
+
+        def match_config(context):
+            config = {'matcher': self.config['matcher'], 'matcher_cfg': self.matcher.matcher_cfg}
+            if self.config['matcher'] == 'retrieval':
+                config['retrieval_cfg'] = self.matcher.retrieval_cfg
+            if self.config['matcher'] == 'pairs':
+                config['pair_list_path'] = self.config['pair_list_path']
+                config['pair_matching_cfg'] = self.matcher.pair_matching_cfg
+            return config
+
+        self.graph.add_node('match', self._checkpointed(
+            'match', match,
+            config=match_config,
+            input_paths=lambda context: [self.config['pair_list_path']] if self.config['matcher'] == 'pairs' else [],
+            outputs=lambda result: [result]), ['extract'])
+
+    def add_view_graph_step(self):
+        """
+        Add view graph construction step to the pipeline
+        """
+        def build_view_graph(context, stage_directory):
+            graph = self.matcher.build_matching_graph(context['database_path'],
+                                                      weighting=self.config.get('edge_weighting', 'inliers'),
+                                                      min_inliers=self.config.get('min_inliers', 0))
+            return {'graph': graph, 'images': dict(zip(graph.image_ids.tolist(), graph.names))}
+
+        # The database enters the key through its size/mtime, so edits made outside the pipeline are picked up
+        self.graph.add_node('view_graph', self._checkpointed(
+            'view_graph', build_view_graph,
+            config=lambda context: {'edge_weighting': self.config.get('edge_weighting', 'inliers'),
+                                    'min_inliers': self.config.get('min_inliers', 0)},
+            input_paths=lambda context: [context['database_path']]), ['match'])
+
     def add_partitioning_step(self):
         """
         Add scene partitioning step to the pipeline
+
+        Once the clusters are known (freshly computed or reused from a
+        previous run), one reconstruction node per cluster is added to the
+        graph and wired in front of the merging node.
         """
-        # TODO: Add partitioning node to CGraph pipeline
-        pass
-    
+        def partition(context, stage_directory):
+            self.partitioner = NcutPartitioner(context['database_path'], self.config_path)
+            self.partitioner.set_view_graph(context['view_graph']['graph'])
+            expanded_clusters = self.partitioner.partition_scene()
+            self.partitioner.save_submodel_image_lists(os.path.join(stage_directory, "image_lists"))
+            databases = self.partitioner.save_submodel_databases(os.path.join(stage_directory, "databases"))
+            image_names = {cluster_id: [self.partitioner.images[image_id] for image_id in image_ids]
+                           for cluster_id, image_ids in expanded_clusters.items()}
+            return {'clusters': expanded_clusters, 'image_names': image_names, 'databases': databases}
+
+        checkpointed_partition = self._checkpointed(
+            'partition', partition,
+            config=lambda context: {key: value for key, value in self._loaded_config.items()
+                                    if key not in self._pipeline_keys},
+            outputs=lambda result: list(result['databases'].values()))
+
+        def partition_and_fan_out(context):
+            result = checkpointed_partition(context)
+            image_names = result['image_names']
+
+            # Largest clusters are added first so they are also started first
+            self._threads_per_job = self.scheduler.resolve_threads_per_job(len(image_names))
+            for cluster_id in sorted(image_names, key=lambda c: len(image_names[c]), reverse=True):
+                name = f"reconstruct/{cluster_id}"
+                self.graph.add_node(name, self._checkpointed(
+                    name, self._reconstruction_task(cluster_id, image_names[cluster_id],
+                                                    result['databases'][cluster_id]),
+                    config=lambda context, names=image_names[cluster_id]: {
+                        'image_names': names, 'mapper_cfg': self.reconstructor.mapper_cfg},
+                    outputs=lambda model_path: [model_path] if model_path else []), ['partition'])
+                self.graph.add_dependency('reconstruct', name)
+                self._cluster_nodes[name] = cluster_id
+            return result
+
+        self.graph.add_node('partition', partition_and_fan_out, ['view_graph'])
+
     def add_reconstruction_step(self):
         """
         Add sub-reconstruction step to the pipeline
+
+        This is a barrier node; the per-cluster nodes are added by the
+        partitioning step and run in parallel on the process pool.
         """
-        # TODO: Add reconstruction nodes to CGraph pipeline
-        # This might be multiple nodes for parallel processing
-        pass
-    
+        def collect_models(context, stage_directory):
+            return {cluster_id: context[name] for name, cluster_id in self._cluster_nodes.items()}
+
+        self.graph.add_node('reconstruct', self._checkpointed('reconstruct', collect_models), ['partition'])
+
     def add_merging_step(self):
         """
         Add reconstruction merging step to the pipeline
+
+        The merged model is saved in the stage directory and only its path
+        is cached as the stage result.
+        """
+        def merge(context, stage_directory):
+            models = [path for path in context['reconstruct'].values() if path is not None]
+            # Sub-models are spilled next to the checkpoint and streamed in one merge at a time
+            self.merger.work_directory = os.path.join(stage_directory, "work")
+            model = self.merger.merge_and_refine(models)
+            if model is None:
+                return None
+            # Only the path is cached, the model itself is not kept in the stage result
+            model_path = os.path.join(stage_directory, "model.npz")
+            model.save(model_path)
+            return model_path
+
+        checkpointed_merge = self._checkpointed(
+            'merge', merge,
+            config=lambda context: {key: self.config[key] for key in
+                                    ('ba_mode', 'ba_backend', 'ba_iterations', 'admm_iterations',
+                                     'local_ba_iterations')},
+            outputs=lambda model_path: [model_path] if model_path else [])
+        self.graph.add_node('merge', checkpointed_merge, ['reconstruct'])
+
+    def _checkpointed(self, name, func, config=None, input_paths=None, outputs=None):
+        """
+        Wrap a stage function so that its result is cached in the run directory
+
+        Args:
+            name (str): Stage (node) name
+            func (callable): Called as func(context, stage_directory) when the stage has to run
+            config (callable): Maps the context to the config values the stage depends on
+            input_paths (callable): Maps the context to external files/directories read by the stage
+            outputs (callable): Maps the result to paths that must still exist for it to be reused
+
+        Returns:
+            callable: Node function taking the context
         """
-        # TODO: Add merging node to CGraph pipeline
-        pass
\ No newline at end of file
+        def run_stage(context):
+            # The key chains the keys of all upstream stages, so a change invalidates everything downstream
+            upstream_keys = {dependency: context['stage_keys'][dependency]
+                             for dependency in self.graph.nodes[name].dependencies}
+            key = self.cache.stage_key(name,
+                                       config(context) if config else None,
+                                       upstream_keys,
+                                       input_paths(context) if input_paths else ())
+            context['stage_keys'][name] = key
+
+            if context['resume']:
+                found, result = self.cache.load(name, key, outputs)
+                if found:
+                    self.cached_stages.add(name)
+                    return result
+
+            stage_directory = self.cache.stage_directory(name, key)
+            os.makedirs(stage_directory, exist_ok=True)
+            result = func(context, stage_directory)
+            self.cache.save(name, key, result)
+            return result
+
+        return run_stage
+
+    def _reconstruction_task(self, cluster_id, image_names, database_path):
+        """
+        Build the stage function reconstructing one cluster on the scheduler's process pool
+        """
+        def reconstruct(context, stage_directory):
+            job = {
+                "image_names": image_names,
+                "image_directory": context['image_directory'],
+                "database_path": database_path,
+                "output_directory": stage_directory,
+            }
+            return self.scheduler.reconstruct_cluster(cluster_id, job, self._threads_per_job,
+                                                      reconstructor=self.reconstructor)
+
+        return reconstruct
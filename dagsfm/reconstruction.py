@@ -2,70 +2,353 @@
 Sub-reconstruction module for DAGSfM-Python
 """
 
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from dagsfm.colmap_runner import ColmapRunner
+from dagsfm.tracing import submit_traced, tracer
+
+try:
+    import resource
+except ImportError:  # resource is only available on POSIX systems
+    resource = None
+
+
 class SubReconstructor:
     """
     Handles reconstruction of individual partitions using pycolmap or colmap
     """
-    
-    def __init__(self, use_pycolmap=True):
+
+    def __init__(self, use_pycolmap=True, colmap_path="colmap", num_threads=-1, runner=None):
         """
         Initialize sub-reconstructor
-        
+
         Args:
             use_pycolmap (bool): Whether to use pycolmap or command-line colmap
+            colmap_path (str): Path to the COLMAP executable, used when use_pycolmap is False
+            num_threads (int): Number of CPU threads used by the mapper, -1 uses all cores
+            runner (ColmapRunner): Runner of the COLMAP commands, defaults to one for colmap_path
         """
         self.use_pycolmap = use_pycolmap
-        # TODO: Add pycolmap import and initialization if needed
-    
+        self.colmap_path = colmap_path
+        self.runner = runner or ColmapRunner(colmap_path)
+        self.num_threads = num_threads
+        self.mapper_cfg = {}  # Configuration dictionary for COLMAP mapper parameters
+
     def reconstruct_partition(self, partition, image_directory, database_path, output_directory):
         """
         Reconstruct a single partition
-        
+
         Args:
-            partition: The image partition to reconstruct
+            partition (list): Names of the images in the partition
             image_directory (str): Directory containing the images
             database_path (str): Path to the COLMAP database
             output_directory (str): Directory to store reconstruction results
-            
+
         Returns:
-            reconstruction: The completed reconstruction
+            str: Path to the largest reconstructed model, or None if nothing was registered
         """
-        # TODO: Implement reconstruction using pycolmap or colmap
-        # This will involve:
-        # 1. Feature extraction for images in the partition
-        # 2. Feature matching within the partition
-        # 3. Incremental SfM reconstruction
-        pass
-    
+        os.makedirs(output_directory, exist_ok=True)
+
+        # Keep the image list next to the models so every sub-reconstruction is self-describing
+        image_list_path = os.path.join(output_directory, "image_list.txt")
+        with open(image_list_path, 'w') as f:
+            for image_name in partition:
+                f.write(image_name + '\n')
+
+        return self.run_incremental_sfm(database_path, image_directory, output_directory,
+                                        image_names=list(partition))
+
     def extract_features(self, image_paths, database_path):
         """
         Extract features from images
-        
+
         Args:
             image_paths (list): List of image paths
             database_path (str): Path to the COLMAP database
         """
         # TODO: Implement feature extraction
         pass
-    
+
     def match_features(self, database_path):
         """
         Match features between images in the partition
-        
+
         Args:
             database_path (str): Path to the COLMAP database
         """
         # TODO: Implement feature matching
         pass
-    
-    def run_incremental_sfm(self, database_path, image_directory, output_directory):
+
+    def run_incremental_sfm(self, database_path, image_directory, output_directory, image_names=None):
         """
         Run incremental SfM on the partition
-        
+
         Args:
             database_path (str): Path to the COLMAP database
             image_directory (str): Directory containing images
             output_directory (str): Output directory for results
+            image_names (list): Restrict the mapper to these images, optional
+
+        Returns:
+            str: Path to the largest reconstructed model, or None if nothing was registered
+        """
+        os.makedirs(output_directory, exist_ok=True)
+
+        if self.use_pycolmap:
+            import pycolmap
+
+            options = pycolmap.IncrementalPipelineOptions()
+            options.num_threads = self.num_threads
+            if image_names is not None:
+                options.image_names = image_names
+            reconstructions = pycolmap.incremental_mapping(database_path, image_directory,
+                                                           output_directory, options)
+            if not reconstructions:
+                return None
+            best_index = max(reconstructions, key=lambda idx: reconstructions[idx].num_reg_images())
+            return os.path.join(output_directory, str(best_index))
+
+        options = {
+            "database_path": database_path,
+            "image_path": image_directory,
+            "output_path": output_directory,
+            "Mapper.num_threads": self.num_threads,
+        }
+        if image_names is not None:
+            options["image_list_path"] = os.path.join(output_directory, 'image_list.txt')
+        options.update(self.mapper_cfg)
+
+        self.runner.run("mapper", options)
+
+        return _largest_model_directory(output_directory)
+
+
+def _largest_model_directory(output_directory):
+    """
+    Pick the model sub-directory (0, 1, ...) with the most registered images,
+    using the size of images.bin as a proxy
+    """
+    best_path, best_size = None, -1
+    for entry in os.listdir(output_directory):
+        images_bin = os.path.join(output_directory, entry, "images.bin")
+        if entry.isdigit() and os.path.exists(images_bin):
+            size = os.path.getsize(images_bin)
+            if size > best_size:
+                best_path, best_size = os.path.join(output_directory, entry), size
+    return best_path
+
+
+def run_reconstruction_job(reconstructor, job, threads_per_job, memory_limit_gb):
+    """
+    Run one sub-reconstruction inside a worker process with its CPU and memory quota
+
+    Args:
+        reconstructor (SubReconstructor): Reconstructor running the mapper
+        job (dict): image_names, image_directory, database_path and output_directory of the cluster
+        threads_per_job (int): CPU threads given to the mapper, None keeps the reconstructor setting
+        memory_limit_gb (float): Address-space limit of the worker process in GB, None for no limit
+
+    Returns:
+        tuple: (model_path, runtime_seconds)
+    """
+    if threads_per_job is not None:
+        reconstructor.num_threads = threads_per_job
+        os.environ["OMP_NUM_THREADS"] = str(threads_per_job)
+    if memory_limit_gb is not None and resource is not None:
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        limit = int(memory_limit_gb * 1024 ** 3)
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+    start = time.time()
+    with tracer.span("reconstruction.cluster", images=len(job["image_names"])):
+        model_path = reconstructor.reconstruct_partition(job["image_names"], job["image_directory"],
+                                                         job["database_path"], job["output_directory"])
+    tracer.count("reconstructed_clusters")
+    return model_path, time.time() - start
+
+
+class ReconstructionScheduler:
+    """
+    Runs one incremental mapper per cluster concurrently in a process pool
+    """
+
+    def __init__(self, reconstructor=None, num_workers=None, threads_per_job=None,
+                 memory_limit_gb=None, max_retries=1):
         """
-        # TODO: Implement incremental SfM using pycolmap or colmap
-        pass
\ No newline at end of file
+        Initialize the scheduler
+
+        Args:
+            reconstructor (SubReconstructor): Reconstructor used by every job, defaults to SubReconstructor()
+            num_workers (int): Number of concurrent mapper processes, defaults to the CPU count
+            threads_per_job (int): CPU threads given to each mapper, defaults to cores / concurrent jobs
+            memory_limit_gb (float): Address-space limit per job in GB, None for no limit
+            max_retries (int): How many times a failed job is re-submitted
+        """
+        self.reconstructor = reconstructor if reconstructor is not None else SubReconstructor()
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.threads_per_job = threads_per_job
+        self.memory_limit_gb = memory_limit_gb
+        self.max_retries = max_retries
+        self.failed = {}  # cluster_id -> error message of the last attempt
+        self.runtimes = {}  # cluster_id -> runtime of the successful attempt in seconds
+        self._executor = None  # shared process pool between open() and close()
+        self._pool_generation = 0  # incremented whenever the pool is replaced
+        self._pool_lock = threading.Lock()
+
+    def resolve_threads_per_job(self, num_jobs):
+        """
+        CPU threads given to each mapper, splitting the cores evenly between
+        the jobs that actually run at the same time unless set explicitly
+
+        Args:
+            num_jobs (int): Number of jobs to be scheduled
+
+        Returns:
+            int: Threads per job
+        """
+        if self.threads_per_job is not None:
+            return self.threads_per_job
+        return max(1, (os.cpu_count() or 1) // max(1, min(self.num_workers, num_jobs)))
+
+    def open(self):
+        """
+        Start the shared process pool used by reconstruct_cluster
+        """
+        with self._pool_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.num_workers)
+                self._pool_generation += 1
+
+    def close(self):
+        """
+        Shut the shared process pool down, waiting for running jobs
+        """
+        with self._pool_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def reconstruct_cluster(self, cluster_id, job, threads_per_job=None, reconstructor=None):
+        """
+        Reconstruct one cluster on the shared pool, retrying failed attempts
+
+        Safe to call from several threads at once. When a worker process dies
+        (e.g. killed for exceeding its memory limit, or a crashing mapper) the
+        pool breaks and every job in flight fails with it; the pool is then
+        replaced and the affected jobs are re-run in a process of their own,
+        so that a crash is only charged to the job that actually caused it.
+
+        Args:
+            cluster_id: Cluster identifier used in messages, failed and runtimes
+            job (dict): image_names, image_directory, database_path and output_directory of the cluster
+            threads_per_job (int): CPU threads given to the mapper, None keeps the reconstructor setting
+            reconstructor (SubReconstructor): Reconstructor to use, defaults to self.reconstructor
+
+        Returns:
+            str: Path of the largest reconstructed model, None if nothing was registered
+
+        Raises:
+            Exception: The error of the last attempt once max_retries is exhausted
+        """
+        reconstructor = reconstructor if reconstructor is not None else self.reconstructor
+        args = (run_reconstruction_job, reconstructor, job, threads_per_job, self.memory_limit_gb)
+        attempts = 0
+        isolated = False
+        while True:
+            try:
+                if isolated:
+                    with ProcessPoolExecutor(max_workers=1) as executor:
+                        model_path, runtime = submit_traced(executor, *args).result()
+                else:
+                    with self._pool_lock:
+                        if self._executor is None:
+                            raise RuntimeError("ReconstructionScheduler.open() has not been called")
+                        generation = self._pool_generation
+                        future = submit_traced(self._executor, *args)
+                    model_path, runtime = future.result()
+            except BrokenProcessPool as e:
+                if not isolated:
+                    # Not necessarily this job's fault: replace the pool and retry alone, free of charge
+                    print(f"A reconstruction worker died ({e}), retrying cluster {cluster_id} in its own process")
+                    self._replace_pool(generation)
+                    isolated = True
+                    continue
+                error = e
+            except Exception as e:
+                error = e
+            else:
+                with self._pool_lock:
+                    self.runtimes[cluster_id] = runtime
+                    self.failed.pop(cluster_id, None)
+                return model_path
+
+            attempts += 1
+            with self._pool_lock:
+                self.failed[cluster_id] = str(error)
+            if attempts > self.max_retries:
+                print(f"Sub-reconstruction of cluster {cluster_id} failed after {attempts} attempts: {error}")
+                raise error
+            print(f"Sub-reconstruction of cluster {cluster_id} failed ({error}), retrying")
+
+    def _replace_pool(self, generation):
+        """
+        Replace a broken shared pool, unless another thread already did
+        """
+        with self._pool_lock:
+            if self._executor is None or generation != self._pool_generation:
+                return
+            broken, self._executor = self._executor, ProcessPoolExecutor(max_workers=self.num_workers)
+            self._pool_generation += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, clusters, image_directory, database_path, output_directory):
+        """
+        Reconstruct all clusters, largest cluster first
+
+        Args:
+            clusters (dict): cluster_id -> list of image names
+            image_directory (str): Directory containing the images
+            database_path (str or dict): COLMAP database shared by all clusters, or cluster_id -> database path
+            output_directory (str): Root directory, each cluster is written to output_directory/cluster_<id>
+
+        Returns:
+            dict: cluster_id -> path of the largest reconstructed model (None if nothing registered)
+        """
+        jobs = {}
+        for cluster_id, image_names in clusters.items():
+            jobs[cluster_id] = {
+                "image_names": list(image_names),
+                "image_directory": image_directory,
+                "database_path": database_path[cluster_id] if isinstance(database_path, dict) else database_path,
+                "output_directory": os.path.join(output_directory, f"cluster_{cluster_id}"),
+            }
+
+        # Largest clusters first so the longest jobs do not end up running alone at the end
+        order = sorted(jobs, key=lambda cluster_id: len(jobs[cluster_id]["image_names"]), reverse=True)
+
+        threads_per_job = self.resolve_threads_per_job(len(jobs))
+
+        results = {}
+        self.failed = {}
+        self.runtimes = {}
+        self.open()
+        try:
+            # One thread per concurrent job waits on its worker process; the queue keeps the order above
+            with ThreadPoolExecutor(max_workers=self.num_workers) as threads:
+                futures = {threads.submit(self.reconstruct_cluster, cluster_id, jobs[cluster_id],
+                                          threads_per_job): cluster_id for cluster_id in order}
+                for future, cluster_id in futures.items():
+                    try:
+                        results[cluster_id] = future.result()
+                    except Exception:
+                        pass  # Recorded in self.failed
+        finally:
+            self.close()
+
+        return results
@@ -0,0 +1,216 @@
+"""
+Image retrieval for candidate pair selection in DAGSfM-Python
+
+Every image is summarised by one global descriptor, a VLAD aggregation of
+its SIFT descriptors over a small visual vocabulary, reduced with PCA. Each
+image is then matched only against its nearest neighbours in descriptor
+space, so the number of candidate pairs grows linearly with the number of
+images instead of quadratically.
+"""
+
+import warnings
+
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import PCA
+from sklearn.neighbors import NearestNeighbors
+
+from dagsfm.database import iter_descriptors, read_images
+
+
+def root_sift(descriptors):
+    """
+    RootSIFT mapping: L1-normalise the descriptors and take the square root
+
+    Args:
+        descriptors (np.ndarray): (N, D) SIFT descriptors
+
+    Returns:
+        np.ndarray: (N, D) float32 RootSIFT descriptors
+    """
+    descriptors = descriptors.astype(np.float32)
+    descriptors /= np.maximum(descriptors.sum(axis=1, keepdims=True), 1e-12)
+    return np.sqrt(descriptors)
+
+
+class VladRetrieval:
+    """
+    VLAD global descriptors and nearest-neighbour search over the images of a COLMAP database
+    """
+
+    def __init__(self, num_words=64, dimension=256, training_images=1000, samples_per_image=200, seed=0):
+        """
+        Initialize the retrieval model
+
+        Args:
+            num_words (int): Size of the visual vocabulary
+            dimension (int): Dimension of the global descriptors after PCA
+            training_images (int): Number of images used to train the vocabulary and the PCA
+            samples_per_image (int): Number of descriptors per training image used for k-means
+            seed (int): Random seed
+        """
+        self.num_words = num_words
+        self.dimension = dimension
+        self.training_images = training_images
+        self.samples_per_image = samples_per_image
+        self.seed = seed
+        self.vocabulary = None
+        self.pca = None
+
+    def fit(self, database_path):
+        """
+        Train the vocabulary and the PCA projection on a subset of the database images
+
+        Only samples_per_image descriptors of each training image are kept in
+        memory for k-means; the training VLAD vectors are computed in a second
+        streaming pass.
+
+        Args:
+            database_path (str): Path to the COLMAP database file
+
+        Returns:
+            VladRetrieval: self
+        """
+        image_ids, _ = read_images(database_path)
+        if len(image_ids) > self.training_images:
+            image_ids = image_ids[np.linspace(0, len(image_ids) - 1, self.training_images).astype(np.int64)]
+
+        rng = np.random.default_rng(self.seed)
+        samples = []
+        for _, descriptors in iter_descriptors(database_path, image_ids):
+            if len(descriptors) > self.samples_per_image:
+                descriptors = descriptors[rng.choice(len(descriptors), self.samples_per_image, replace=False)]
+            samples.append(root_sift(descriptors))
+        samples = np.concatenate(samples)
+        if len(samples) < self.num_words:
+            raise ValueError(f"Not enough descriptors ({len(samples)}) to train {self.num_words} visual words")
+
+        kmeans = MiniBatchKMeans(n_clusters=self.num_words, random_state=self.seed, n_init=3,
+                                 batch_size=max(1024, 4 * self.num_words))
+        self.vocabulary = kmeans.fit(samples).cluster_centers_.astype(np.float32)
+
+        self.pca = None
+        vectors = np.stack([self.vlad(descriptors)
+                            for _, descriptors in iter_descriptors(database_path, image_ids)])
+        dimension = min(self.dimension, len(vectors) - 1, vectors.shape[1])
+        if dimension > 0:
+            self.pca = PCA(n_components=dimension, random_state=self.seed).fit(vectors)
+        return self
+
+    def vlad(self, descriptors):
+        """
+        VLAD vector of the descriptors of one image, before PCA
+
+        Residuals to the nearest visual word are summed per word, each word
+        block is L2-normalised (intra-normalisation), then the whole vector
+        is power- and L2-normalised.
+
+        Args:
+            descriptors (np.ndarray): (N, D) SIFT descriptors of the image
+
+        Returns:
+            np.ndarray: (num_words * D,) float32 VLAD vector
+        """
+        vector = np.zeros_like(self.vocabulary)
+        if len(descriptors):
+            descriptors = root_sift(descriptors)
+            distances = ((descriptors ** 2).sum(axis=1, keepdims=True) - 2 * descriptors @ self.vocabulary.T
+                         + (self.vocabulary ** 2).sum(axis=1))
+            words = np.argmin(distances, axis=1)
+            np.add.at(vector, words, descriptors - self.vocabulary[words])
+            vector /= np.maximum(np.linalg.norm(vector, axis=1, keepdims=True), 1e-12)
+        vector = vector.ravel()
+        vector = np.sign(vector) * np.sqrt(np.abs(vector))
+        return vector / max(np.linalg.norm(vector), 1e-12)
+
+    def transform(self, database_path):
+        """
+        Global descriptors of every image of the database
+
+        Args:
+            database_path (str): Path to the COLMAP database file
+
+        Returns:
+            tuple: (image_ids, vectors) with vectors an (N, dimension) float32 array of unit rows
+        """
+        image_ids = []
+        vectors = []
+        batch = []
+        for image_id, descriptors in iter_descriptors(database_path):
+            image_ids.append(image_id)
+            batch.append(self.vlad(descriptors))
+            if len(batch) == 1024:
+                vectors.append(self._project(np.stack(batch)))
+                batch = []
+        if batch:
+            vectors.append(self._project(np.stack(batch)))
+        vectors = np.concatenate(vectors) if vectors else np.zeros((0, self.dimension), dtype=np.float32)
+        return np.array(image_ids, dtype=np.int64), vectors
+
+    def _project(self, vectors):
+        if self.pca is not None:
+            vectors = self.pca.transform(vectors)
+        vectors = vectors.astype(np.float32)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def candidate_pairs(self, database_path, num_neighbors=30):
+        """
+        Top-K retrieval pairs of every image of the database
+
+        Args:
+            database_path (str): Path to the COLMAP database file
+            num_neighbors (int): Number of neighbours retrieved per image
+
+        Returns:
+            np.ndarray: (P, 2) int64 array of unique image id pairs with the smaller id first
+        """
+        if self.vocabulary is None:
+            self.fit(database_path)
+        image_ids, vectors = self.transform(database_path)
+        neighbors = nearest_neighbors(vectors, num_neighbors)
+        pairs = np.stack([np.repeat(np.arange(len(image_ids)), neighbors.shape[1]), neighbors.ravel()], axis=1)
+        pairs = pairs[(pairs[:, 1] >= 0) & (pairs[:, 0] != pairs[:, 1])]
+        pairs = np.unique(np.sort(image_ids[pairs], axis=1), axis=0)
+        return pairs.reshape(-1, 2)
+
+
+def nearest_neighbors(vectors, num_neighbors):
+    """
+    Approximate nearest neighbours of unit vectors by inner product
+
+    Uses a faiss HNSW index when faiss is installed (faiss-cpu in the
+    optional requirements) and warns before falling back to an exact
+    scikit-learn search, which is quadratic in the number of images.
+
+    Args:
+        vectors (np.ndarray): (N, D) float32 unit vectors
+        num_neighbors (int): Number of neighbours per vector, the vector itself excluded
+
+    Returns:
+        np.ndarray: (N, min(num_neighbors, N - 1)) neighbour indices, -1 where faiss found fewer
+    """
+    num_neighbors = min(num_neighbors, len(vectors) - 1)
+    if num_neighbors <= 0:
+        return np.zeros((len(vectors), 0), dtype=np.int64)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+
+    try:
+        import faiss
+    except ImportError:
+        faiss = None
+
+    if faiss is not None:
+        index = faiss.IndexHNSWFlat(vectors.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efSearch = max(64, 2 * num_neighbors)
+        index.add(vectors)
+        _, neighbors = index.search(vectors, num_neighbors + 1)
+    else:
+        warnings.warn("faiss is not installed, retrieval falls back to exact nearest-neighbour search "
+                      f"over {len(vectors)} images; install faiss-cpu for the HNSW index", RuntimeWarning)
+        search = NearestNeighbors(n_neighbors=num_neighbors + 1).fit(vectors)
+        _, neighbors = search.kneighbors(vectors)
+
+    # Drop each vector from its own list, or the farthest neighbour when it was not retrieved
+    own = neighbors == np.arange(len(vectors))[:, None]
+    own[~own.any(axis=1), -1] = True
+    return neighbors[~own].reshape(len(vectors), num_neighbors).astype(np.int64)
@@ -0,0 +1,287 @@
+"""
+Columnar sub-reconstruction model for DAGSfM-Python
+
+Alignment, merging and bundle adjustment work on whole arrays, so a
+sub-reconstruction is stored as a handful of NumPy arrays instead of one
+Python object per image and per 3D point.
+"""
+
+import numpy as np
+
+
+class SubModel:
+    """
+    Sub-reconstruction stored as columnar arrays
+
+    Images are indexed 0..num_images-1 and 3D points 0..num_points-1. Every
+    observation of a 3D point is one entry of the track arrays.
+
+    Alignment and the NumPy bundle adjustment project through the pinhole
+    camera_params of every image, so track_xy holds undistorted
+    observations of that pinhole camera. The original COLMAP cameras (id,
+    model, size and full parameters including distortion) are kept in
+    cameras, so that to_reconstruction can distort the observations back
+    and rebuild the exact camera models.
+    """
+
+    def __init__(self, image_names, rotations, translations, camera_params,
+                 points_xyz, points_rgb=None, points_error=None,
+                 track_point=None, track_image=None, track_point2D=None, track_xy=None,
+                 cameras=None, image_camera_ids=None):
+        """
+        Initialize a sub-model
+
+        Args:
+            image_names (list): Names of the registered images
+            rotations (np.ndarray): (N, 3, 3) cam_from_world rotations
+            translations (np.ndarray): (N, 3) cam_from_world translations
+            camera_params (np.ndarray): (N, 3) pinhole parameters (focal, cx, cy) per image
+            points_xyz (np.ndarray): (M, 3) 3D point positions
+            points_rgb (np.ndarray): (M, 3) uint8 colors, optional
+            points_error (np.ndarray): (M,) mean reprojection errors, optional
+            track_point (np.ndarray): (T,) 3D point index of every observation
+            track_image (np.ndarray): (T,) image index of every observation
+            track_point2D (np.ndarray): (T,) keypoint index of every observation in its image
+            track_xy (np.ndarray): (T, 2) undistorted image coordinates in the pinhole camera of the image
+            cameras (dict): camera_id -> (model name, width, height, params) of the original
+                COLMAP cameras, optional
+            image_camera_ids (np.ndarray): (N,) camera id of every image, required with cameras
+        """
+        self.image_names = list(image_names)
+        self.rotations = np.asarray(rotations, dtype=np.float64).reshape(-1, 3, 3)
+        self.translations = np.asarray(translations, dtype=np.float64).reshape(-1, 3)
+        self.camera_params = np.asarray(camera_params, dtype=np.float64).reshape(-1, 3)
+        self.points_xyz = np.asarray(points_xyz, dtype=np.float64).reshape(-1, 3)
+        num_points = len(self.points_xyz)
+        self.points_rgb = (np.zeros((num_points, 3), dtype=np.uint8) if points_rgb is None
+                           else np.asarray(points_rgb, dtype=np.uint8).reshape(-1, 3))
+        self.points_error = (np.zeros(num_points) if points_error is None
+                             else np.asarray(points_error, dtype=np.float64))
+        self.track_point = np.asarray([] if track_point is None else track_point, dtype=np.int64)
+        self.track_image = np.asarray([] if track_image is None else track_image, dtype=np.int32)
+        self.track_point2D = np.asarray([] if track_point2D is None else track_point2D, dtype=np.int32)
+        self.track_xy = np.asarray([] if track_xy is None else track_xy, dtype=np.float64).reshape(-1, 2)
+        self.cameras = None if cameras is None else {int(camera_id): (str(model), int(width), int(height),
+                                                                      np.asarray(params, dtype=np.float64))
+                                                     for camera_id, (model, width, height, params) in cameras.items()}
+        self.image_camera_ids = None if cameras is None else np.asarray(image_camera_ids, dtype=np.int64)
+
+    @property
+    def num_images(self):
+        return len(self.image_names)
+
+    @property
+    def num_points(self):
+        return len(self.points_xyz)
+
+    @property
+    def num_observations(self):
+        return len(self.track_point)
+
+    def camera_centers(self):
+        """
+        Camera centres in world coordinates, -R^T t for every image
+
+        Returns:
+            np.ndarray: (N, 3) camera centres
+        """
+        return -np.einsum('nji,nj->ni', self.rotations, self.translations)
+
+    def transform(self, scale, rotation, translation):
+        """
+        Apply the similarity transform x' = s * R @ x + t to the model in place
+
+        Args:
+            scale (float): Scale s
+            rotation (np.ndarray): (3, 3) rotation R
+            translation (np.ndarray): (3,) translation t
+        """
+        rotation = np.asarray(rotation, dtype=np.float64)
+        translation = np.asarray(translation, dtype=np.float64)
+        self.points_xyz = scale * self.points_xyz @ rotation.T + translation
+        # Camera frames are rescaled with the world so that projections are unchanged
+        self.rotations = self.rotations @ rotation.T
+        self.translations = scale * self.translations - self.rotations @ translation
+
+    def save(self, path):
+        """
+        Write the model to an .npz file
+
+        Args:
+            path (str): Output file path
+        """
+        arrays = {}
+        if self.cameras is not None:
+            # Cameras as columns, the parameter rows padded with NaN to the longest model
+            camera_ids = sorted(self.cameras)
+            intrinsics = np.full((len(camera_ids), max((len(self.cameras[camera_id][3]) for camera_id in camera_ids),
+                                                       default=0)), np.nan)
+            for row, camera_id in enumerate(camera_ids):
+                intrinsics[row, :len(self.cameras[camera_id][3])] = self.cameras[camera_id][3]
+            arrays = {'camera_ids': np.array(camera_ids, dtype=np.int64),
+                      'camera_models': np.array([self.cameras[camera_id][0] for camera_id in camera_ids], dtype=str),
+                      'camera_sizes': np.array([self.cameras[camera_id][1:3] for camera_id in camera_ids],
+                                               dtype=np.int64).reshape(-1, 2),
+                      'camera_intrinsics': intrinsics, 'image_camera_ids': self.image_camera_ids}
+        np.savez(path, image_names=np.array(self.image_names, dtype=str),
+                 rotations=self.rotations, translations=self.translations,
+                 camera_params=self.camera_params, points_xyz=self.points_xyz,
+                 points_rgb=self.points_rgb, points_error=self.points_error,
+                 track_point=self.track_point, track_image=self.track_image,
+                 track_point2D=self.track_point2D, track_xy=self.track_xy, **arrays)
+
+    @classmethod
+    def read(cls, path):
+        """
+        Read a model from an .npz file or a COLMAP model directory
+
+        Args:
+            path (str): .npz file written by save() or a COLMAP sparse model directory
+
+        Returns:
+            SubModel: The loaded model
+        """
+        if str(path).endswith('.npz'):
+            with np.load(path) as data:
+                arrays = {key: data[key] for key in data.files}
+            if 'camera_ids' in arrays:
+                intrinsics = arrays.pop('camera_intrinsics')
+                arrays['cameras'] = {camera_id: (model, width, height, row[~np.isnan(row)])
+                                     for camera_id, model, (width, height), row in
+                                     zip(arrays.pop('camera_ids').tolist(), arrays.pop('camera_models').tolist(),
+                                         arrays.pop('camera_sizes').tolist(), intrinsics)}
+            return cls(**arrays)
+
+        import pycolmap
+        return cls.from_reconstruction(pycolmap.Reconstruction(path))
+
+    @classmethod
+    def from_reconstruction(cls, reconstruction):
+        """
+        Convert a pycolmap.Reconstruction into a sub-model
+
+        The cameras are kept as they are in cameras. Every image gets the
+        pinhole parameters (mean focal length, principal point) of its
+        camera, and its observations are undistorted into that pinhole
+        camera with the camera model of the reconstruction.
+
+        Args:
+            reconstruction (pycolmap.Reconstruction): Reconstruction to convert
+
+        Returns:
+            SubModel: The converted model
+        """
+        image_ids = sorted(image_id for image_id, image in reconstruction.images.items() if image.has_pose)
+        image_index = {image_id: index for index, image_id in enumerate(image_ids)}
+        rotations = np.empty((len(image_ids), 3, 3))
+        translations = np.empty((len(image_ids), 3))
+        camera_params = np.empty((len(image_ids), 3))
+        image_camera_ids = np.empty(len(image_ids), dtype=np.int64)
+        cameras = {}
+        image_names = []
+        for index, image_id in enumerate(image_ids):
+            image = reconstruction.images[image_id]
+            pose = image.cam_from_world
+            pose = pose() if callable(pose) else pose
+            rotations[index] = pose.rotation.matrix()
+            translations[index] = pose.translation
+            camera = reconstruction.cameras[image.camera_id]
+            camera_params[index] = (camera.mean_focal_length(), camera.principal_point_x,
+                                    camera.principal_point_y)
+            image_camera_ids[index] = image.camera_id
+            if image.camera_id not in cameras:
+                cameras[image.camera_id] = (camera.model.name, camera.width, camera.height, np.array(camera.params))
+            image_names.append(image.name)
+
+        point_ids = sorted(reconstruction.points3D)
+        points_xyz = np.empty((len(point_ids), 3))
+        points_rgb = np.empty((len(point_ids), 3), dtype=np.uint8)
+        points_error = np.empty(len(point_ids))
+        track_point, track_image, track_point2D, track_xy = [], [], [], []
+        for index, point_id in enumerate(point_ids):
+            point = reconstruction.points3D[point_id]
+            points_xyz[index] = point.xyz
+            points_rgb[index] = point.color
+            points_error[index] = point.error
+            for element in point.track.elements:
+                if element.image_id not in image_index:
+                    continue
+                track_point.append(index)
+                track_image.append(image_index[element.image_id])
+                track_point2D.append(element.point2D_idx)
+                track_xy.append(reconstruction.images[element.image_id].points2D[element.point2D_idx].xy)
+
+        track_image = np.asarray(track_image, dtype=np.int32)
+        track_xy = np.asarray(track_xy, dtype=np.float64).reshape(-1, 2)
+        observation_cameras = image_camera_ids[track_image]
+        for camera_id in cameras:
+            observations = np.flatnonzero(observation_cameras == camera_id)
+            if len(observations):
+                normalized = reconstruction.cameras[camera_id].cam_from_img(track_xy[observations])
+                params = camera_params[track_image[observations]]
+                track_xy[observations] = params[:, :1] * normalized + params[:, 1:]
+
+        return cls(image_names, rotations, translations, camera_params, points_xyz, points_rgb, points_error,
+                   track_point, track_image, track_point2D, track_xy, cameras, image_camera_ids)
+
+    def to_reconstruction(self, min_track_length=1):
+        """
+        Convert the model into a pycolmap.Reconstruction
+
+        The original cameras are restored with their ids, models and
+        parameters, and the observations are distorted back through them.
+        A model built without cameras gets one SIMPLE_PINHOLE camera per
+        image from camera_params, with the image size inferred as twice the
+        principal point. Every camera gets a trivial rig and every image a
+        trivial frame. Images and points keep their order: image i gets id
+        i + 1 and the kept points are added in index order.
+
+        Args:
+            min_track_length (int): Points observed fewer times are left out
+
+        Returns:
+            pycolmap.Reconstruction: The converted reconstruction
+        """
+        import pycolmap
+
+        reconstruction = pycolmap.Reconstruction()
+        track_xy = self.track_xy
+        if self.cameras is not None:
+            track_xy = track_xy.copy()
+            observation_cameras = self.image_camera_ids[self.track_image]
+            for camera_id, (model, width, height, params) in sorted(self.cameras.items()):
+                camera = pycolmap.Camera(model=model, width=width, height=height, params=params, camera_id=camera_id)
+                reconstruction.add_camera_with_trivial_rig(camera)
+                observations = np.flatnonzero(observation_cameras == camera_id)
+                if len(observations):
+                    pinhole = self.camera_params[self.track_image[observations]]
+                    normalized = (self.track_xy[observations] - pinhole[:, 1:]) / pinhole[:, :1]
+                    track_xy[observations] = camera.img_from_cam(
+                        np.column_stack([normalized, np.ones(len(observations))]))
+            image_camera_ids = self.image_camera_ids.tolist()
+        else:
+            image_camera_ids = list(range(1, self.num_images + 1))
+            for index, (focal, cx, cy) in enumerate(self.camera_params):
+                camera = pycolmap.Camera(model='SIMPLE_PINHOLE', width=max(1, round(2 * cx)),
+                                         height=max(1, round(2 * cy)), params=[focal, cx, cy], camera_id=index + 1)
+                reconstruction.add_camera_with_trivial_rig(camera)
+
+        image_order = np.argsort(self.track_image, kind='stable')
+        image_starts = np.searchsorted(self.track_image[image_order], np.arange(self.num_images + 1))
+        for index, name in enumerate(self.image_names):
+            observations = image_order[image_starts[index]:image_starts[index + 1]]
+            keypoints = np.zeros((self.track_point2D[observations].max() + 1 if len(observations) else 0, 2))
+            keypoints[self.track_point2D[observations]] = track_xy[observations]
+            image = pycolmap.Image(name=name, keypoints=keypoints, camera_id=image_camera_ids[index],
+                                   image_id=index + 1)
+            pose = pycolmap.Rigid3d(pycolmap.Rotation3d(self.rotations[index]), self.translations[index])
+            reconstruction.add_image_with_trivial_frame(image, pose)
+
+        order = np.argsort(self.track_point, kind='stable')
+        starts = np.searchsorted(self.track_point[order], np.arange(self.num_points + 1))
+        for index in np.flatnonzero(np.diff(starts) >= min_track_length):
+            track = pycolmap.Track()
+            for observation in order[starts[index]:starts[index + 1]]:
+                track.add_element(int(self.track_image[observation]) + 1, int(self.track_point2D[observation]))
+            reconstruction.add_point3D(self.points_xyz[index], track, self.points_rgb[index])
+        return reconstruction
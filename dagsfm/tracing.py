@@ -0,0 +1,383 @@
+"""
+Lightweight tracing and metrics for DAGSfM-Python
+
+A single module-level Tracer records timed spans, counters and sampled
+memory usage of a run. It is disabled by default: a disabled span is one
+attribute check returning a shared no-op context manager, so the
+instrumentation can stay in hot paths. Recorded data is exported as
+Chrome trace JSON (chrome://tracing, Perfetto) and as a Prometheus text
+exposition file.
+
+Typical use:
+
+    from dagsfm.tracing import tracer, traced
+
+    with tracer.span("partition.normalized_cut", k=8):
+        ...
+    tracer.count("matched_pairs", len(pairs))
+
+    @traced("merging.merge_pair")
+    def merge_pair(self, reference, other):
+        ...
+"""
+
+import functools
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import nullcontext
+
+try:
+    import resource
+except ImportError:  # resource is only available on POSIX systems
+    resource = None
+
+
+def current_rss_bytes():
+    """
+    Resident set size of this process in bytes
+
+    Reads /proc/self/statm where available and falls back to the peak RSS
+    reported by getrusage, 0 if neither is available.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is not None:
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if os.uname().sysname == "Darwin" else maxrss * 1024
+    return 0
+
+
+class _Span:
+    """
+    Context manager recording one complete event when it exits
+    """
+
+    __slots__ = ('tracer', 'name', 'category', 'args', 'timestamp', 'start')
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        # Wall clock for the timestamp, so that events of worker processes line up
+        self.timestamp = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        seconds = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.tracer._record(self.name, self.category, self.timestamp, seconds, self.args)
+        return False
+
+
+_NULL_SPAN = nullcontext()
+
+
+class Tracer:
+    """
+    Collects spans, counters and memory samples of one run
+    """
+
+    def __init__(self):
+        """
+        Initialize a disabled tracer
+        """
+        self.enabled = False
+        self.memory_interval = None
+        self._lock = threading.Lock()
+        self._sampler = None
+        self._stop_sampling = threading.Event()
+        self.reset()
+
+    def reset(self):
+        """
+        Drop everything recorded so far
+        """
+        with self._lock:
+            self.events = []  # Chrome trace events
+            self.span_totals = {}  # span name -> [calls, seconds]
+            self.counters = {}  # counter name -> value
+            self.peak_rss_bytes = 0
+            self.worker_peak_rss_bytes = 0  # largest peak reported by merged worker snapshots
+
+    def start(self, memory_interval=None):
+        """
+        Enable recording
+
+        Args:
+            memory_interval (float): Seconds between RSS samples, None or 0 disables sampling
+        """
+        self.enabled = True
+        self.memory_interval = memory_interval
+        self.sample_memory()
+        # A sampler inherited through fork is not running in this process
+        if memory_interval and (self._sampler is None or not self._sampler.is_alive()):
+            self._stop_sampling.clear()
+            self._sampler = threading.Thread(target=self._sample_loop, name="dagsfm-memory", daemon=True)
+            self._sampler.start()
+
+    def stop(self):
+        """
+        Disable recording, keeping what was recorded
+        """
+        if self._sampler is not None:
+            self._stop_sampling.set()
+            if self._sampler.is_alive():
+                self._sampler.join()
+            self._sampler = None
+        if self.enabled:
+            self.sample_memory()
+        self.enabled = False
+
+    def span(self, name, category="dagsfm", **args):
+        """
+        Time a block of code
+
+        Args:
+            name (str): Span name, e.g. "partition.normalized_cut"
+            category (str): Chrome trace category
+            **args: Values attached to the event
+
+        Returns:
+            Context manager; a shared no-op when the tracer is disabled
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, category, args)
+
+    def count(self, name, value=1):
+        """
+        Add to a counter
+
+        Args:
+            name (str): Counter name, e.g. "matched_pairs"
+            value (float): Increment
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def sample_memory(self):
+        """
+        Record the current RSS as a counter event and update the peak
+        """
+        rss = current_rss_bytes()
+        with self._lock:
+            self.peak_rss_bytes = max(self.peak_rss_bytes, rss)
+            self.events.append({'name': 'rss_mb', 'ph': 'C', 'ts': time.time() * 1e6, 'pid': os.getpid(),
+                                'args': {'rss_mb': round(rss / 2**20, 1)}})
+
+    def snapshot(self):
+        """
+        Everything recorded so far, as a picklable dict for merge()
+        """
+        with self._lock:
+            return {'events': list(self.events), 'span_totals': {name: list(total) for name, total
+                                                                 in self.span_totals.items()},
+                    'counters': dict(self.counters), 'peak_rss_bytes': self.peak_rss_bytes,
+                    'worker_peak_rss_bytes': self.worker_peak_rss_bytes}
+
+    def merge(self, snapshot):
+        """
+        Add the data recorded by another tracer, e.g. in a worker process
+
+        Args:
+            snapshot (dict): Result of snapshot() of the other tracer
+        """
+        with self._lock:
+            self.events.extend(snapshot['events'])
+            for name, (calls, seconds) in snapshot['span_totals'].items():
+                total = self.span_totals.setdefault(name, [0, 0.0])
+                total[0] += calls
+                total[1] += seconds
+            for name, value in snapshot['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            # Worker processes have their own address space, their peak is reported separately
+            self.worker_peak_rss_bytes = max(self.worker_peak_rss_bytes, snapshot['peak_rss_bytes'],
+                                             snapshot['worker_peak_rss_bytes'])
+
+    def chrome_trace(self):
+        """
+        Recorded events in the Chrome trace event format
+
+        Returns:
+            dict: {'traceEvents': [...], 'displayTimeUnit': 'ms'}
+        """
+        with self._lock:
+            events = list(self.events)
+        pids = sorted({event['pid'] for event in events})
+        metadata = [{'name': 'process_name', 'ph': 'M', 'pid': pid,
+                     'args': {'name': 'dagsfm' if pid == os.getpid() else f'dagsfm worker {pid}'}}
+                    for pid in pids]
+        return {'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, path):
+        """
+        Write the Chrome trace JSON file
+
+        Args:
+            path (str): Output file path
+        """
+        _write_atomic(path, json.dumps(self.chrome_trace()))
+
+    def prometheus_text(self):
+        """
+        Span totals, counters and peak RSS in the Prometheus text exposition format
+
+        Returns:
+            str: Exposition text
+        """
+        snapshot = self.snapshot()
+        lines = ["# HELP dagsfm_span_seconds_total Wall time spent in each span",
+                 "# TYPE dagsfm_span_seconds_total counter"]
+        lines += [f'dagsfm_span_seconds_total{{span="{_escape(name)}"}} {seconds:.6f}'
+                  for name, (_, seconds) in sorted(snapshot['span_totals'].items())]
+        lines += ["# HELP dagsfm_span_calls_total Number of times each span was entered",
+                  "# TYPE dagsfm_span_calls_total counter"]
+        lines += [f'dagsfm_span_calls_total{{span="{_escape(name)}"}} {calls}'
+                  for name, (calls, _) in sorted(snapshot['span_totals'].items())]
+        for name, value in sorted(snapshot['counters'].items()):
+            metric = "dagsfm_" + re.sub(r"[^a-zA-Z0-9_]", "_", name) + "_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        lines += ["# HELP dagsfm_peak_rss_bytes Largest sampled resident set size of the main process",
+                  "# TYPE dagsfm_peak_rss_bytes gauge", f"dagsfm_peak_rss_bytes {snapshot['peak_rss_bytes']}",
+                  "# HELP dagsfm_worker_peak_rss_bytes Largest sampled resident set size of a worker process",
+                  "# TYPE dagsfm_worker_peak_rss_bytes gauge",
+                  f"dagsfm_worker_peak_rss_bytes {snapshot['worker_peak_rss_bytes']}"]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """
+        Write the Prometheus text file
+
+        Args:
+            path (str): Output file path
+        """
+        _write_atomic(path, self.prometheus_text())
+
+    def _record(self, name, category, timestamp, seconds, args):
+        event = {'name': name, 'cat': category, 'ph': 'X', 'ts': timestamp * 1e6, 'dur': seconds * 1e6,
+                 'pid': os.getpid(), 'tid': threading.current_thread().name}
+        if args:
+            event['args'] = args
+        with self._lock:
+            self.events.append(event)
+            total = self.span_totals.setdefault(name, [0, 0.0])
+            total[0] += 1
+            total[1] += seconds
+
+    def _sample_loop(self):
+        while not self._stop_sampling.wait(self.memory_interval):
+            self.sample_memory()
+
+
+# The tracer of this process
+tracer = Tracer()
+
+
+def traced(name=None, category="dagsfm"):
+    """
+    Decorator timing every call of a function as a span
+
+    Args:
+        name (str): Span name, defaults to the function's qualified name
+        category (str): Chrome trace category
+    """
+    def decorate(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with tracer.span(span_name, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def run_traced(func, *args, memory_interval=None, **kwargs):
+    """
+    Run a function with tracing enabled, typically inside a worker process
+
+    Args:
+        func (callable): Function to run
+        *args: Positional arguments of func
+        memory_interval (float): Seconds between RSS samples in the worker
+        **kwargs: Keyword arguments of func
+
+    Returns:
+        tuple: (result of func, tracer snapshot to be merged by the caller)
+    """
+    tracer.reset()
+    tracer.start(memory_interval)
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        tracer.stop()
+    snapshot = tracer.snapshot()
+    tracer.reset()
+    return result, snapshot
+
+
+def submit_traced(executor, func, *args, **kwargs):
+    """
+    Submit a function to a process pool, recording its spans in the worker when tracing is enabled
+
+    The worker's spans and counters are merged into this process's tracer
+    when the job finishes. With tracing disabled this is executor.submit.
+
+    Args:
+        executor (concurrent.futures.Executor): Process pool
+        func (callable): Picklable function
+        *args: Positional arguments of func
+        **kwargs: Keyword arguments of func
+
+    Returns:
+        concurrent.futures.Future: Future of the result of func
+    """
+    if not tracer.enabled:
+        return executor.submit(func, *args, **kwargs)
+    inner = executor.submit(run_traced, func, *args, memory_interval=tracer.memory_interval, **kwargs)
+    outer = Future()
+
+    def forward(inner):
+        if inner.cancelled():
+            outer.cancel()
+            return
+        error = inner.exception()
+        if error is not None:
+            outer.set_exception(error)
+            return
+        result, snapshot = inner.result()
+        tracer.merge(snapshot)
+        outer.set_result(result)
+
+    inner.add_done_callback(forward)
+    return outer
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _write_atomic(path, text):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w') as f:
+        f.write(text)
+    os.replace(temp_path, path)
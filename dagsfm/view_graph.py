@@ -0,0 +1,250 @@
+"""
+Compact array-backed view graph for DAGSfM-Python
+"""
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse import csgraph
+
+
+class ViewGraph:
+    """
+    Undirected weighted view graph stored as contiguous arrays.
+
+    Nodes are images addressed by a contiguous int32 index; ``image_ids``
+    maps index -> COLMAP image id (sorted ascending) and
+    ``image_id_to_index`` maps back. Edges are kept once each as COO
+    arrays (``edge_src``, ``edge_dst``, ``edge_weights``) and a symmetric
+    CSR adjacency is built lazily on demand.
+    """
+
+    def __init__(self, image_ids=None, names=None):
+        """
+        Initialize a view graph without edges
+
+        Args:
+            image_ids (array-like): COLMAP image ids of the nodes
+            names (list): Image names aligned with image_ids, optional
+        """
+        image_ids = np.asarray([] if image_ids is None else image_ids, dtype=np.int64)
+        order = np.argsort(image_ids, kind='stable')
+        self.image_ids = image_ids[order]
+        self.names = [names[i] for i in order] if names is not None else None
+        self.edge_src = np.empty(0, dtype=np.int32)
+        self.edge_dst = np.empty(0, dtype=np.int32)
+        self.edge_weights = np.empty(0, dtype=np.float32)
+        self._adjacency = None
+
+    @classmethod
+    def from_edges(cls, image_ids, image_ids1, image_ids2, weights, names=None):
+        """
+        Build a view graph from node ids and edge arrays
+
+        Args:
+            image_ids (array-like): COLMAP image ids of the nodes
+            image_ids1 (array-like): First image id of every edge
+            image_ids2 (array-like): Second image id of every edge
+            weights (array-like): Weight of every edge (e.g. inlier count)
+            names (list): Image names aligned with image_ids, optional
+
+        Returns:
+            ViewGraph: The constructed graph
+        """
+        graph = cls(image_ids, names)
+        graph.add_edges(image_ids1, image_ids2, weights)
+        return graph
+
+    @property
+    def num_nodes(self):
+        return len(self.image_ids)
+
+    @property
+    def num_edges(self):
+        return len(self.edge_src)
+
+    def image_id_to_index(self, image_ids):
+        """
+        Map COLMAP image ids to node indices
+
+        Args:
+            image_ids (array-like): Image ids to look up
+
+        Returns:
+            np.ndarray: int32 node indices, -1 for ids that are not in the graph
+        """
+        image_ids = np.asarray(image_ids, dtype=np.int64)
+        if self.num_nodes == 0:
+            return np.full(image_ids.shape, -1, dtype=np.int32)
+        indices = np.minimum(np.searchsorted(self.image_ids, image_ids), self.num_nodes - 1)
+        found = self.image_ids[indices] == image_ids
+        return np.where(found, indices, -1).astype(np.int32)
+
+    def add_edges(self, image_ids1, image_ids2, weights):
+        """
+        Append edges given by image ids; edges touching unknown images or
+        self-loops are dropped
+
+        Args:
+            image_ids1 (array-like): First image id of every edge
+            image_ids2 (array-like): Second image id of every edge
+            weights (array-like): Weight of every edge
+        """
+        src = self.image_id_to_index(image_ids1)
+        dst = self.image_id_to_index(image_ids2)
+        weights = np.asarray(weights, dtype=np.float32)
+        valid = (src >= 0) & (dst >= 0) & (src != dst)
+        self.edge_src = np.concatenate([self.edge_src, src[valid]])
+        self.edge_dst = np.concatenate([self.edge_dst, dst[valid]])
+        self.edge_weights = np.concatenate([self.edge_weights, weights[valid]])
+        self._adjacency = None
+
+    def adjacency(self):
+        """
+        Symmetric sparse adjacency matrix weighted by edge weights
+
+        Returns:
+            scipy.sparse.csr_matrix: (num_nodes, num_nodes) float32 matrix
+        """
+        if self._adjacency is None:
+            n = self.num_nodes
+            self._adjacency = sp.coo_matrix(
+                (np.concatenate([self.edge_weights, self.edge_weights]),
+                 (np.concatenate([self.edge_src, self.edge_dst]),
+                  np.concatenate([self.edge_dst, self.edge_src]))),
+                shape=(n, n)
+            ).tocsr()
+        return self._adjacency
+
+    def degrees(self):
+        """
+        Number of edges incident to every node
+
+        Returns:
+            np.ndarray: int64 degree per node index
+        """
+        return np.bincount(self.edge_src, minlength=self.num_nodes) + \
+            np.bincount(self.edge_dst, minlength=self.num_nodes)
+
+    def subgraph(self, node_indices):
+        """
+        Induced subgraph on a set of nodes
+
+        Args:
+            node_indices (array-like): Node indices to keep
+
+        Returns:
+            ViewGraph: Subgraph with re-indexed nodes
+        """
+        node_indices = np.unique(np.asarray(node_indices, dtype=np.int64))
+        names = [self.names[i] for i in node_indices] if self.names is not None else None
+        graph = ViewGraph(self.image_ids[node_indices], names)
+        keep = np.zeros(self.num_nodes, dtype=bool)
+        keep[node_indices] = True
+        mask = keep[self.edge_src] & keep[self.edge_dst]
+        remap = np.cumsum(keep, dtype=np.int64) - 1
+        graph.edge_src = remap[self.edge_src[mask]].astype(np.int32)
+        graph.edge_dst = remap[self.edge_dst[mask]].astype(np.int32)
+        graph.edge_weights = self.edge_weights[mask]
+        return graph
+
+    def edge_subgraph(self, edge_mask):
+        """
+        Graph on the same nodes keeping only the selected edges
+
+        Args:
+            edge_mask (np.ndarray): Boolean mask over edges
+
+        Returns:
+            ViewGraph: Graph with the selected edges
+        """
+        edge_mask = np.asarray(edge_mask, dtype=bool)
+        graph = ViewGraph()
+        graph.image_ids = self.image_ids
+        graph.names = self.names
+        graph.edge_src = self.edge_src[edge_mask]
+        graph.edge_dst = self.edge_dst[edge_mask]
+        graph.edge_weights = self.edge_weights[edge_mask]
+        return graph
+
+    def top_k_edges(self, k):
+        """
+        Select the k heaviest edges of every node
+
+        An edge is kept when it is among the k heaviest edges of either of
+        its endpoints, so every node keeps at least min(k, degree) edges. A
+        node can keep more than k: an edge outside its own k heaviest is
+        still kept when it is among the k heaviest of the other endpoint.
+
+        Args:
+            k (int): Number of neighbours kept per node
+
+        Returns:
+            np.ndarray: Boolean mask over edges
+        """
+        # Every edge once from each endpoint, ranked by decreasing weight within its node
+        nodes = np.concatenate([self.edge_src, self.edge_dst])
+        weights = np.concatenate([self.edge_weights, self.edge_weights])
+        order = np.lexsort((-weights, nodes))
+        sorted_nodes = nodes[order]
+        starts = np.searchsorted(sorted_nodes, sorted_nodes, side='left')
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order)) - starts
+        keep = rank < k
+        return keep[:self.num_edges] | keep[self.num_edges:]
+
+    def connected_components(self):
+        """
+        Connected components of the graph
+
+        Returns:
+            tuple: (number of components, component label of every node index)
+        """
+        return csgraph.connected_components(self.adjacency(), directed=False)
+
+    def largest_connected_component(self):
+        """
+        Induced subgraph on the largest connected component
+
+        Returns:
+            ViewGraph: The component, the graph itself if it is already connected
+        """
+        if self.num_nodes == 0:
+            return self
+        num_components, labels = self.connected_components()
+        if num_components == 1:
+            return self
+        largest = np.argmax(np.bincount(labels))
+        return self.subgraph(np.flatnonzero(labels == largest))
+
+    def cut_edges(self, labels):
+        """
+        Find edges whose endpoints carry different labels
+
+        Args:
+            labels (np.ndarray): Label of every node index
+
+        Returns:
+            np.ndarray: Boolean mask over edges, True for cut edges
+        """
+        labels = np.asarray(labels)
+        return labels[self.edge_src] != labels[self.edge_dst]
+
+    def to_networkx(self):
+        """
+        Export the graph to networkx for debugging and visualisation
+
+        Returns:
+            networkx.Graph: Graph keyed by COLMAP image id with 'weight' edge attributes
+        """
+        import networkx as nx
+
+        graph = nx.Graph()
+        if self.names is not None:
+            graph.add_nodes_from((image_id, {'name': name})
+                                 for image_id, name in zip(self.image_ids.tolist(), self.names))
+        else:
+            graph.add_nodes_from(self.image_ids.tolist())
+        graph.add_weighted_edges_from(zip(self.image_ids[self.edge_src].tolist(),
+                                          self.image_ids[self.edge_dst].tolist(),
+                                          self.edge_weights.tolist()))
+        return graph
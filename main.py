@@ -9,25 +9,50 @@ This system divides the SfM problem into several modules:
 2. Scene partitioning module based on view-graph (using N-cut algorithm)
 3. Sub-reconstruction module (using pycolmap or colmap)
 4. Sub-reconstruction merging and Bundle Adjustment
-5. Pipeline orchestration using CGraph Python version
+5. Pipeline orchestration using a task graph (DAG) executor
 
 Author: Your Name
 Date: 2025
 """
 
+import argparse
 import os
 import sys
 
+from dagsfm.pipeline import DAGSfMPipeline
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="DAGSfM-Python: Structure from Motion using Directed Acyclic Graph")
+    parser.add_argument("image_directory", help="Directory containing the input images")
+    parser.add_argument("output_directory", help="Directory for the database, sub-models and merged model")
+    parser.add_argument("--config", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                         "config", "config.yaml"),
+                        help="Path to the YAML configuration file")
+    parser.add_argument("--colmap_path", default="colmap", help="Path to the COLMAP executable")
+    parser.add_argument("--no_resume", action="store_true",
+                        help="Re-run every stage instead of reusing valid outputs from previous runs")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
 
-def main():
     print("DAGSfM-Python: Structure from Motion using Directed Acyclic Graph")
     print("===================================================================")
-    
-    # TODO: Implement main pipeline orchestration
-    # This will use CGraph Python version to manage the workflow
-    
-    print("System initialized. Ready to process images.")
-    
+
+    pipeline = DAGSfMPipeline(args.config, colmap_path=args.colmap_path)
+    model_path = pipeline.run(args.image_directory, args.output_directory, resume=not args.no_resume)
+
+    for node in pipeline.graph.nodes.values():
+        state = "cached" if node.name in pipeline.cached_stages else node.status
+        print(f"  {node.name}: {state} ({node.finished_at - node.started_at:.2f}s)")
+    if model_path is None:
+        print("No sub-reconstruction could be merged")
+        return 1
+    print(f"Merged model written to {model_path}")
+    return 0
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
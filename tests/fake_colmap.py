@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Stand-in for the COLMAP executable in tests
+
+Supports the sub-commands called by the package, prints the progress lines
+COLMAP prints and writes just enough output for the callers:
+
+    feature_extractor  adds the listed images to the images table of the database
+    database_merger    copies the images of both databases into the merged one
+    exhaustive_matcher, spatial_matcher, matches_importer  print matching progress
+    mapper             writes <output_path>/0/images.bin
+
+Environment variables:
+    FAKE_COLMAP_SLEEP      seconds to sleep before exiting
+    FAKE_COLMAP_FAIL_FILE  fail once: exit 1 and create the file if it does not exist yet
+"""
+
+import os
+import sqlite3
+import sys
+import time
+
+
+def parse_options(arguments):
+    options = {}
+    for argument in arguments:
+        key, _, value = argument.lstrip('-').partition('=')
+        options[key] = value
+    return options
+
+
+def create_images_table(connection):
+    connection.execute("CREATE TABLE IF NOT EXISTS images (image_id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, "
+                       "name TEXT NOT NULL UNIQUE, camera_id INTEGER NOT NULL)")
+
+
+def feature_extractor(options):
+    if 'image_list_path' in options:
+        with open(options['image_list_path']) as f:
+            names = [line.strip() for line in f if line.strip()]
+    else:
+        names = sorted(os.listdir(options['image_path']))
+    connection = sqlite3.connect(options['database_path'])
+    create_images_table(connection)
+    for index, name in enumerate(names):
+        connection.execute("INSERT OR IGNORE INTO images (name, camera_id) VALUES (?, 1)", (name,))
+        print(f"Processed file [{index + 1}/{len(names)}]", flush=True)
+        print(f"  Name:            {name}", flush=True)
+    connection.commit()
+    connection.close()
+
+
+def database_merger(options):
+    connection = sqlite3.connect(options['merged_database_path'])
+    create_images_table(connection)
+    for key in ('database_path1', 'database_path2'):
+        connection.execute("ATTACH DATABASE ? AS source", (options[key],))
+        connection.execute("INSERT INTO images (name, camera_id) SELECT name, camera_id FROM source.images")
+        connection.commit()
+        connection.execute("DETACH DATABASE source")
+    connection.close()
+
+
+def exhaustive_matcher(options):
+    for i in range(1, 3):
+        for j in range(1, 3):
+            print(f"Matching block [{i}/2, {j}/2] in 0.001s", flush=True)
+
+
+def spatial_matcher(options):
+    for i in range(1, 4):
+        print(f"Matching image [{i}/3] in 0.001s", flush=True)
+
+
+def matches_importer(options):
+    print("Matching block [1/1]", flush=True)
+
+
+def mapper(options):
+    model_path = os.path.join(options['output_path'], '0')
+    os.makedirs(model_path, exist_ok=True)
+    with open(os.path.join(model_path, 'images.bin'), 'wb') as f:
+        f.write(b'\0' * 8)
+    for index in range(1, 4):
+        print(f"Registering image #{index} ({index})", flush=True)
+
+
+COMMANDS = {
+    'feature_extractor': feature_extractor,
+    'database_merger': database_merger,
+    'exhaustive_matcher': exhaustive_matcher,
+    'spatial_matcher': spatial_matcher,
+    'matches_importer': matches_importer,
+    'mapper': mapper,
+}
+
+
+def main(argv):
+    if not argv or argv[0] not in COMMANDS:
+        print(f"Unknown command: {argv[:1]}", flush=True)
+        return 1
+    fail_file = os.environ.get('FAKE_COLMAP_FAIL_FILE')
+    if fail_file and not os.path.exists(fail_file):
+        open(fail_file, 'w').close()
+        print("E: simulated failure", flush=True)
+        return 1
+    COMMANDS[argv[0]](parse_options(argv[1:]))
+    time.sleep(float(os.environ.get('FAKE_COLMAP_SLEEP', 0)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
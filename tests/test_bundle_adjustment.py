@@ -0,0 +1,95 @@
+"""
+Unit tests for the bundle_adjustment module
+"""
+
+import unittest
+import sys
+import os
+import numpy as np
+
+# Add the project root directory to the path so we can import dagsfm modules
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from dagsfm.bundle_adjustment import (BundleAdjuster, SchurBundleAdjuster, apply_camera_updates, camera_tangents,
+                                      reprojection_jacobians, reprojection_residuals)
+from test_sub_model import make_scene, sub_model_from_scene
+
+
+def perturbed_model(seed=0, num_images=8, num_points=200):
+    """Scene model with noisy points and camera translations, the first image left exact"""
+    model = sub_model_from_scene(make_scene(num_images, num_points, seed=seed), range(num_images))
+    rng = np.random.default_rng(seed)
+    model.points_xyz += rng.normal(scale=0.05, size=model.points_xyz.shape)
+    model.translations[1:] += rng.normal(scale=0.05, size=(num_images - 1, 3))
+    return model
+
+
+class TestBundleAdjustment(unittest.TestCase):
+    """Test cases for the residuals, Jacobians and Levenberg-Marquardt solver"""
+
+    def test_jacobians_match_finite_differences(self):
+        model = perturbed_model()
+        residuals, camera_jacobians, point_jacobians = reprojection_jacobians(model)
+        np.testing.assert_allclose(residuals, reprojection_residuals(model))
+
+        epsilon = 1e-6
+        observation = 5
+        image, point = model.track_image[observation], model.track_point[observation]
+        rotations, translations = model.rotations.copy(), model.translations.copy()
+        for parameter in range(6):
+            update = np.zeros((model.num_images, 6))
+            update[image, parameter] = epsilon
+            model.rotations, model.translations = apply_camera_updates(rotations, translations, update)
+            numeric = (reprojection_residuals(model)[observation] - residuals[observation]) / epsilon
+            np.testing.assert_allclose(numeric, camera_jacobians[observation, :, parameter], rtol=1e-3, atol=1e-3)
+        model.rotations, model.translations = rotations, translations
+        for parameter in range(3):
+            model.points_xyz[point, parameter] += epsilon
+            numeric = (reprojection_residuals(model)[observation] - residuals[observation]) / epsilon
+            model.points_xyz[point, parameter] -= epsilon
+            np.testing.assert_allclose(numeric, point_jacobians[observation, :, parameter], rtol=1e-3, atol=1e-3)
+
+    def test_camera_tangents_invert_updates(self):
+        model = perturbed_model()
+        updates = np.random.default_rng(1).normal(scale=0.1, size=(model.num_images, 6))
+        rotations, translations = apply_camera_updates(model.rotations, model.translations, updates)
+        np.testing.assert_allclose(camera_tangents(rotations, translations, model.rotations, model.translations),
+                                   updates, atol=1e-12)
+
+    def test_adjust_recovers_scene(self):
+        model = perturbed_model()
+        statistics = BundleAdjuster().adjust(model, fixed_images=[0])
+        self.assertLess(statistics['final_cost'], 1e-6 * statistics['initial_cost'])
+
+    def test_point_priors_pull_points(self):
+        model = perturbed_model()
+        targets = model.points_xyz[:10] + 1.0
+        priors = {'indices': np.arange(10), 'targets': targets, 'weight': 1e9}
+        BundleAdjuster().adjust(model, fixed_images=[0], point_priors=priors)
+        np.testing.assert_allclose(model.points_xyz[:10], targets, atol=1e-2)
+
+
+    def test_schur_step_matches_direct_solve(self):
+        model = perturbed_model()
+        fixed = np.zeros(model.num_images, dtype=bool)
+        fixed[0] = True
+        residuals, camera_jacobians, point_jacobians = reprojection_jacobians(model)
+        direct = BundleAdjuster()
+        schur = SchurBundleAdjuster(cg_tolerance=1e-12)
+        blocks = direct._normal_equations(model, residuals, camera_jacobians, point_jacobians, (None, None), fixed)
+        direct_step = direct._solve_step(model, blocks, 1e-3)
+        schur_step = schur._solve_step(model, blocks, 1e-3)
+        np.testing.assert_allclose(schur_step[0], direct_step[0], atol=1e-8)
+        np.testing.assert_allclose(schur_step[1], direct_step[1], atol=1e-8)
+
+    def test_schur_adjust_recovers_scene(self):
+        model = perturbed_model(num_images=10, num_points=500)
+        adjuster = SchurBundleAdjuster()
+        statistics = adjuster.adjust(model, fixed_images=[0])
+        self.assertLess(statistics['final_cost'], 1e-6 * statistics['initial_cost'])
+        self.assertTrue(all(iterations > 0 for iterations in adjuster.cg_iterations))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+"""
+Unit tests for the colmap_runner module
+"""
+
+import unittest
+import sys
+import os
+import sqlite3
+import tempfile
+import time
+
+# Add the project root directory to the path so we can import dagsfm modules
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from dagsfm.colmap_runner import ColmapRunner
+from dagsfm.features import FeatureExtractor
+from dagsfm.reconstruction import SubReconstructor
+
+# Runs tests/fake_colmap.py in place of the COLMAP executable
+FAKE_COLMAP = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_colmap.py")]
+
+
+class TestColmapRunner(unittest.TestCase):
+    """Test cases for the ColmapRunner class with the fake COLMAP"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.image_directory = os.path.join(self.temp_dir.name, "images")
+        os.makedirs(self.image_directory)
+        for index in range(6):
+            open(os.path.join(self.image_directory, f"image_{index}.jpg"), 'w').close()
+        self.database_path = os.path.join(self.temp_dir.name, "database.db")
+        self.environ = dict(os.environ)
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+        self.temp_dir.cleanup()
+
+    def test_command_is_an_argv_list(self):
+        runner = ColmapRunner("/opt/colmap")
+        self.assertEqual(runner.command("mapper", {"database_path": "a b.db", "Mapper.num_threads": 4}),
+                         ["/opt/colmap", "mapper", "--database_path=a b.db", "--Mapper.num_threads=4"])
+
+    def test_progress_is_parsed_into_metrics(self):
+        progress = []
+        runner = ColmapRunner(FAKE_COLMAP, progress_callback=lambda *args: progress.append(args))
+        metrics = runner.run("feature_extractor", {"database_path": self.database_path,
+                                                   "image_path": self.image_directory})
+        self.assertEqual(metrics['unit'], 'images')
+        self.assertEqual(metrics['items'], 6)
+        self.assertGreater(metrics['rate'], 0)
+        self.assertEqual(progress[-1], ("feature_extractor", "images", 6, 6))
+
+        runner.run("exhaustive_matcher", {"database_path": self.database_path}, work_items=15)
+        summary = runner.summary()
+        self.assertEqual(summary['exhaustive_matcher']['unit'], 'pairs')
+        self.assertEqual(summary['exhaustive_matcher']['items'], 15)
+        self.assertEqual(summary['feature_extractor']['runs'], 1)
+
+    def test_failure_is_retried(self):
+        os.environ['FAKE_COLMAP_FAIL_FILE'] = os.path.join(self.temp_dir.name, "failed")
+        with self.assertRaises(RuntimeError) as context:
+            ColmapRunner(FAKE_COLMAP).run("spatial_matcher")
+        self.assertIn("simulated failure", str(context.exception))
+
+        os.remove(os.environ['FAKE_COLMAP_FAIL_FILE'])
+        metrics = ColmapRunner(FAKE_COLMAP, retries=1).run("spatial_matcher")
+        self.assertEqual(metrics['attempts'], 2)
+
+    def test_timeout_kills_the_command(self):
+        os.environ['FAKE_COLMAP_SLEEP'] = "10"
+        start = time.perf_counter()
+        with self.assertRaises(RuntimeError) as context:
+            ColmapRunner(FAKE_COLMAP, timeout=1).run("spatial_matcher")
+        self.assertIn("timed out", str(context.exception))
+        self.assertLess(time.perf_counter() - start, 5)
+
+    def test_unknown_executable_raises(self):
+        with self.assertRaises(RuntimeError):
+            ColmapRunner(os.path.join(self.temp_dir.name, "missing_colmap")).run("mapper")
+
+    def test_run_many_keeps_job_order(self):
+        runner = ColmapRunner(FAKE_COLMAP, num_workers=2)
+        results = runner.run_many([("spatial_matcher", {}), ("matches_importer", {}), ("exhaustive_matcher", {})])
+        self.assertEqual([metrics['subcommand'] for metrics in results],
+                         ["spatial_matcher", "matches_importer", "exhaustive_matcher"])
+
+    def test_components_run_through_the_runner(self):
+        runner = ColmapRunner(FAKE_COLMAP)
+        extractor = FeatureExtractor(runner=runner)
+        extractor.extract_features(self.image_directory, self.database_path)
+        connection = sqlite3.connect(self.database_path)
+        self.assertEqual(connection.execute("SELECT COUNT(*) FROM images").fetchone(), (6,))
+        connection.close()
+
+        extractor.worker_slots = [{"use_gpu": 0}, {"use_gpu": 0}]
+        extractor.shard_size = 2
+        extractor.extract_features_sharded(self.image_directory, os.path.join(self.temp_dir.name, "sharded.db"))
+        self.assertEqual(runner.summary()['database_merger']['runs'], 2)
+
+        reconstructor = SubReconstructor(use_pycolmap=False, runner=runner)
+        model_path = reconstructor.run_incremental_sfm(self.database_path, self.image_directory,
+                                                       os.path.join(self.temp_dir.name, "sparse"))
+        self.assertEqual(os.path.basename(model_path), "0")
+        self.assertEqual(runner.summary()['mapper']['items'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
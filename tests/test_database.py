@@ -0,0 +1,151 @@
+"""
+Unit tests for the database module
+"""
+
+import unittest
+import sys
+import os
+import sqlite3
+import tempfile
+from unittest import mock
+import numpy as np
+
+# Add the project root directory to the path so we can import dagsfm modules
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from dagsfm.database import (MAX_IMAGE_ID, delete_images, image_ids_to_pair_ids, iter_descriptors,
+                             pair_ids_to_image_ids, read_images, read_two_view_geometry_edges, slice_database)
+
+
+def create_test_database(database_path, num_images, pairs):
+    """
+    Create a minimal COLMAP-schema database for tests
+
+    Args:
+        database_path (str): Path of the database file to create
+        num_images (int): Number of images, named image_<id>.jpg with ids starting at 1
+        pairs (list): List of (image_id1, image_id2, num_inliers) tuples
+    """
+    connection = sqlite3.connect(database_path)
+    connection.executescript("""
+        CREATE TABLE cameras (camera_id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, model INTEGER NOT NULL,
+                              width INTEGER NOT NULL, height INTEGER NOT NULL, params BLOB,
+                              prior_focal_length INTEGER NOT NULL);
+        CREATE TABLE images (image_id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+                             name TEXT NOT NULL UNIQUE, camera_id INTEGER NOT NULL);
+        CREATE UNIQUE INDEX index_name ON images(name);
+        CREATE TABLE keypoints (image_id INTEGER PRIMARY KEY NOT NULL, rows INTEGER NOT NULL,
+                                cols INTEGER NOT NULL, data BLOB);
+        CREATE TABLE matches (pair_id INTEGER PRIMARY KEY NOT NULL, rows INTEGER NOT NULL,
+                              cols INTEGER NOT NULL, data BLOB);
+        CREATE TABLE two_view_geometries (pair_id INTEGER PRIMARY KEY NOT NULL,
+                                          rows INTEGER NOT NULL, cols INTEGER NOT NULL,
+                                          data BLOB, config INTEGER NOT NULL,
+                                          F BLOB, E BLOB, H BLOB, qvec BLOB, tvec BLOB);
+    """)
+    connection.execute("INSERT INTO cameras VALUES (1, 0, 640, 480, NULL, 0)")
+    for image_id in range(1, num_images + 1):
+        connection.execute("INSERT INTO images (image_id, name, camera_id) VALUES (?, ?, 1)",
+                           (image_id, f"image_{image_id}.jpg"))
+        keypoints = np.zeros((100, 6), dtype=np.float32)
+        connection.execute("INSERT INTO keypoints VALUES (?, 100, 6, ?)", (image_id, keypoints.tobytes()))
+    for image_id1, image_id2, num_inliers in pairs:
+        pair_id = int(image_ids_to_pair_ids([image_id1], [image_id2])[0])
+        data = np.zeros((num_inliers, 2), dtype=np.uint32).tobytes()
+        connection.execute("INSERT INTO matches VALUES (?, ?, 2, ?)", (pair_id, num_inliers, data))
+        connection.execute(
+            "INSERT INTO two_view_geometries (pair_id, rows, cols, data, config) VALUES (?, ?, 2, ?, 2)",
+            (pair_id, num_inliers, data))
+    connection.commit()
+    connection.close()
+
+
+class TestDatabase(unittest.TestCase):
+    """Test cases for the COLMAP database helpers"""
+
+    def setUp(self):
+        """Set up a small database before each test method"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.database_path = os.path.join(self.temp_dir.name, "database.db")
+        self.pairs = [(1, 2, 50), (2, 3, 20), (1, 4, 7)]
+        create_test_database(self.database_path, 4, self.pairs)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_pair_id_round_trip(self):
+        ids1 = np.array([1, 7, 2**20])
+        ids2 = np.array([3, 2, 5])
+        pair_ids = image_ids_to_pair_ids(ids1, ids2)
+        self.assertEqual(pair_ids[0], 1 * MAX_IMAGE_ID + 3)
+        decoded1, decoded2 = pair_ids_to_image_ids(pair_ids)
+        np.testing.assert_array_equal(decoded1, np.minimum(ids1, ids2))
+        np.testing.assert_array_equal(decoded2, np.maximum(ids1, ids2))
+
+    def test_read_images(self):
+        image_ids, names = read_images(self.database_path)
+        np.testing.assert_array_equal(image_ids, [1, 2, 3, 4])
+        self.assertEqual(names[0], "image_1.jpg")
+
+    def test_connections_are_closed(self):
+        connection = sqlite3.connect(self.database_path)
+        connection.execute("CREATE TABLE descriptors (image_id INTEGER PRIMARY KEY, rows INTEGER, cols INTEGER, data BLOB)")
+        connection.execute("INSERT INTO descriptors VALUES (1, 1, 128, ?)", (bytes(128),))
+        connection.commit()
+        connection.close()
+        connections = []
+        connect = sqlite3.connect
+
+        def recording_connect(*args, **kwargs):
+            connections.append(connect(*args, **kwargs))
+            return connections[-1]
+
+        with mock.patch("dagsfm.database.sqlite3.connect", recording_connect):
+            read_images(self.database_path)
+            list(iter_descriptors(self.database_path, [1, 2]))
+            delete_images(self.database_path, [4])
+        self.assertEqual(len(connections), 3)
+        for connection in connections:
+            with self.assertRaises(sqlite3.ProgrammingError):
+                connection.execute("SELECT 1")
+        np.testing.assert_array_equal(read_images(self.database_path)[0], [1, 2, 3])
+
+    def test_read_two_view_geometry_edges_in_chunks(self):
+        ids1, ids2, inliers = read_two_view_geometry_edges(self.database_path, chunk_size=2)
+        edges = sorted(zip(ids1.tolist(), ids2.tolist(), inliers.tolist()))
+        self.assertEqual(edges, sorted(self.pairs))
+
+    def test_read_two_view_geometry_edges_empty(self):
+        empty_path = os.path.join(self.temp_dir.name, "empty.db")
+        create_test_database(empty_path, 2, [])
+        ids1, ids2, inliers = read_two_view_geometry_edges(empty_path)
+        self.assertEqual(len(ids1), 0)
+        self.assertEqual(len(inliers), 0)
+
+    def test_slice_database(self):
+        output_directory = os.path.join(self.temp_dir.name, "clusters")
+        paths = slice_database(self.database_path, {0: [1, 2], 1: [2, 3, 4]}, output_directory)
+        self.assertEqual(set(paths), {0, 1})
+
+        image_ids, names = read_images(paths[0])
+        np.testing.assert_array_equal(image_ids, [1, 2])
+        ids1, ids2, _ = read_two_view_geometry_edges(paths[0])
+        self.assertEqual(list(zip(ids1.tolist(), ids2.tolist())), [(1, 2)])
+
+        image_ids, _ = read_images(paths[1])
+        np.testing.assert_array_equal(image_ids, [2, 3, 4])
+        ids1, ids2, _ = read_two_view_geometry_edges(paths[1])
+        self.assertEqual(list(zip(ids1.tolist(), ids2.tolist())), [(2, 3)])
+
+        connection = sqlite3.connect(paths[1])
+        self.assertEqual(connection.execute("SELECT COUNT(*) FROM keypoints").fetchone()[0], 3)
+        self.assertEqual(connection.execute("SELECT COUNT(*) FROM matches").fetchone()[0], 1)
+        self.assertEqual(connection.execute("SELECT COUNT(*) FROM cameras").fetchone()[0], 1)
+        index_names = [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")]
+        self.assertIn("index_name", index_names)
+        connection.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
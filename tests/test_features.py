@@ -4,13 +4,22 @@ Unit tests for the features module
 
 import sys
 import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+import numpy as np
 
 # Add the project root directory to the path so we can import dagsfm modules
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 
-from dagsfm.features import FeatureExtractor, FeatureMatcher
-from dagsfm.utils import create_database_file
+from dagsfm.database import read_images
+from dagsfm.features import FeatureExtractor, FeatureMatcher, match_descriptors
+from dagsfm.utils import create_database_file, load_images_from_directory
+from test_database import create_test_database
+from test_retrieval import add_place_descriptors
 
 
 def test_feature_extraction():
@@ -118,6 +127,366 @@ def test_full_pipeline():
     return matching_success
 
 
+class ShardRecordingExtractor(FeatureExtractor):
+    """
+    Extractor whose shards are tiny sqlite databases listing their images and slot,
+    merged in Python instead of with COLMAP
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+        self.merged_pairs = []
+
+    def extract_shard(self, image_directory, image_names, database_path, slot):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.05)
+        connection = sqlite3.connect(database_path)
+        connection.execute("CREATE TABLE images (name TEXT NOT NULL UNIQUE, options TEXT NOT NULL)")
+        options = " ".join(f"--{k}={v}" for k, v in sorted(self.slot_options(slot).items()))
+        connection.executemany("INSERT INTO images VALUES (?, ?)", [(name, options) for name in image_names])
+        connection.commit()
+        connection.close()
+        with self.lock:
+            self.running -= 1
+
+    def merge_database_pair(self, database_path1, database_path2, merged_database_path):
+        with self.lock:
+            self.merged_pairs.append((database_path1, database_path2))
+        connection = sqlite3.connect(merged_database_path)
+        connection.execute("CREATE TABLE images (name TEXT NOT NULL UNIQUE, options TEXT NOT NULL)")
+        for path in (database_path1, database_path2):
+            connection.execute("ATTACH DATABASE ? AS source", (path,))
+            connection.execute("INSERT INTO images SELECT * FROM source.images")
+            connection.commit()
+            connection.execute("DETACH DATABASE source")
+        connection.close()
+        return merged_database_path
+
+
+class TestShardedFeatureExtraction(unittest.TestCase):
+    """Test cases for the sharded, multi-slot feature extraction"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.image_directory = os.path.join(self.temp_dir.name, "images")
+        os.makedirs(self.image_directory)
+        for index in range(10):
+            open(os.path.join(self.image_directory, f"image_{index}.jpg"), 'w').close()
+        self.database_path = os.path.join(self.temp_dir.name, "database.db")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def read_images(self):
+        connection = sqlite3.connect(self.database_path)
+        rows = connection.execute("SELECT name, options FROM images ORDER BY name").fetchall()
+        connection.close()
+        return rows
+
+    def test_colmap_path_is_kept(self):
+        self.assertEqual(FeatureExtractor("/opt/colmap/bin/colmap").colmap_path, "/opt/colmap/bin/colmap")
+
+    def test_shards_are_extracted_concurrently_and_merged(self):
+        slots = [{"use_gpu": 1, "gpu_index": 0}, {"use_gpu": 1, "gpu_index": 1}, {"use_gpu": 0, "num_threads": 4}]
+        extractor = ShardRecordingExtractor(worker_slots=slots, shard_size=3)
+        self.assertEqual(extractor.extract_features(self.image_directory, self.database_path), self.database_path)
+
+        rows = self.read_images()
+        self.assertEqual([name for name, _ in rows], [f"image_{index}.jpg" for index in range(10)])
+        self.assertGreater(extractor.max_running, 1)
+        self.assertLessEqual(extractor.max_running, len(slots))
+        used = {options for _, options in rows}
+        self.assertTrue(used <= {"--SiftExtraction.gpu_index=0 --SiftExtraction.use_gpu=1",
+                                 "--SiftExtraction.gpu_index=1 --SiftExtraction.use_gpu=1",
+                                 "--SiftExtraction.num_threads=4 --SiftExtraction.use_gpu=0"})
+        self.assertFalse(os.path.exists(self.database_path + ".shards"))
+
+    def test_existing_database_is_merged_first(self):
+        connection = sqlite3.connect(self.database_path)
+        connection.execute("CREATE TABLE images (name TEXT NOT NULL UNIQUE, options TEXT NOT NULL)")
+        connection.execute("INSERT INTO images VALUES ('old.jpg', 'previous run')")
+        connection.commit()
+        connection.close()
+        extractor = ShardRecordingExtractor(worker_slots=FeatureExtractor.cpu_worker_slots(2), shard_size=4,
+                                            incremental=False)
+        extractor.extract_features(self.image_directory, self.database_path)
+        self.assertEqual(len(self.read_images()), 11)
+        self.assertIn(("old.jpg", "previous run"), self.read_images())
+        # The shards are combined first, the existing database takes part in a single, final merge
+        main_merges = [pair for pair in extractor.merged_pairs if self.database_path in pair]
+        self.assertEqual(main_merges, [extractor.merged_pairs[-1]])
+        self.assertEqual(main_merges[0][0], self.database_path)
+
+    def test_shard_failure_is_raised(self):
+        class FailingExtractor(ShardRecordingExtractor):
+            def extract_shard(self, image_directory, image_names, database_path, slot):
+                raise RuntimeError("COLMAP feature extraction failed")
+
+        extractor = FailingExtractor(worker_slots=[{"use_gpu": 0}], shard_size=4)
+        with self.assertRaises(RuntimeError):
+            extractor.extract_features(self.image_directory, self.database_path)
+
+
+class ListRecordingExtractor(FeatureExtractor):
+    """
+    Extractor that records the images it is asked to extract and adds them to the database
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.extracted = []
+
+    def extract_features_single(self, image_path, database_path, image_names=None):
+        if image_names is None:
+            image_names = [os.path.basename(path) for path in load_images_from_directory(image_path)]
+        self.extracted.append(sorted(image_names))
+        connection = sqlite3.connect(database_path)
+        for name in image_names:
+            connection.execute("INSERT INTO images (name, camera_id) VALUES (?, 1)", (name,))
+        connection.commit()
+        connection.close()
+        return database_path
+
+
+class TestIncrementalFeatureExtraction(unittest.TestCase):
+    """Test cases for skipping images that were already extracted"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.image_directory = os.path.join(self.temp_dir.name, "images")
+        os.makedirs(self.image_directory)
+        # image_1.jpg .. image_4.jpg are already in the database, matched with each other
+        for image_id in range(1, 5):
+            self.write_image(f"image_{image_id}.jpg", b"original")
+        self.database_path = os.path.join(self.temp_dir.name, "database.db")
+        create_test_database(self.database_path, 4, [(1, 2, 50), (2, 3, 40), (3, 4, 30)])
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_image(self, name, content):
+        with open(os.path.join(self.image_directory, name), 'wb') as f:
+            f.write(content)
+
+    def test_only_new_images_are_extracted(self):
+        extractor = ListRecordingExtractor()
+        self.write_image("image_5.jpg", b"new")
+        extractor.extract_features(self.image_directory, self.database_path)
+        self.assertEqual(extractor.extracted, [["image_5.jpg"]])
+
+        # Nothing changed since the last run, COLMAP is not invoked at all
+        extractor.extract_features(self.image_directory, self.database_path)
+        self.assertEqual(len(extractor.extracted), 1)
+        self.assertTrue(os.path.exists(extractor.manifest_path(self.database_path)))
+
+    def test_changed_images_are_replaced(self):
+        for image_signature in ("stat", "sha1"):
+            with self.subTest(image_signature=image_signature):
+                self.setUp()
+                extractor = ListRecordingExtractor(image_signature=image_signature)
+                extractor.extract_features(self.image_directory, self.database_path)
+                self.assertEqual(extractor.extracted, [])
+
+                self.write_image("image_2.jpg", b"edited image")
+                extractor.extract_features(self.image_directory, self.database_path)
+                self.assertEqual(extractor.extracted, [["image_2.jpg"]])
+
+                image_ids, names = read_images(self.database_path)
+                self.assertEqual(sorted(names), [f"image_{image_id}.jpg" for image_id in range(1, 5)])
+                connection = sqlite3.connect(self.database_path)
+                self.assertEqual(connection.execute("SELECT COUNT(*) FROM keypoints WHERE image_id = 2").fetchone(),
+                                 (0,))
+                self.assertEqual(connection.execute("SELECT COUNT(*) FROM two_view_geometries").fetchone(), (1,))
+                connection.close()
+                self.tearDown()
+
+    def test_pending_images_does_not_modify_the_database(self):
+        extractor = ListRecordingExtractor()
+        extractor.extract_features(self.image_directory, self.database_path)
+        self.write_image("image_2.jpg", b"edited image")
+        self.write_image("image_5.jpg", b"new")
+        with open(self.database_path, 'rb') as f:
+            before = f.read()
+        pending, signatures, stale_image_ids = extractor.pending_images(self.image_directory, self.database_path)
+        self.assertEqual(sorted(pending), ["image_2.jpg", "image_5.jpg"])
+        self.assertEqual(len(signatures), 5)
+        self.assertEqual(stale_image_ids, [2])
+        with open(self.database_path, 'rb') as f:
+            self.assertEqual(f.read(), before)
+
+    def test_new_database_extracts_whole_directory(self):
+        os.remove(self.database_path)
+        extractor = ListRecordingExtractor()
+        extracted = []
+        extractor.extract_features_single = lambda image_path, database_path, image_names=None: \
+            extracted.append(image_names)
+        extractor.extract_features(self.image_directory, self.database_path)
+        self.assertEqual(extracted, [None])
+        self.assertEqual(len(extractor.read_manifest(self.database_path)), 4)
+
+    def test_disabled_incremental_extracts_everything(self):
+        extractor = ListRecordingExtractor(incremental=False)
+        extracted = []
+        extractor.extract_features_single = lambda image_path, database_path, image_names=None: \
+            extracted.append(image_names)
+        extractor.extract_features(self.image_directory, self.database_path)
+        self.assertEqual(extracted, [None])
+        self.assertFalse(os.path.exists(extractor.manifest_path(self.database_path)))
+
+
+class TestBuildMatchingGraph(unittest.TestCase):
+    """Test cases for building the view graph from the database"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.database_path = os.path.join(self.temp_dir.name, "database.db")
+        # Every image of create_test_database has 100 keypoints
+        create_test_database(self.database_path, 5, [(1, 2, 50), (2, 3, 10), (3, 4, 30), (1, 4, 5)])
+        self.matcher = FeatureMatcher()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def edges(self, graph):
+        ids1 = graph.image_ids[graph.edge_src]
+        ids2 = graph.image_ids[graph.edge_dst]
+        return {(int(u), int(v)): float(w) for u, v, w in zip(ids1, ids2, graph.edge_weights)}
+
+    def test_inlier_weights(self):
+        graph = self.matcher.build_matching_graph(self.database_path)
+        self.assertEqual(graph.num_nodes, 5)
+        self.assertEqual(graph.names[0], "image_1.jpg")
+        self.assertEqual(self.edges(graph), {(1, 2): 50, (2, 3): 10, (3, 4): 30, (1, 4): 5})
+
+    def test_log_and_normalized_weights(self):
+        log_edges = self.edges(self.matcher.build_matching_graph(self.database_path, weighting="log"))
+        self.assertAlmostEqual(log_edges[(1, 2)], np.log1p(50), places=5)
+        normalized = self.edges(self.matcher.build_matching_graph(self.database_path, weighting="normalized"))
+        self.assertAlmostEqual(normalized[(3, 4)], 0.3, places=6)
+        with self.assertRaises(ValueError):
+            self.matcher.build_matching_graph(self.database_path, weighting="unknown")
+
+    def test_min_inliers_prunes_edges(self):
+        graph = self.matcher.build_matching_graph(self.database_path, min_inliers=10)
+        self.assertEqual(set(self.edges(graph)), {(1, 2), (2, 3), (3, 4)})
+        # Isolated images stay in the graph as nodes
+        self.assertEqual(graph.num_nodes, 5)
+
+
+class TestPairMatching(unittest.TestCase):
+    """Test cases for the parallel, resumable pair-list matcher"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.database_path = os.path.join(self.temp_dir.name, "database.db")
+        create_test_database(self.database_path, 8, [])
+        add_place_descriptors(self.database_path, 2, 4, num_descriptors=100)
+        self.matcher = FeatureMatcher()
+        self.matcher.pair_matching_cfg.update(chunk_size=2, num_workers=1)
+        self.pairs = np.array([[1, 2], [3, 1], [2, 3], [1, 4], [5, 6], [6, 7], [7, 8]])
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def read_matches(self):
+        connection = sqlite3.connect(self.database_path)
+        rows = connection.execute("SELECT pair_id, rows FROM matches").fetchall()
+        tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        connection.close()
+        return dict(rows), tables
+
+    def test_match_descriptors(self):
+        rng = np.random.default_rng(0)
+        descriptors1 = rng.integers(0, 256, size=(50, 128)).astype(np.uint8)
+        permutation = rng.permutation(50)
+        matches = match_descriptors(descriptors1, descriptors1[permutation])
+        self.assertEqual(len(matches), 50)
+        np.testing.assert_array_equal(permutation[matches[:, 1]], matches[:, 0])
+        self.assertEqual(len(match_descriptors(descriptors1, descriptors1[:1])), 0)
+
+    def test_all_pairs_are_matched(self):
+        self.assertEqual(self.matcher.match_pairs(self.database_path, self.pairs), len(self.pairs))
+        matches, tables = self.read_matches()
+        self.assertEqual(len(matches), len(self.pairs))
+        # Images of one place share about half of their descriptors
+        self.assertTrue(all(count > 10 for count in matches.values()))
+        self.assertNotIn("dagsfm_matching_progress", tables)
+
+    def test_interrupted_run_resumes(self):
+        connection = sqlite3.connect(self.database_path)
+        blob = connection.execute("SELECT data FROM descriptors WHERE image_id = 8").fetchone()[0]
+        connection.execute("UPDATE descriptors SET data = ? WHERE image_id = 8", (blob[:-1],))
+        connection.commit()
+        connection.close()
+        with self.assertRaises(ValueError):
+            self.matcher.match_pairs(self.database_path, self.pairs)
+        matches, tables = self.read_matches()
+        self.assertIn("dagsfm_matching_progress", tables)
+        self.assertEqual(len(matches), 6)
+
+        connection = sqlite3.connect(self.database_path)
+        connection.execute("UPDATE descriptors SET data = ? WHERE image_id = 8", (blob,))
+        connection.commit()
+        connection.close()
+        # Only the chunk holding (7, 8) is matched again
+        self.assertEqual(self.matcher.match_pairs(self.database_path, self.pairs), 1)
+        self.assertEqual(len(self.read_matches()[0]), 7)
+
+    def test_blocked_distances_match_dense(self):
+        rng = np.random.default_rng(1)
+        descriptors1 = rng.integers(0, 256, size=(300, 128)).astype(np.uint8)
+        descriptors2 = np.concatenate([descriptors1[:150], rng.integers(0, 256, size=(200, 128))]).astype(np.uint8)
+        dense = match_descriptors(descriptors1, descriptors2, block_size=len(descriptors1))
+        self.assertEqual(len(dense), 150)
+        for block_size in (1, 7, 64):
+            np.testing.assert_array_equal(match_descriptors(descriptors1, descriptors2, block_size=block_size), dense)
+
+    def test_interrupted_verification_resumes(self):
+        names = dict(zip(*read_images(self.database_path)))
+        match_list_path = os.path.join(self.temp_dir.name, "pairs.txt")
+        with open(match_list_path, 'w') as f:
+            f.writelines(f"{names[int(i)]} {names[int(j)]}\n" for i, j in self.pairs)
+
+        runner = ChunkRecordingRunner(fail_on_call=3)
+        self.matcher.runner = runner
+        with self.assertRaises(RuntimeError):
+            self.matcher.pair_list_matcher(self.database_path, match_list_path)
+        self.assertEqual([len(chunk) for chunk in runner.chunks], [2, 2, 2])
+        _, tables = self.read_matches()
+        self.assertIn("dagsfm_matching_progress", tables)
+
+        # Neither the matched pairs nor the verified chunks are processed again
+        runner.fail_on_call = None
+        num_matched = []
+        match_pairs = self.matcher.match_pairs
+        self.matcher.match_pairs = lambda *args, **kwargs: num_matched.append(match_pairs(*args, **kwargs))
+        self.matcher.pair_list_matcher(self.database_path, match_list_path)
+        self.assertEqual(num_matched, [0])
+        self.assertEqual(runner.chunks[3:], [runner.chunks[2], [f"{names[7]} {names[8]}"]])
+        _, tables = self.read_matches()
+        self.assertNotIn("dagsfm_matching_progress", tables)
+
+
+class ChunkRecordingRunner:
+    """COLMAP runner that records the pair list of every matches_importer call"""
+
+    def __init__(self, fail_on_call=None):
+        self.chunks = []
+        self.fail_on_call = fail_on_call
+
+    def run(self, command, options, work_items=None):
+        with open(options["match_list_path"], 'r') as f:
+            self.chunks.append(f.read().split("\n")[:-1])
+        if len(self.chunks) == self.fail_on_call:
+            raise RuntimeError(f"{command} failed")
+        return {}
+
+
 if __name__ == "__main__":
     # 配置真实测试路径 - 请在这里修改为您实际的路径
     IMAGE_PATH = "/ws/18_nfs/zwl/Data/DJI/jimeimigu/images"      # 修改为您的实际图像路径
@@ -2,14 +2,59 @@
 Unit tests for the merging module
 """
 
+import importlib.util
 import unittest
 import sys
 import os
+import tempfile
+import threading
+import time
 
-# Add the dagsfm directory to the path so we can import modules
-sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'dagsfm'))
+import numpy as np
 
-from merging import SubReconstructionMerger
+# Add the project root directory to the path so we can import dagsfm modules
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from dagsfm.bundle_adjustment import reprojection_residuals
+from dagsfm.merging import (SubReconstructionMerger, batched_umeyama, estimate_sim3, find_correspondences,
+                            maximum_spanning_tree)
+from dagsfm.sub_model import SubModel
+from dagsfm.tracing import tracer
+from test_sub_model import make_scene, opencv_reconstruction, random_rotation, sub_model_from_scene
+
+
+class NamedModel:
+    """Stand-in sub-reconstruction that only knows its image names"""
+
+    def __init__(self, image_names, parts=None):
+        self.image_names = list(image_names)
+        self.parts = parts or [tuple(sorted(self.image_names))]
+
+
+class UnionMerger(SubReconstructionMerger):
+    """Merger whose pairwise merge is a plain union, recording concurrency"""
+
+    def __init__(self, num_workers=None):
+        super().__init__(num_workers)
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def merge_pair(self, reference, other):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.05)
+        with self.lock:
+            self.active -= 1
+        return NamedModel(sorted(set(reference.image_names) | set(other.image_names)),
+                          reference.parts + other.parts)
+
+
+def chain_models(num_models, overlap=2, size=10):
+    """Sub-models laid out along a corridor, neighbours sharing `overlap` images"""
+    return [NamedModel(range(i * (size - overlap), i * (size - overlap) + size)) for i in range(num_models)]
 
 
 class TestSubReconstructionMerger(unittest.TestCase):
@@ -22,10 +67,256 @@ class TestSubReconstructionMerger(unittest.TestCase):
     def test_init(self):
         """Test SubReconstructionMerger initialization"""
         self.assertIsInstance(self.merger, SubReconstructionMerger)
-    
-    # TODO: Add tests for alignment, merging and bundle adjustment methods
-    # after implementing the actual functionality
+
+    def test_maximum_spanning_tree(self):
+        edges = [(0, 1, 5), (1, 2, 1), (0, 2, 3), (2, 3, 4), (4, 5, 2)]
+        tree = maximum_spanning_tree(6, edges)
+        self.assertEqual(sorted(tree), [(0, 1, 5), (0, 2, 3), (2, 3, 4), (4, 5, 2)])
+
+    def test_build_cluster_graph(self):
+        models = [NamedModel("abcd"), NamedModel("cdef"), NamedModel("fgh"), NamedModel("xyz")]
+        self.assertEqual(sorted(self.merger.build_cluster_graph(models)), [(0, 1, 2), (1, 2, 1)])
+
+    def test_hierarchical_merge_uses_logarithmic_rounds(self):
+        merger = UnionMerger(num_workers=8)
+        merged = merger.merge_hierarchically(chain_models(8))
+        self.assertEqual(len(merged), 1)
+        self.assertEqual(len(merged[0].image_names), 8 * 8 + 2)
+        self.assertEqual(len(merged[0].parts), 8)
+        self.assertEqual([len(batch) for batch in merger.merge_rounds], [4, 2, 1])
+        self.assertGreater(merger.max_active, 1)
+
+    def test_disconnected_components(self):
+        merger = UnionMerger()
+        models = chain_models(3) + [NamedModel(["x", "y"]), NamedModel(["y", "z"])]
+        merged = merger.merge_hierarchically(models)
+        self.assertEqual([len(model.image_names) for model in merged], [26, 3])
+
+
+
+class TestSim3Alignment(unittest.TestCase):
+    """Test cases for the robust Sim(3) alignment"""
+
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+        self.rotation = random_rotation(self.rng)
+        self.translation = np.array([3.0, -1.0, 0.5])
+        self.scale = 0.4
+
+    def test_batched_umeyama_exact(self):
+        src = self.rng.normal(size=(2, 10, 3))
+        dst = self.scale * src @ self.rotation.T + self.translation
+        scales, rotations, translations = batched_umeyama(src, dst)
+        np.testing.assert_allclose(scales, self.scale)
+        np.testing.assert_allclose(rotations, [self.rotation] * 2, atol=1e-9)
+        np.testing.assert_allclose(translations, [self.translation] * 2, atol=1e-9)
+
+    def test_estimate_sim3_with_outliers(self):
+        src = self.rng.normal(size=(500, 3))
+        dst = self.scale * src @ self.rotation.T + self.translation + self.rng.normal(scale=1e-3, size=(500, 3))
+        outliers = self.rng.random(500) < 0.4
+        dst[outliers] = self.rng.normal(size=(outliers.sum(), 3))
+
+        alignment = estimate_sim3(src, dst, inlier_threshold=0.01)
+        self.assertAlmostEqual(alignment['scale'], self.scale, places=3)
+        np.testing.assert_allclose(alignment['rotation'], self.rotation, atol=1e-2)
+        np.testing.assert_array_equal(alignment['inliers'], ~outliers)
+        self.assertLess(alignment['num_hypotheses'], 2000)
+
+    def test_estimate_sim3_needs_three_points(self):
+        with self.assertRaises(ValueError):
+            estimate_sim3(np.zeros((2, 3)), np.zeros((2, 3)))
+
+    def test_find_correspondences(self):
+        scene = make_scene()
+        reference = sub_model_from_scene(scene, range(0, 7))
+        other = sub_model_from_scene(scene, range(5, 12))
+        src, dst = find_correspondences(reference, other)
+        # Two shared cameras plus every point seen by image 5 or 6
+        shared_points = np.unique(scene['point'][np.isin(scene['image'], [5, 6])])
+        self.assertEqual(len(src), 2 + len(shared_points))
+        np.testing.assert_allclose(src, dst)
+
+    def test_align_reconstructions(self):
+        scene = make_scene()
+        reference = sub_model_from_scene(scene, range(0, 7))
+        other = sub_model_from_scene(scene, range(5, 12))
+        expected_centers = other.camera_centers()
+        other.transform(self.scale, self.rotation, self.translation)
+
+        merger = SubReconstructionMerger()
+        aligned = merger.align_reconstructions([reference, other])
+        self.assertIs(aligned[1], other)
+        np.testing.assert_allclose(other.camera_centers(), expected_centers, atol=1e-6)
+        self.assertEqual(merger.alignments[0][2]['inlier_ratio'], 1.0)
+
+
+
+class TestStreamingMerge(unittest.TestCase):
+    """Test cases for merging aligned sub-models"""
+
+    def setUp(self):
+        self.scene = make_scene(num_images=12, num_points=300)
+        self.image_sets = [range(0, 5), range(4, 9), range(8, 12)]
+
+    def expected_counts(self):
+        """Merged point and observation counts: points are only identified through shared keypoints"""
+        num_points = 0
+        seen_images = set()
+        for images in self.image_sets:
+            mask = np.isin(self.scene['image'], list(images))
+            points = np.unique(self.scene['point'][mask])
+            shared = np.isin(self.scene['image'], list(seen_images & set(images)))
+            num_points += len(points) - len(np.unique(self.scene['point'][shared]))
+            seen_images.update(images)
+        return num_points, int(np.isin(self.scene['image'], list(seen_images)).sum())
+
+    def test_merge_deduplicates_tracks(self):
+        models = [sub_model_from_scene(self.scene, images) for images in self.image_sets]
+        merged = SubReconstructionMerger().merge_reconstructions(models)
+
+        num_points, num_observations = self.expected_counts()
+        self.assertEqual(merged.num_images, 12)
+        self.assertEqual(merged.num_points, num_points)
+        self.assertEqual(merged.num_observations, num_observations)
+        # Every merged point is the scene point its observations come from
+        scene_points = {}
+        for image, point, point2D in zip(self.scene['image'], self.scene['point'], self.scene['point2D']):
+            scene_points[(f"image_{image}.jpg", point2D)] = point
+        for point, image, point2D in list(zip(merged.track_point, merged.track_image, merged.track_point2D))[::50]:
+            expected = self.scene['points'][scene_points[(merged.image_names[image], point2D)]]
+            np.testing.assert_allclose(merged.points_xyz[point], expected)
+
+    def test_merge_many_sub_models(self):
+        # Enough sub-models for the track index to hold and merge several sorted runs
+        self.image_sets = [range(index, index + 2) for index in range(11)]
+        models = [sub_model_from_scene(self.scene, images) for images in self.image_sets]
+        merged = SubReconstructionMerger().merge_reconstructions(models)
+        num_points, num_observations = self.expected_counts()
+        self.assertEqual(merged.num_points, num_points)
+        self.assertEqual(merged.num_observations, num_observations)
+        self.assertEqual(len(np.unique((merged.track_image.astype(np.int64) << 32) | merged.track_point2D)),
+                         num_observations)
+
+    def test_merge_streams_from_files(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            paths = []
+            for index, images in enumerate(self.image_sets):
+                path = os.path.join(temp_dir, f"model_{index}.npz")
+                sub_model_from_scene(self.scene, images).save(path)
+                paths.append(path)
+            merged = SubReconstructionMerger().merge_reconstructions(paths)
+        self.assertEqual(merged.num_points, self.expected_counts()[0])
+
+    @unittest.skipUnless(importlib.util.find_spec('pycolmap'), "pycolmap is not installed")
+    def test_cluster_graph_of_colmap_model_directories(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            paths = []
+            for index, images in enumerate(self.image_sets):
+                path = os.path.join(temp_dir, f"model_{index}")
+                os.makedirs(path)
+                sub_model_from_scene(self.scene, images).to_reconstruction().write(path)
+                paths.append(path)
+            edges = SubReconstructionMerger().build_cluster_graph(paths)
+            merged = SubReconstructionMerger().merge_hierarchically(paths)
+        self.assertEqual(sorted(edges), sorted(SubReconstructionMerger().build_cluster_graph(
+            [sub_model_from_scene(self.scene, images) for images in self.image_sets])))
+        self.assertEqual(len(merged), 1)
+
+    def test_hierarchical_merge_with_work_directory(self):
+        rng = np.random.default_rng(3)
+        models = [sub_model_from_scene(self.scene, images) for images in self.image_sets]
+        for model in models[1:]:
+            model.transform(rng.uniform(0.5, 2), random_rotation(rng), rng.normal(size=3))
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            work_directory = os.path.join(temp_dir, "work")
+            merger = SubReconstructionMerger(work_directory=work_directory)
+            merged = merger.merge_hierarchically([merger._spill(model) for model in models])
+            self.assertEqual(len(merged), 1)
+            # Intermediate merges are removed as soon as they are consumed
+            self.assertEqual(os.listdir(work_directory), [os.path.basename(merged[0])])
+            merged = SubModel.read(merged[0])
+
+        self.assertEqual(merged.num_points, self.expected_counts()[0])
+        expected_centers = sub_model_from_scene(self.scene, range(12)).camera_centers()
+        order = [int(name[6:-4]) for name in merged.image_names]
+        centers = merged.camera_centers()
+        # The merged model lives in the frame of whichever sub-model ended up as reference
+        alignment = estimate_sim3(centers, expected_centers[order], inlier_threshold=1e-6)
+        self.assertEqual(alignment['num_inliers'], 12)
+
+
+
+class TestBundleAdjustment(unittest.TestCase):
+    """Test cases for the global and partitioned bundle adjustment of the merged model"""
+
+    def setUp(self):
+        scene = make_scene(num_images=12, num_points=300)
+        self.model = sub_model_from_scene(scene, range(12))
+        rng = np.random.default_rng(0)
+        self.model.points_xyz += rng.normal(scale=0.05, size=self.model.points_xyz.shape)
+        self.model.translations[1:] += rng.normal(scale=0.05, size=(11, 3))
+        self.clusters = [{f"image_{index}.jpg" for index in range(0, 7)},
+                         {f"image_{index}.jpg" for index in range(5, 12)}]
+
+    def test_global_bundle_adjustment(self):
+        merger = SubReconstructionMerger(ba_backend='schur')
+        rotation = self.model.rotations[0].copy()
+        self.assertIs(merger.global_bundle_adjustment(self.model), self.model)
+        self.assertLess(merger.ba_statistics['final_cost'], 1e-6 * merger.ba_statistics['initial_cost'])
+        np.testing.assert_array_equal(self.model.rotations[0], rotation)
+
+    @unittest.skipUnless(importlib.util.find_spec('pycolmap'), "pycolmap is not installed")
+    def test_pycolmap_bundle_adjustment(self):
+        merger = SubReconstructionMerger(ba_backend='pycolmap')
+        merger.global_bundle_adjustment(self.model)
+        self.assertLess(merger.ba_statistics['final_cost'], 1e-6 * merger.ba_statistics['initial_cost'])
+
+    @unittest.skipUnless(importlib.util.find_spec('pycolmap'), "pycolmap is not installed")
+    def test_pycolmap_bundle_adjustment_keeps_distorted_cameras(self):
+        scene = make_scene(num_images=12, num_points=300)
+        models = [SubModel.from_reconstruction(opencv_reconstruction(scene, images))
+                  for images in (range(0, 7), range(5, 12))]
+        merged = SubReconstructionMerger().merge_reconstructions(models)
+        self.assertEqual(list(merged.cameras), [7])
+        np.testing.assert_array_equal(merged.image_camera_ids, np.full(12, 7))
+
+        rng = np.random.default_rng(0)
+        merged.translations[1:] += rng.normal(scale=0.05, size=(11, 3))
+        merger = SubReconstructionMerger(ba_backend='pycolmap')
+        merger.global_bundle_adjustment(merged)
+        # Points observed once are not adjusted, the others are reprojected exactly again
+        adjusted = np.bincount(merged.track_point)[merged.track_point] >= 2
+        self.assertLess(np.abs(reprojection_residuals(merged)[adjusted]).max(), 1e-4)
+        self.assertEqual(merged.cameras[7][0], 'OPENCV')
+
+    def test_partitioned_bundle_adjustment(self):
+        merger = SubReconstructionMerger(num_workers=2, ba_mode='partitioned', admm_iterations=8)
+        merger.global_bundle_adjustment(self.model, self.clusters)
+        statistics = merger.ba_statistics
+        self.assertEqual(statistics['num_blocks'], 2)
+        self.assertEqual(statistics['num_shared_cameras'], 2)
+        self.assertGreater(statistics['num_shared_points'], 0)
+        self.assertLess(statistics['final_cost'], 1e-3 * statistics['initial_cost'])
+        self.assertLess(statistics['primal_residuals'][-1], statistics['primal_residuals'][0])
+
+    def test_partitioned_bundle_adjustment_traces_workers(self):
+        merger = SubReconstructionMerger(num_workers=2, ba_mode='partitioned', admm_iterations=2)
+        tracer.start()
+        try:
+            merger.global_bundle_adjustment(self.model, self.clusters)
+        finally:
+            tracer.stop()
+        worker_pids = {event['pid'] for event in tracer.events if event['name'] == 'merging.local_bundle_adjustment'}
+        tracer.reset()
+        self.assertTrue(worker_pids)
+        self.assertNotIn(os.getpid(), worker_pids)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            SubReconstructionMerger(ba_mode='unknown').global_bundle_adjustment(self.model)
 
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,146 @@
+"""
+Unit tests for the multilevel partitioning module
+"""
+
+import unittest
+import sys
+import os
+
+import numpy as np
+import scipy.sparse as sp
+
+# Add the project root directory to the path so we can import dagsfm modules
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from dagsfm.multilevel import (coarsen, cut_weight, fm_refine, heavy_edge_matching, multilevel_partition,
+                               refine_partition)
+
+
+def grid_graph(width, height, weak_columns=()):
+    """
+    4-connected grid with unit weights, edges crossing the given columns have weight 0.01
+
+    Returns:
+        scipy.sparse.csr_matrix: Symmetric adjacency, node index = y * width + x
+    """
+    index = np.arange(width * height).reshape(height, width)
+    rows = [index[:, :-1].ravel(), index[:-1, :].ravel()]
+    cols = [index[:, 1:].ravel(), index[1:, :].ravel()]
+    weights = [np.where(np.isin(np.tile(np.arange(width - 1), height), weak_columns), 0.01, 1.0),
+               np.ones((height - 1) * width)]
+    rows, cols, weights = np.concatenate(rows), np.concatenate(cols), np.concatenate(weights)
+    adjacency = sp.coo_matrix((weights, (rows, cols)), shape=(width * height,) * 2)
+    return (adjacency + adjacency.T).tocsr()
+
+
+def edge_arrays(adjacency):
+    coo = adjacency.tocoo()
+    return coo.row.astype(np.int64), coo.col.astype(np.int64), coo.data
+
+
+class TestCoarsening(unittest.TestCase):
+    """Test cases for heavy-edge matching and contraction"""
+
+    def test_matching_is_symmetric_and_prefers_heavy_edges(self):
+        # Path 0-1-2-3 with a heavy middle edge
+        adjacency = sp.coo_matrix(([1.0, 5.0, 1.0], ([0, 1, 2], [1, 2, 3])), shape=(4, 4))
+        rows, cols, weights = edge_arrays((adjacency + adjacency.T).tocsr())
+        partner = heavy_edge_matching(rows, cols, weights, np.ones(4), 2, np.random.default_rng(0))
+        np.testing.assert_array_equal(partner[partner], np.arange(4))
+        self.assertEqual(partner[1], 2)
+
+    def test_isolated_nodes_are_paired(self):
+        rows, cols, weights = edge_arrays(sp.csr_matrix((6, 6)))
+        partner = heavy_edge_matching(rows, cols, weights, np.ones(6), 2, np.random.default_rng(0))
+        self.assertFalse(np.any(partner == np.arange(6)))
+
+    def test_coarsen_preserves_weights(self):
+        adjacency = grid_graph(6, 4)
+        rows, cols, weights = edge_arrays(adjacency)
+        node_weights = np.ones(24)
+        partner = heavy_edge_matching(rows, cols, weights, node_weights, 2, np.random.default_rng(0))
+        mapping, coarse_rows, coarse_cols, coarse_weights, coarse_node_weights = coarsen(
+            rows, cols, weights, node_weights, partner)
+        self.assertLess(len(coarse_node_weights), 24)
+        self.assertEqual(coarse_node_weights.sum(), 24)
+        # Contracted edges disappear, every other edge weight survives
+        internal = weights[mapping[rows] == mapping[cols]].sum()
+        self.assertAlmostEqual(coarse_weights.sum(), weights.sum() - internal)
+        # A partition of the coarse graph has the same cut as its projection
+        labels = (np.arange(len(coarse_node_weights)) % 2).astype(np.int64)
+        self.assertAlmostEqual(cut_weight(coarse_rows, coarse_cols, coarse_weights, labels),
+                               cut_weight(rows, cols, weights, labels[mapping]))
+
+
+class TestRefinement(unittest.TestCase):
+    """Test cases for the boundary refinement"""
+
+    def test_greedy_refinement_moves_misplaced_nodes(self):
+        adjacency = grid_graph(10, 5, weak_columns=[4])
+        rows, cols, weights = edge_arrays(adjacency)
+        expected = (np.tile(np.arange(10), 5) >= 5).astype(np.int64)
+        labels = expected.copy()
+        labels[[12, 27, 35]] = 1 - labels[[12, 27, 35]]
+        labels = refine_partition(rows, cols, weights, np.ones(50), labels, np.full(2, 30.0))
+        np.testing.assert_array_equal(labels, expected)
+
+    def test_fm_refinement_shifts_a_whole_cut(self):
+        # Moving a whole column pays off although every single move alone is a loss
+        adjacency = grid_graph(10, 5, weak_columns=[4])
+        rows, cols, weights = edge_arrays(adjacency)
+        labels = (np.tile(np.arange(10), 5) >= 6).astype(np.int64)
+        before = cut_weight(rows, cols, weights, labels)
+        self.assertEqual(cut_weight(rows, cols, weights, refine_partition(
+            rows, cols, weights, np.ones(50), labels.copy(), np.full(2, 30.0))), before)
+        labels = fm_refine(adjacency, np.ones(50), labels, np.full(2, 30.0))
+        np.testing.assert_array_equal(labels, (np.tile(np.arange(10), 5) >= 5).astype(np.int64))
+
+    def test_refinement_restores_balance(self):
+        adjacency = grid_graph(10, 5)
+        rows, cols, weights = edge_arrays(adjacency)
+        labels = (np.tile(np.arange(10), 5) >= 8).astype(np.int64)
+        labels = refine_partition(rows, cols, weights, np.ones(50), labels, np.full(2, 30.0), passes=20)
+        self.assertLessEqual(np.bincount(labels).max(), 30)
+
+
+class TestMultilevelPartition(unittest.TestCase):
+    """Test cases for multilevel_partition"""
+
+    def test_finds_the_weak_cuts(self):
+        adjacency = grid_graph(40, 10, weak_columns=[9, 19, 29])
+        labels = multilevel_partition(adjacency, 4, coarsest_nodes_per_part=5)
+        blocks = labels.reshape(10, 40)
+        for start in range(0, 40, 10):
+            self.assertEqual(len(np.unique(blocks[:, start:start + 10])), 1)
+        self.assertEqual(len(np.unique(labels)), 4)
+
+    def test_balanced_parts_on_a_uniform_graph(self):
+        adjacency = grid_graph(30, 30)
+        labels = multilevel_partition(adjacency, 6, imbalance=0.1)
+        sizes = np.bincount(labels, minlength=6)
+        self.assertEqual(len(sizes), 6)
+        self.assertLessEqual(sizes.max(), 1.1 * 900 / 6)
+        # Far better than a random assignment, which cuts about 5/6 of the edges
+        rows, cols, weights = edge_arrays(adjacency)
+        self.assertLess(cut_weight(rows, cols, weights, labels), 0.15 * weights.sum() / 2)
+
+    def test_deterministic_and_accepts_dense_input(self):
+        adjacency = grid_graph(12, 12)
+        labels = multilevel_partition(adjacency, 3, seed=7)
+        np.testing.assert_array_equal(multilevel_partition(adjacency.toarray(), 3, seed=7), labels)
+
+    def test_input_matrix_is_not_modified(self):
+        adjacency = sp.csr_matrix(grid_graph(6, 6), dtype=np.float64) + sp.identity(36, format='csr')
+        expected = adjacency.copy()
+        multilevel_partition(adjacency, 2)
+        self.assertEqual((adjacency != expected).nnz, 0)
+        np.testing.assert_array_equal(adjacency.diagonal(), np.ones(36))
+
+    def test_small_graphs(self):
+        self.assertEqual(sorted(multilevel_partition(sp.csr_matrix((3, 3)), 5).tolist()), [0, 1, 2])
+        np.testing.assert_array_equal(multilevel_partition(grid_graph(3, 3), 1), np.zeros(9))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,7 @@ Unit tests for the partition module
 
 import sys
 import os
+import unittest
 import tempfile
 import sqlite3
 import numpy as np
@@ -13,6 +14,8 @@ project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 
 from dagsfm.partition import NcutPartitioner
+from dagsfm.view_graph import ViewGraph
+from test_database import create_test_database
 
 
 def test_ncut_partitioner():
@@ -83,6 +86,207 @@ def test_ncut_partitioner():
     #     return False
 
 
+def _build_clique_partitioner(groups, bridges, engine):
+    """
+    构建由若干强连通图像团及团间弱边组成的分区器(不依赖数据库)
+    
+    Args:
+        groups (list): 每个图像团的图像ID列表，团内边权重为100
+        bridges (list): 团间边 (u, v, weight) 列表
+        engine (str): N-cut引擎
+    """
+    partitioner = NcutPartitioner("unused.db")
+    partitioner.config['ncut_engine'] = engine
+    image_ids = sorted(image_id for group in groups for image_id in group)
+    edges = list(bridges)
+    for group in groups:
+        for i, u in enumerate(group):
+            for v in group[i + 1:]:
+                edges.append((u, v, 100))
+    partitioner.images = {image_id: f"image_{image_id}.jpg" for image_id in image_ids}
+    ids1, ids2, weights = zip(*edges)
+    partitioner.graph = ViewGraph.from_edges(image_ids, ids1, ids2, weights)
+    return partitioner
+
+
+def _build_two_cluster_partitioner(engine):
+    """
+    构建由一条弱边连接的两个强连通图像团组成的分区器
+    """
+    return _build_clique_partitioner([list(range(1, 7)), list(range(7, 13))], [(6, 7, 1)], engine)
+
+
+class TestLoadDatabase(unittest.TestCase):
+    """从数据库批量加载视图图的测试"""
+
+    def test_load_database(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            database_path = os.path.join(temp_dir, "database.db")
+            create_test_database(database_path, 4, [(1, 2, 50), (2, 3, 20), (1, 4, 7)])
+            partitioner = NcutPartitioner(database_path)
+            partitioner.load_database()
+        self.assertEqual(partitioner.images[3], "image_3.jpg")
+        self.assertEqual(partitioner.graph.num_nodes, 4)
+        self.assertEqual(partitioner.graph.num_edges, 3)
+        self.assertEqual(partitioner.graph.to_networkx()[2][3]['weight'], 20)
+
+
+class TestSparseNcut(unittest.TestCase):
+    """稀疏N-cut引擎的测试"""
+
+    def test_sparse_similarity_matches_dense(self):
+        partitioner = _build_two_cluster_partitioner('sparse')
+        sparse_matrix, sparse_nodes = partitioner.compute_sparse_similarity_matrix()
+        dense_matrix, dense_nodes = partitioner.compute_similarity_matrix()
+        self.assertEqual(sparse_nodes, dense_nodes)
+        self.assertEqual(sparse_matrix.nnz, 2 * partitioner.graph.num_edges)
+        np.testing.assert_array_equal(sparse_matrix.toarray(), dense_matrix)
+
+    def test_sparse_normalized_cut(self):
+        partitioner = _build_two_cluster_partitioner('sparse')
+        clusters = partitioner.normalized_cut(2)
+        groups = sorted(sorted(nodes) for nodes in clusters.values())
+        self.assertEqual(groups, [list(range(1, 7)), list(range(7, 13))])
+        self.assertEqual([(u, v) for u, v, _, _, _ in partitioner.lost_egdes], [(6, 7)])
+
+    def test_unknown_engine(self):
+        partitioner = _build_two_cluster_partitioner('gpu')
+        with self.assertRaises(ValueError):
+            partitioner.normalized_cut(2)
+
+
+class TestRecursiveBisection(unittest.TestCase):
+    """递归二分割模式的测试"""
+
+    def _build_chain_partitioner(self, num_groups=4, group_size=8):
+        # 若干个图像团首尾以弱边相连，形成链状视图图
+        groups = [list(range(g * group_size + 1, (g + 1) * group_size + 1)) for g in range(num_groups)]
+        bridges = [(group[0] - 1, group[0], 2) for group in groups[1:]]
+        return _build_clique_partitioner(groups, bridges, 'sparse')
+
+    def test_clusters_respect_size_bounds(self):
+        partitioner = self._build_chain_partitioner()
+        clusters = partitioner.recursive_bisection(max_cluster_size=10, min_cluster_size=4)
+        self.assertEqual(len(clusters), 4)
+        for nodes in clusters.values():
+            self.assertEqual(len(nodes), 8)
+        self.assertEqual(sum(len(nodes) for nodes in clusters.values()), 32)
+        self.assertEqual(len(partitioner.lost_egdes), 3)
+
+    def test_stops_below_min_cluster_size(self):
+        partitioner = self._build_chain_partitioner(num_groups=2)
+        clusters = partitioner.recursive_bisection(max_cluster_size=10, min_cluster_size=9)
+        self.assertEqual(len(clusters), 1)
+        self.assertEqual(partitioner.lost_egdes, [])
+
+    def test_degenerate_split_stops(self):
+        # 所有标签相同的二分结果(一侧为空)不能导致无限循环
+        partitioner = self._build_chain_partitioner(num_groups=2)
+        partitioner._partition_labels = lambda matrix, k: np.zeros(matrix.shape[0], dtype=np.int64)
+        clusters = partitioner.recursive_bisection(max_cluster_size=10, min_cluster_size=0)
+        self.assertEqual(len(clusters), 1)
+        self.assertEqual(len(next(iter(clusters.values()))), 16)
+
+    def test_partition_scene_recursive_mode(self):
+        partitioner = self._build_chain_partitioner()
+        partitioner.config.update({'partition_mode': 'recursive', 'max_cluster_size': 16, 'min_cluster_size': 4})
+        expanded_clusters = partitioner.partition_scene()
+        self.assertEqual(len(expanded_clusters), 2)
+        covered = set()
+        for nodes in expanded_clusters.values():
+            covered.update(nodes)
+        self.assertEqual(covered, set(range(1, 33)))
+
+
+class TestMultilevelPartition(unittest.TestCase):
+    """多层图分割方法的测试"""
+
+    def test_multilevel_normalized_cut(self):
+        partitioner = _build_two_cluster_partitioner('dense')
+        partitioner.config['partition_method'] = 'multilevel'
+        clusters = partitioner.normalized_cut(2)
+        groups = sorted(sorted(nodes) for nodes in clusters.values())
+        self.assertEqual(groups, [list(range(1, 7)), list(range(7, 13))])
+        self.assertEqual([(u, v) for u, v, _, _, _ in partitioner.lost_egdes], [(6, 7)])
+
+    def test_multilevel_partition_scene(self):
+        groups = [list(range(g * 8 + 1, (g + 1) * 8 + 1)) for g in range(4)]
+        bridges = [(group[0] - 1, group[0], 2) for group in groups[1:]]
+        partitioner = _build_clique_partitioner(groups, bridges, 'sparse')
+        partitioner.config.update({'partition_method': 'multilevel', 'ncut_k': 4})
+        expanded_clusters = partitioner.partition_scene()
+        self.assertEqual(sorted(sorted(nodes) for nodes in partitioner.clusters.values()), groups)
+        self.assertEqual(len(partitioner.lost_egdes), 3)
+        for cluster_id, nodes in partitioner.clusters.items():
+            self.assertTrue(set(nodes) <= set(expanded_clusters[cluster_id]))
+
+    def test_unknown_method(self):
+        partitioner = _build_two_cluster_partitioner('sparse')
+        partitioner.config['partition_method'] = 'metis'
+        with self.assertRaises(ValueError):
+            partitioner.normalized_cut(2)
+
+
+class TestFilterViewGraph(unittest.TestCase):
+    """分割前视图图过滤的测试"""
+
+    def test_keeps_largest_component(self):
+        # 两个图像团之间没有边，另有一张孤立图像
+        partitioner = _build_clique_partitioner([list(range(1, 7)), list(range(7, 10)), [10]], [], 'sparse')
+        graph = partitioner.filter_view_graph()
+        np.testing.assert_array_equal(graph.image_ids, list(range(1, 7)))
+        self.assertEqual(graph.num_edges, 15)
+
+    def test_weak_edges_and_max_neighbors(self):
+        partitioner = _build_two_cluster_partitioner('sparse')
+        partitioner.config.update({'min_edge_weight': 2, 'keep_largest_component': False})
+        graph = partitioner.filter_view_graph()
+        self.assertEqual(graph.num_nodes, 12)
+        self.assertEqual(graph.num_edges, 30)
+        self.assertEqual(graph.cut_edges(np.repeat([0, 1], 6)).sum(), 0)
+
+        partitioner.config.update({'min_edge_weight': 0, 'max_neighbors': 2})
+        graph = partitioner.filter_view_graph()
+        self.assertTrue(np.all(graph.degrees() >= 2))
+        self.assertLess(graph.num_edges, 30)
+
+    def test_partition_scene_filters_before_cut(self):
+        partitioner = _build_two_cluster_partitioner('sparse')
+        partitioner.config.update({'min_edge_weight': 2, 'ncut_k': 2})
+        expanded_clusters = partitioner.partition_scene()
+        covered = set()
+        for nodes in expanded_clusters.values():
+            covered.update(nodes)
+        self.assertEqual(covered, set(range(1, 7)))
+
+
+class TestExpandPartitions(unittest.TestCase):
+    """分区扩展及完整性比率增量维护的测试"""
+
+    def setUp(self):
+        groups = [list(range(1, 9)), list(range(9, 17)), list(range(17, 25))]
+        bridges = [(8, 9, 3), (7, 10, 2), (16, 17, 4), (15, 18, 1), (1, 24, 2)]
+        self.partitioner = _build_clique_partitioner(groups, bridges, 'sparse')
+        self.clusters = self.partitioner.normalized_cut(3)
+
+    def test_expanded_clusters_contain_original_clusters(self):
+        expanded_clusters = self.partitioner.expand_partitions(self.clusters)
+        self.assertEqual(set(expanded_clusters), set(self.clusters))
+        for cluster_id, nodes in self.clusters.items():
+            self.assertTrue(set(nodes) <= set(expanded_clusters[cluster_id]))
+        self.assertGreater(sum(len(nodes) for nodes in expanded_clusters.values()), 24)
+
+    def test_incremental_counts_match_recomputation(self):
+        expanded_clusters = self.partitioner.expand_partitions(self.clusters)
+        for cluster_id, nodes in expanded_clusters.items():
+            repeated = sum(len(set(nodes) & set(other_nodes))
+                           for other_id, other_nodes in expanded_clusters.items() if other_id != cluster_id)
+            self.assertEqual(self.partitioner._repeated_node_counts[cluster_id], repeated)
+            self.assertEqual(len(nodes), len(set(nodes)))
+        for (cluster1_id, cluster2_id), overlap in self.partitioner._pair_overlap_counts.items():
+            self.assertEqual(overlap, len(set(expanded_clusters[cluster1_id]) & set(expanded_clusters[cluster2_id])))
+
+
 if __name__ == '__main__':
     # 配置测试路径 - 运行时会自动创建测试数据库
     DATABASE_PATH = f"/ws/18_nfs/zwl/Data/DJI/jimeimigu/database_dagsfm_python.db"  # 会在运行时创建临时数据库
@@ -5,11 +5,112 @@ Unit tests for the pipeline module
 import unittest
 import sys
 import os
+import shutil
+import tempfile
+import threading
 
-# Add the dagsfm directory to the path so we can import modules
-sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'dagsfm'))
+import numpy as np
 
-from pipeline import DAGSfMPipeline
+# Add the project root directory to the path so we can import dagsfm modules
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from dagsfm.features import FeatureMatcher
+from dagsfm.pipeline import DAGSfMPipeline, TaskGraph
+from dagsfm.sub_model import SubModel
+from test_database import create_test_database
+from test_reconstruction import FakeReconstructor
+
+
+class FakeExtractor:
+    """Extractor that writes a database with two weakly connected image groups"""
+
+    def __init__(self):
+        self.feature_cfg = {}
+        self.calls = 0
+
+    def extract_features(self, image_path, database_path):
+        self.calls += 1
+        pairs = [(u, v, 100) for group in (range(1, 7), range(7, 13))
+                 for u in group for v in group if u < v]
+        if os.path.exists(database_path):
+            os.remove(database_path)
+        create_test_database(database_path, 12, pairs + [(6, 7, 1)])
+        return database_path
+
+
+class FakeMatcher(FeatureMatcher):
+    """Matcher that leaves the database written by FakeExtractor as is"""
+
+    def exhaustive_matcher(self, database_path):
+        return database_path
+
+
+class FakeMerger:
+    """Merger that records the sub-models it was given and returns one camera per sub-model"""
+
+    def __init__(self):
+        self.reconstructions = None
+
+    def merge_and_refine(self, reconstructions):
+        self.reconstructions = sorted(reconstructions)
+        count = len(reconstructions)
+        return SubModel([f"model_{index}.jpg" for index in range(count)], np.tile(np.eye(3), (count, 1, 1)),
+                        np.zeros((count, 3)), np.tile([100.0, 50.0, 50.0], (count, 1)), np.empty((0, 3)))
+
+
+class TestTaskGraph(unittest.TestCase):
+    """Test cases for the TaskGraph executor"""
+
+    def test_dependencies_are_respected(self):
+        order = []
+        graph = TaskGraph()
+        graph.add_node('a', lambda context: order.append('a') or 1)
+        graph.add_node('b', lambda context: order.append('b') or context['a'] + 1, ['a'])
+        graph.add_node('c', lambda context: order.append('c') or context['b'] + 1, ['b'])
+        context = graph.run()
+        self.assertEqual(order, ['a', 'b', 'c'])
+        self.assertEqual(context['c'], 3)
+
+    def test_independent_nodes_run_concurrently(self):
+        # Both nodes block on the barrier, so the test only finishes if they overlap
+        barrier = threading.Barrier(2, timeout=5)
+        graph = TaskGraph()
+        graph.add_node('left', lambda context: barrier.wait())
+        graph.add_node('right', lambda context: barrier.wait())
+        graph.run(max_workers=2)
+        self.assertEqual({node.status for node in graph.nodes.values()}, {'done'})
+
+    def test_nodes_added_while_running(self):
+        graph = TaskGraph()
+        graph.add_node('join', lambda context: sum(context[f'part/{i}'] for i in range(3)))
+
+        def fan_out(context):
+            for i in range(3):
+                graph.add_node(f'part/{i}', lambda context, i=i: i * 10, ['fan_out'])
+                graph.add_dependency('join', f'part/{i}')
+
+        graph.add_node('fan_out', fan_out)
+        graph.add_dependency('join', 'fan_out')
+        self.assertEqual(graph.run()['join'], 30)
+
+    def test_cycles_are_rejected(self):
+        graph = TaskGraph()
+        graph.add_node('a', lambda context: None)
+        graph.add_node('b', lambda context: None, ['a'])
+        with self.assertRaises(ValueError):
+            graph.add_dependency('a', 'b')
+        with self.assertRaises(ValueError):
+            graph.add_node('c', lambda context: None, ['missing'])
+
+    def test_failure_stops_downstream_nodes(self):
+        graph = TaskGraph()
+        graph.add_node('a', lambda context: 1 / 0)
+        graph.add_node('b', lambda context: None, ['a'])
+        with self.assertRaises(RuntimeError):
+            graph.run()
+        self.assertEqual(graph.nodes['a'].status, 'failed')
+        self.assertEqual(graph.nodes['b'].status, 'pending')
 
 
 class TestDAGSfMPipeline(unittest.TestCase):
@@ -22,10 +123,88 @@ class TestDAGSfMPipeline(unittest.TestCase):
     def test_init(self):
         """Test DAGSfMPipeline initialization"""
         self.assertIsInstance(self.pipeline, DAGSfMPipeline)
-    
-    # TODO: Add tests for pipeline setup and execution methods
-    # after implementing the actual functionality with CGraph
+
+    def test_setup_pipeline(self):
+        graph = self.pipeline.setup_pipeline()
+        self.assertEqual(list(graph.nodes), ['extract', 'match', 'view_graph', 'partition', 'reconstruct', 'merge'])
+        self.assertEqual(graph.ancestors('merge'), {'extract', 'match', 'view_graph', 'partition', 'reconstruct'})
+
+    def _make_pipeline(self, temp_dir, expansion_ratio=0.2):
+        config_path = os.path.join(temp_dir, "config.yaml")
+        with open(config_path, 'w') as f:
+            f.write(f"ncut_k: 2\nncut_engine: sparse\nexpansion_ratio: {expansion_ratio}\n"
+                    "reconstruction_workers: 2\n")
+        pipeline = DAGSfMPipeline(config_path)
+        pipeline.extractor = FakeExtractor()
+        pipeline.matcher = FakeMatcher()
+        pipeline.reconstructor = FakeReconstructor()
+        pipeline.merger = FakeMerger()
+        return pipeline
+
+    def test_run_with_fake_backends(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            pipeline = self._make_pipeline(temp_dir)
+            output_directory = os.path.join(temp_dir, "output")
+            merged_path = pipeline.run(os.path.join(temp_dir, "images"), output_directory)
+
+            self.assertEqual(merged_path, os.path.join(output_directory, "merged"))
+            self.assertEqual(SubModel.read(merged_path).image_names, ["model_0.jpg", "model_1.jpg"])
+            models = pipeline.merger.reconstructions
+            self.assertEqual(len(models), 2)
+            self.assertIn('reconstruct/0', pipeline.graph.nodes)
+            self.assertIn('reconstruct/1', pipeline.graph.nodes)
+            for model_path in models:
+                self.assertTrue(os.path.exists(os.path.join(os.path.dirname(model_path), "job.txt")))
+            for database_path in pipeline.graph.nodes['partition'].result['databases'].values():
+                self.assertTrue(os.path.exists(database_path))
+            self.assertEqual(pipeline.cached_stages, set())
+
+    def test_worker_exit_does_not_fail_other_clusters(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            pipeline = self._make_pipeline(temp_dir)
+            pipeline.scheduler.max_retries = 0
+            pipeline.reconstructor = FakeReconstructor(exit_once_image="image_1.jpg")
+            pipeline.run(os.path.join(temp_dir, "images"), os.path.join(temp_dir, "output"))
+            self.assertEqual(len(pipeline.merger.reconstructions), 2)
+            self.assertEqual(pipeline.scheduler.failed, {})
+
+    def test_resume_skips_valid_stages(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            image_directory = os.path.join(temp_dir, "images")
+            os.makedirs(image_directory)
+            output_directory = os.path.join(temp_dir, "output")
+            first = self._make_pipeline(temp_dir)
+            first.run(image_directory, output_directory)
+
+            # The merged model is written again from the cached merge result
+            shutil.rmtree(os.path.join(output_directory, "merged"))
+            pipeline = self._make_pipeline(temp_dir)
+            self.assertEqual(pipeline.run(image_directory, output_directory), os.path.join(output_directory, "merged"))
+            self.assertTrue(os.path.exists(os.path.join(output_directory, "merged", "images.bin")))
+            self.assertEqual(pipeline.graph.nodes['reconstruct'].result, first.graph.nodes['reconstruct'].result)
+            self.assertEqual(pipeline.extractor.calls, 0)
+            self.assertEqual(pipeline.cached_stages, set(pipeline.graph.nodes))
+
+            # The merge stage caches the path of the merged model, and runs again when it is gone
+            merged_model_path = pipeline.graph.nodes['merge'].result
+            self.assertTrue(merged_model_path.endswith("model.npz"))
+            os.remove(merged_model_path)
+            pipeline = self._make_pipeline(temp_dir)
+            pipeline.run(image_directory, output_directory)
+            self.assertEqual(pipeline.cached_stages, set(pipeline.graph.nodes) - {'merge'})
+            self.assertTrue(os.path.exists(merged_model_path))
+
+            # A partitioning parameter only invalidates partition and everything after it
+            pipeline = self._make_pipeline(temp_dir, expansion_ratio=0.5)
+            pipeline.run(image_directory, output_directory)
+            self.assertEqual(pipeline.cached_stages, {'extract', 'match', 'view_graph'})
+
+            # Without resume everything runs again
+            pipeline = self._make_pipeline(temp_dir)
+            pipeline.run(image_directory, output_directory, resume=False)
+            self.assertEqual(pipeline.extractor.calls, 1)
+            self.assertEqual(pipeline.cached_stages, set())
 
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -5,11 +5,38 @@ Unit tests for the reconstruction module
 import unittest
 import sys
 import os
+import tempfile
+import time
 
 # Add the dagsfm directory to the path so we can import modules
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'dagsfm'))
 
-from reconstruction import SubReconstructor
+from reconstruction import SubReconstructor, ReconstructionScheduler
+
+
+class FakeReconstructor(SubReconstructor):
+    """Reconstructor that records its jobs instead of running a mapper"""
+
+    def __init__(self, exit_once_image="exit_once.jpg"):
+        super().__init__()
+        # The worker process dies on the first attempt of a cluster containing this image
+        self.exit_once_image = exit_once_image
+
+    def reconstruct_partition(self, partition, image_directory, database_path, output_directory):
+        os.makedirs(output_directory, exist_ok=True)
+        if self.exit_once_image in partition and not os.path.exists(os.path.join(output_directory, "exited")):
+            open(os.path.join(output_directory, "exited"), 'w').close()
+            os._exit(1)
+        if "fail_once.jpg" in partition and not os.path.exists(os.path.join(output_directory, "attempted")):
+            open(os.path.join(output_directory, "attempted"), 'w').close()
+            raise RuntimeError("mapper crashed")
+        if "always_fail.jpg" in partition:
+            raise RuntimeError("mapper crashed")
+        with open(os.path.join(output_directory, "job.txt"), 'w') as f:
+            f.write(f"{time.time()} {self.num_threads} {database_path}\n")
+        model_path = os.path.join(output_directory, "0")
+        os.makedirs(model_path, exist_ok=True)
+        return model_path
 
 
 class TestSubReconstructor(unittest.TestCase):
@@ -25,5 +52,53 @@ class TestSubReconstructor(unittest.TestCase):
         self.assertTrue(hasattr(self.reconstructor, 'use_pycolmap'))
 
 
+class TestReconstructionScheduler(unittest.TestCase):
+    """Test cases for the ReconstructionScheduler class"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.output_directory = self.temp_dir.name
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _read_job(self, cluster_id):
+        with open(os.path.join(self.output_directory, f"cluster_{cluster_id}", "job.txt")) as f:
+            start, threads, database_path = f.read().split()
+        return float(start), int(threads), database_path
+
+    def test_largest_cluster_first(self):
+        clusters = {0: ["a.jpg"], 1: ["b.jpg", "c.jpg", "d.jpg"], 2: ["e.jpg", "f.jpg"]}
+        scheduler = ReconstructionScheduler(FakeReconstructor(), num_workers=1, threads_per_job=3)
+        results = scheduler.run(clusters, "images", "database.db", self.output_directory)
+        self.assertEqual(set(results), {0, 1, 2})
+        starts = {cluster_id: self._read_job(cluster_id)[0] for cluster_id in clusters}
+        self.assertEqual(sorted(starts, key=starts.get), [1, 2, 0])
+        self.assertEqual(self._read_job(1)[1], 3)
+
+    def test_per_cluster_databases(self):
+        clusters = {0: ["a.jpg"], 1: ["b.jpg"]}
+        scheduler = ReconstructionScheduler(FakeReconstructor(), num_workers=2)
+        scheduler.run(clusters, "images", {0: "db_0.db", 1: "db_1.db"}, self.output_directory)
+        self.assertEqual(self._read_job(0)[2], "db_0.db")
+        self.assertEqual(self._read_job(1)[2], "db_1.db")
+
+    def test_retry_on_failure(self):
+        clusters = {0: ["fail_once.jpg"], 1: ["always_fail.jpg"]}
+        scheduler = ReconstructionScheduler(FakeReconstructor(), num_workers=2, max_retries=1)
+        results = scheduler.run(clusters, "images", "database.db", self.output_directory)
+        self.assertIn(0, results)
+        self.assertNotIn(1, results)
+        self.assertEqual(list(scheduler.failed), [1])
+
+    def test_worker_exit_does_not_fail_other_clusters(self):
+        clusters = {0: ["exit_once.jpg", "a.jpg"], 1: ["b.jpg"], 2: ["c.jpg"]}
+        # No retries: a broken pool must not be charged to the clusters that were in flight with it
+        scheduler = ReconstructionScheduler(FakeReconstructor(), num_workers=2, max_retries=0)
+        results = scheduler.run(clusters, "images", "database.db", self.output_directory)
+        self.assertEqual(set(results), {0, 1, 2})
+        self.assertEqual(scheduler.failed, {})
+
+
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,94 @@
+"""
+Unit tests for the retrieval module
+"""
+
+import importlib.util
+import unittest
+import sys
+import os
+import sqlite3
+import tempfile
+import numpy as np
+
+# Add the project root directory to the path so we can import dagsfm modules
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from dagsfm.retrieval import VladRetrieval, nearest_neighbors
+from test_database import create_test_database
+
+
+def add_place_descriptors(database_path, num_places, images_per_place, num_descriptors=300, seed=0):
+    """
+    Fill the descriptors table with images of distinct places: images of a
+    place share most of their descriptors, up to noise and subsampling
+
+    Image ids are numbered place by place, images_per_place ids per place.
+    """
+    rng = np.random.default_rng(seed)
+    connection = sqlite3.connect(database_path)
+    connection.execute("CREATE TABLE descriptors (image_id INTEGER PRIMARY KEY NOT NULL, rows INTEGER NOT NULL, "
+                       "cols INTEGER NOT NULL, data BLOB)")
+    for place in range(num_places):
+        landmarks = rng.integers(0, 256, size=(2 * num_descriptors, 128))
+        for index in range(images_per_place):
+            image_id = place * images_per_place + index + 1
+            visible = landmarks[rng.choice(len(landmarks), num_descriptors, replace=False)]
+            descriptors = np.clip(visible + rng.normal(scale=8, size=visible.shape), 0, 255).astype(np.uint8)
+            connection.execute("INSERT INTO descriptors VALUES (?, ?, 128, ?)",
+                               (image_id, num_descriptors, descriptors.tobytes()))
+    connection.commit()
+    connection.close()
+
+
+class TestVladRetrieval(unittest.TestCase):
+    """Test cases for the VLAD retrieval and candidate pair selection"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.database_path = os.path.join(self.temp_dir.name, "database.db")
+        self.num_places, self.images_per_place = 6, 5
+        create_test_database(self.database_path, self.num_places * self.images_per_place, [])
+        add_place_descriptors(self.database_path, self.num_places, self.images_per_place)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_vectors_are_unit_length(self):
+        retrieval = VladRetrieval(num_words=8, dimension=16).fit(self.database_path)
+        image_ids, vectors = retrieval.transform(self.database_path)
+        np.testing.assert_array_equal(image_ids, np.arange(1, 31))
+        self.assertEqual(vectors.shape, (30, 16))
+        np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1, rtol=1e-5)
+
+    def test_pairs_stay_within_places(self):
+        retrieval = VladRetrieval(num_words=8, dimension=16)
+        pairs = retrieval.candidate_pairs(self.database_path, num_neighbors=self.images_per_place - 1)
+        places = (pairs - 1) // self.images_per_place
+        self.assertTrue(np.all(pairs[:, 0] < pairs[:, 1]))
+        self.assertGreater(np.mean(places[:, 0] == places[:, 1]), 0.9)
+        # Linear, not quadratic, in the number of images
+        self.assertLessEqual(len(pairs), 30 * (self.images_per_place - 1))
+        self.assertEqual(len(np.unique(pairs, axis=0)), len(pairs))
+
+    def test_nearest_neighbors_exclude_self(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(20, 4)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        neighbors = nearest_neighbors(vectors, 3)
+        self.assertEqual(neighbors.shape, (20, 3))
+        self.assertFalse(np.any(neighbors == np.arange(20)[:, None]))
+        similarities = vectors @ vectors.T
+        np.fill_diagonal(similarities, -np.inf)
+        np.testing.assert_array_equal(neighbors[:, 0], np.argmax(similarities, axis=1))
+        self.assertEqual(nearest_neighbors(vectors[:1], 3).shape, (1, 0))
+
+    @unittest.skipIf(importlib.util.find_spec("faiss") is not None, "faiss is installed")
+    def test_exact_fallback_warns(self):
+        vectors = np.eye(4, dtype=np.float32)
+        with self.assertWarnsRegex(RuntimeWarning, "faiss-cpu"):
+            nearest_neighbors(vectors, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,191 @@
+"""
+Unit tests for the sub_model module
+"""
+
+import importlib.util
+import unittest
+import sys
+import os
+import tempfile
+import numpy as np
+
+# Add the project root directory to the path so we can import dagsfm modules
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from dagsfm.sub_model import SubModel
+
+
+def random_rotation(rng):
+    """Uniformly distributed rotation matrix"""
+    q, r = np.linalg.qr(rng.normal(size=(3, 3)))
+    q = q * np.sign(np.diag(r))
+    return q if np.linalg.det(q) > 0 else -q
+
+
+def make_scene(num_images=12, num_points=400, visibility=0.6, seed=0):
+    """
+    Synthetic scene: points around the origin seen by cameras on a ring looking inwards
+
+    Returns:
+        dict: rotations, translations, camera_params, points, and the observations
+            (image, point, point2D, xy arrays) with keypoint indices numbered per image
+    """
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(-2, 2, size=(num_points, 3))
+    rotations = np.empty((num_images, 3, 3))
+    translations = np.empty((num_images, 3))
+    for index in range(num_images):
+        angle = 2 * np.pi * index / num_images
+        center = np.array([10 * np.cos(angle), 10 * np.sin(angle), 1.0])
+        forward = -center / np.linalg.norm(center)
+        right = np.cross(forward, [0, 0, 1.0])
+        right /= np.linalg.norm(right)
+        down = np.cross(forward, right)
+        rotations[index] = np.stack([right, down, forward])
+        translations[index] = -rotations[index] @ center
+    camera_params = np.tile([500.0, 320.0, 240.0], (num_images, 1))
+
+    visible = rng.random((num_images, num_points)) < visibility
+    obs_image, obs_point = np.nonzero(visible)
+    obs_point2D = np.concatenate([np.arange(count) for count in visible.sum(axis=1)])
+    cam = np.einsum('nij,nj->ni', rotations[obs_image], points[obs_point]) + translations[obs_image]
+    obs_xy = camera_params[obs_image, :1] * cam[:, :2] / cam[:, 2:] + camera_params[obs_image, 1:]
+    return {'rotations': rotations, 'translations': translations, 'camera_params': camera_params,
+            'points': points, 'image': obs_image, 'point': obs_point, 'point2D': obs_point2D, 'xy': obs_xy}
+
+
+def sub_model_from_scene(scene, image_indices):
+    """SubModel of a subset of the scene images, in the world frame"""
+    image_indices = np.asarray(image_indices)
+    local_image = np.full(len(scene['rotations']), -1)
+    local_image[image_indices] = np.arange(len(image_indices))
+    mask = local_image[scene['image']] >= 0
+    point_ids, track_point = np.unique(scene['point'][mask], return_inverse=True)
+    return SubModel([f"image_{index}.jpg" for index in image_indices],
+                    scene['rotations'][image_indices], scene['translations'][image_indices],
+                    scene['camera_params'][image_indices], scene['points'][point_ids],
+                    track_point=track_point, track_image=local_image[scene['image'][mask]],
+                    track_point2D=scene['point2D'][mask], track_xy=scene['xy'][mask])
+
+
+def project(model):
+    """Projections of all observations of a model"""
+    cam = np.einsum('nij,nj->ni', model.rotations[model.track_image], model.points_xyz[model.track_point]) \
+        + model.translations[model.track_image]
+    params = model.camera_params[model.track_image]
+    return params[:, :1] * cam[:, :2] / cam[:, 2:] + params[:, 1:]
+
+
+def opencv_reconstruction(scene, image_indices):
+    """
+    pycolmap.Reconstruction of scene images sharing one OPENCV camera with radial distortion
+
+    The keypoints are the distorted projections of the scene points.
+    """
+    import pycolmap
+
+    reconstruction = pycolmap.Reconstruction()
+    camera = pycolmap.Camera(model='OPENCV', width=640, height=480, camera_id=7,
+                             params=[500.0, 500.0, 320.0, 240.0, -0.2, 0.05, 0.001, -0.002])
+    reconstruction.add_camera_with_trivial_rig(camera)
+    tracks = {}
+    for image_id, index in enumerate(image_indices, start=1):
+        observations = np.flatnonzero(scene['image'] == index)
+        cam = np.einsum('ij,nj->ni', scene['rotations'][index], scene['points'][scene['point'][observations]]) \
+            + scene['translations'][index]
+        image = pycolmap.Image(name=f"image_{index}.jpg", keypoints=camera.img_from_cam(cam / cam[:, 2:]),
+                               camera_id=7, image_id=image_id)
+        pose = pycolmap.Rigid3d(pycolmap.Rotation3d(scene['rotations'][index]), scene['translations'][index])
+        reconstruction.add_image_with_trivial_frame(image, pose)
+        for point2D, point in enumerate(scene['point'][observations]):
+            tracks.setdefault(point, []).append((image_id, point2D))
+    for point, elements in sorted(tracks.items()):
+        track = pycolmap.Track()
+        for image_id, point2D in elements:
+            track.add_element(image_id, point2D)
+        reconstruction.add_point3D(scene['points'][point], track, np.zeros(3, dtype=np.uint8))
+    return reconstruction
+
+
+class TestSubModel(unittest.TestCase):
+    """Test cases for the SubModel class"""
+
+    def setUp(self):
+        self.scene = make_scene()
+        self.model = sub_model_from_scene(self.scene, range(6))
+
+    def test_projections_match_observations(self):
+        np.testing.assert_allclose(project(self.model), self.model.track_xy, atol=1e-9)
+
+    def test_camera_centers(self):
+        centers = self.model.camera_centers()
+        np.testing.assert_allclose(np.linalg.norm(centers[:, :2], axis=1), 10)
+
+    def test_transform_keeps_projections(self):
+        rng = np.random.default_rng(1)
+        rotation = random_rotation(rng)
+        centers = self.model.camera_centers()
+        self.model.transform(2.5, rotation, np.array([1.0, -2.0, 3.0]))
+        np.testing.assert_allclose(project(self.model), self.model.track_xy, atol=1e-6)
+        np.testing.assert_allclose(self.model.camera_centers(), 2.5 * centers @ rotation.T + [1.0, -2.0, 3.0],
+                                   atol=1e-9)
+
+    def test_npz_round_trip(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "model.npz")
+            self.model.save(path)
+            loaded = SubModel.read(path)
+        self.assertEqual(loaded.image_names, self.model.image_names)
+        self.assertEqual(loaded.num_observations, self.model.num_observations)
+        np.testing.assert_array_equal(loaded.points_xyz, self.model.points_xyz)
+        np.testing.assert_array_equal(loaded.track_point2D, self.model.track_point2D)
+
+    @unittest.skipUnless(importlib.util.find_spec('pycolmap'), "pycolmap is not installed")
+    def test_reconstruction_round_trip(self):
+        reconstruction = self.model.to_reconstruction(min_track_length=2)
+        converted = SubModel.from_reconstruction(reconstruction)
+        kept = np.bincount(self.model.track_point, minlength=self.model.num_points) >= 2
+        self.assertEqual(converted.image_names, self.model.image_names)
+        self.assertEqual(converted.num_points, kept.sum())
+        np.testing.assert_allclose(converted.points_xyz, self.model.points_xyz[kept])
+        np.testing.assert_allclose(converted.rotations, self.model.rotations, atol=1e-12)
+        np.testing.assert_allclose(project(converted), converted.track_xy, atol=1e-9)
+
+
+    @unittest.skipUnless(importlib.util.find_spec('pycolmap'), "pycolmap is not installed")
+    def test_distorted_cameras_are_kept_and_undistorted(self):
+        converted = SubModel.from_reconstruction(opencv_reconstruction(self.scene, range(4)))
+        self.assertEqual(list(converted.cameras), [7])
+        model, width, height, params = converted.cameras[7]
+        self.assertEqual((model, width, height), ('OPENCV', 640, 480))
+        np.testing.assert_allclose(params[4:], [-0.2, 0.05, 0.001, -0.002])
+        np.testing.assert_array_equal(converted.image_camera_ids, [7, 7, 7, 7])
+        # The observations are undistorted into the pinhole camera of every image
+        np.testing.assert_allclose(project(converted), converted.track_xy, atol=1e-6)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "model.npz")
+            converted.save(path)
+            loaded = SubModel.read(path)
+        self.assertEqual(loaded.cameras[7][:3], ('OPENCV', 640, 480))
+        np.testing.assert_array_equal(loaded.cameras[7][3], params)
+        np.testing.assert_array_equal(loaded.image_camera_ids, converted.image_camera_ids)
+
+    @unittest.skipUnless(importlib.util.find_spec('pycolmap'), "pycolmap is not installed")
+    def test_distorted_cameras_round_trip(self):
+        reconstruction = opencv_reconstruction(self.scene, range(4))
+        restored = SubModel.from_reconstruction(reconstruction).to_reconstruction()
+        self.assertEqual(list(restored.cameras), [7])
+        camera = restored.cameras[7]
+        self.assertEqual((camera.model.name, camera.width, camera.height), ('OPENCV', 640, 480))
+        np.testing.assert_allclose(camera.params, reconstruction.cameras[7].params)
+        for image_id, image in restored.images.items():
+            self.assertEqual(image.camera_id, 7)
+            original = reconstruction.images[image_id]
+            np.testing.assert_allclose([point.xy for point in image.points2D],
+                                       [point.xy for point in original.points2D], atol=1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
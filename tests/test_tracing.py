@@ -0,0 +1,138 @@
+"""
+Unit tests for the tracing module
+"""
+
+import unittest
+import sys
+import os
+import json
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+# Add the project root directory to the path so we can import dagsfm modules
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from dagsfm.pipeline import DAGSfMPipeline
+from dagsfm.tracing import Tracer, submit_traced, traced, tracer
+from test_pipeline import FakeExtractor, FakeMatcher, FakeMerger
+from test_reconstruction import FakeReconstructor
+
+
+@traced("test.square")
+def square(value):
+    tracer.count("squares")
+    return value * value
+
+
+class TestTracer(unittest.TestCase):
+    """Test cases for the Tracer class"""
+
+    def tearDown(self):
+        tracer.stop()
+        tracer.reset()
+
+    def test_disabled_tracer_records_nothing(self):
+        local = Tracer()
+        with local.span("outer", size=3):
+            local.count("items", 5)
+        self.assertIs(local.span("a"), local.span("b"))
+        self.assertEqual(local.events, [])
+        self.assertEqual(local.counters, {})
+
+    def test_spans_and_counters(self):
+        local = Tracer()
+        local.start()
+        with local.span("outer", size=3):
+            with local.span("inner"):
+                local.count("items", 5)
+            local.count("items", 2)
+        with self.assertRaises(ValueError):
+            with local.span("inner"):
+                raise ValueError("boom")
+        local.stop()
+
+        spans = [event for event in local.events if event['ph'] == 'X']
+        self.assertEqual([event['name'] for event in spans], ["inner", "outer", "inner"])
+        self.assertEqual(spans[1]['args'], {'size': 3})
+        self.assertEqual(spans[2]['args'], {'error': 'ValueError'})
+        self.assertLessEqual(spans[1]['ts'], spans[0]['ts'])
+        self.assertGreaterEqual(spans[1]['dur'], spans[0]['dur'])
+        self.assertEqual(local.span_totals['inner'][0], 2)
+        self.assertEqual(local.counters, {'items': 7})
+        self.assertGreater(local.peak_rss_bytes, 0)
+
+    def test_exports(self):
+        local = Tracer()
+        local.start()
+        with local.span("partition.normalized_cut"):
+            local.count("matched_pairs", 10)
+        local.stop()
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            trace_path = os.path.join(temp_dir, "trace.json")
+            metrics_path = os.path.join(temp_dir, "metrics.prom")
+            local.write_chrome_trace(trace_path)
+            local.write_prometheus(metrics_path)
+            with open(trace_path) as f:
+                trace = json.load(f)
+            with open(metrics_path) as f:
+                metrics = f.read()
+
+        phases = {event['ph'] for event in trace['traceEvents']}
+        self.assertEqual(phases, {'M', 'X', 'C'})
+        self.assertIn('dagsfm_span_calls_total{span="partition.normalized_cut"} 1', metrics)
+        self.assertIn('dagsfm_matched_pairs_total 10', metrics)
+        self.assertIn('# TYPE dagsfm_peak_rss_bytes gauge', metrics)
+
+    def test_decorator_and_worker_processes(self):
+        self.assertEqual(square(3), 9)
+        self.assertEqual(tracer.events, [])
+
+        tracer.start()
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            results = [submit_traced(executor, square, value).result() for value in range(3)]
+        tracer.stop()
+        self.assertEqual(results, [0, 1, 4])
+        self.assertEqual(tracer.span_totals['test.square'][0], 3)
+        self.assertEqual(tracer.counters['squares'], 3)
+        worker_pids = {event['pid'] for event in tracer.events if event['ph'] == 'X'}
+        self.assertNotIn(os.getpid(), worker_pids)
+        self.assertGreater(tracer.worker_peak_rss_bytes, 0)
+
+
+class TestPipelineTracing(unittest.TestCase):
+    """Test cases for the trace files written by DAGSfMPipeline"""
+
+    def tearDown(self):
+        tracer.reset()
+
+    def test_run_writes_trace_and_metrics(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            config_path = os.path.join(temp_dir, "config.yaml")
+            with open(config_path, 'w') as f:
+                f.write("ncut_k: 2\nncut_engine: sparse\nreconstruction_workers: 2\n"
+                        "trace_path: trace.json\nmetrics_path: metrics.prom\ntrace_memory_interval: 0.05\n")
+            pipeline = DAGSfMPipeline(config_path)
+            pipeline.extractor = FakeExtractor()
+            pipeline.matcher = FakeMatcher()
+            pipeline.reconstructor = FakeReconstructor()
+            pipeline.merger = FakeMerger()
+            output_directory = os.path.join(temp_dir, "output")
+            pipeline.run(os.path.join(temp_dir, "images"), output_directory)
+
+            with open(os.path.join(output_directory, "trace.json")) as f:
+                names = {event['name'] for event in json.load(f)['traceEvents']}
+            with open(os.path.join(output_directory, "metrics.prom")) as f:
+                metrics = f.read()
+
+        self.assertFalse(tracer.enabled)
+        for name in ('pipeline.extract', 'pipeline.partition', 'pipeline.reconstruct/0', 'pipeline.merge',
+                     'features.build_matching_graph', 'partition.partition_scene', 'partition.expand_partitions',
+                     'reconstruction.cluster', 'rss_mb'):
+            self.assertIn(name, names)
+        self.assertIn('dagsfm_reconstructed_clusters_total 2', metrics)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+"""
+Unit tests for the view_graph module
+"""
+
+import unittest
+import sys
+import os
+import numpy as np
+
+# Add the project root directory to the path so we can import dagsfm modules
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from dagsfm.view_graph import ViewGraph
+
+
+class TestViewGraph(unittest.TestCase):
+    """Test cases for the ViewGraph class"""
+
+    def setUp(self):
+        """Set up a small graph before each test method"""
+        # Image ids are deliberately unsorted and non-contiguous
+        self.graph = ViewGraph.from_edges(
+            [30, 10, 20, 40],
+            [10, 20, 10, 30, 99],
+            [20, 30, 40, 40, 10],
+            [5, 6, 7, 8, 9],
+            names=["c.jpg", "a.jpg", "b.jpg", "d.jpg"])
+
+    def test_index_maps(self):
+        np.testing.assert_array_equal(self.graph.image_ids, [10, 20, 30, 40])
+        self.assertEqual(self.graph.names, ["a.jpg", "b.jpg", "c.jpg", "d.jpg"])
+        np.testing.assert_array_equal(self.graph.image_id_to_index([40, 10, 15]), [3, 0, -1])
+
+    def test_edges_to_unknown_images_are_dropped(self):
+        self.assertEqual(self.graph.num_nodes, 4)
+        self.assertEqual(self.graph.num_edges, 4)
+        self.assertEqual(self.graph.edge_src.dtype, np.int32)
+        self.assertEqual(self.graph.edge_weights.dtype, np.float32)
+        np.testing.assert_array_equal(self.graph.degrees(), [2, 2, 2, 2])
+
+    def test_adjacency_is_symmetric(self):
+        adjacency = self.graph.adjacency()
+        self.assertEqual(adjacency.shape, (4, 4))
+        self.assertEqual(adjacency.nnz, 8)
+        self.assertEqual(adjacency[0, 1], 5)
+        self.assertEqual(adjacency[1, 0], 5)
+
+    def test_cut_edges(self):
+        mask = self.graph.cut_edges(np.array([0, 0, 1, 1]))
+        cut = sorted(zip(self.graph.image_ids[self.graph.edge_src[mask]].tolist(),
+                         self.graph.image_ids[self.graph.edge_dst[mask]].tolist()))
+        self.assertEqual(cut, [(10, 40), (20, 30)])
+
+    def test_subgraph(self):
+        subgraph = self.graph.subgraph([0, 1, 2])
+        np.testing.assert_array_equal(subgraph.image_ids, [10, 20, 30])
+        self.assertEqual(subgraph.num_edges, 2)
+        self.assertEqual(subgraph.names, ["a.jpg", "b.jpg", "c.jpg"])
+        self.assertLess(subgraph.edge_src.max(), 3)
+
+    def test_edge_subgraph(self):
+        subgraph = self.graph.edge_subgraph(self.graph.edge_weights >= 7)
+        np.testing.assert_array_equal(subgraph.image_ids, self.graph.image_ids)
+        np.testing.assert_array_equal(subgraph.edge_weights, [7, 8])
+
+    def test_top_k_edges(self):
+        mask = self.graph.top_k_edges(1)
+        kept = sorted(zip(self.graph.image_ids[self.graph.edge_src[mask]].tolist(),
+                          self.graph.image_ids[self.graph.edge_dst[mask]].tolist()))
+        self.assertEqual(kept, [(10, 40), (20, 30), (30, 40)])
+        self.assertTrue(self.graph.top_k_edges(2).all())
+
+    def test_top_k_edges_keep_every_edge_of_a_hub(self):
+        # Every leaf has a single edge, to the hub, so the hub keeps all of them
+        graph = ViewGraph.from_edges(np.arange(6), np.zeros(5), np.arange(1, 6), [1, 2, 3, 4, 5])
+        mask = graph.top_k_edges(2)
+        self.assertTrue(mask.all())
+        self.assertEqual(graph.edge_subgraph(mask).degrees()[0], 5)
+
+    def test_largest_connected_component(self):
+        self.assertIs(self.graph.largest_connected_component(), self.graph)
+        graph = ViewGraph.from_edges([1, 2, 3, 4, 5], [1, 2, 4], [2, 3, 5], [1, 1, 1])
+        component = graph.largest_connected_component()
+        np.testing.assert_array_equal(component.image_ids, [1, 2, 3])
+        self.assertEqual(component.num_edges, 2)
+
+    def test_to_networkx(self):
+        graph = self.graph.to_networkx()
+        self.assertEqual(graph.number_of_nodes(), 4)
+        self.assertEqual(graph.number_of_edges(), 4)
+        self.assertEqual(graph[30][40]['weight'], 8)
+        self.assertEqual(graph.nodes[10]['name'], "a.jpg")
+
+
+if __name__ == '__main__':
+    unittest.main()